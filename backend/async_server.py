@@ -0,0 +1,270 @@
+# async_server.py
+"""
+asyncio (aiohttp) front end for the same API as server.py.
+Requests never block the event loop on the upstream lookup: live AQI is
+fetched with an async HTTP client (single-flight per cache key), history
+snapshots are read in a small I/O pool and the forest evaluation runs in
+a bounded inference pool, so a slow Google API only costs the requests
+that actually wait on it.
+
+The default-location /api/aqi is the shared precomputed snapshot, whose
+rebuilds (including the synchronous live lookup for the default
+location) run on the scheduler's own thread. Requests read the published
+snapshot on the event loop. Only before the first build do they wait for
+it, on a dedicated one-thread pool, so a slow upstream can never occupy
+the I/O pool that history reads and the lat/lon requests use.
+
+Payload building, the /api/aqi views (schema,
+fields) and JSON encoding and compression are shared with server.py, so
+response bodies are byte-identical.
+
+/metrics serves the same registry as server.py (metrics.py).
+
+Usage: python async_server.py   (listens on ASYNC_PORT, default 5001)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import metrics
+import payload_schema
+import server
+from live_aqi import AsyncLiveAQICache
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IO_WORKERS = int(os.getenv("ASYNC_IO_WORKERS", "8"))
+PORT = int(os.getenv("ASYNC_PORT", "5001"))
+
+# CPU-bound forecasting: a few workers, extra requests queue instead of oversubscribing cores
+inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="aqi-infer")
+# history snapshots (file stat / incremental reads) and warm-up
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="aqi-io")
+# first /api/aqi snapshot build, which includes a blocking upstream lookup: kept off io_pool
+snapshot_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aqi-snapshot")
+
+live_cache = AsyncLiveAQICache()
+
+CORS_HEADERS = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag, Last-Modified"}
+
+
+def encoded_response(body, status, coding, headers=None):
+    headers = dict(headers or CORS_HEADERS)
+    if coding:
+        headers["Content-Encoding"] = coding
+    headers["Vary"] = "Accept-Encoding"
+    return web.Response(body=body, status=status, content_type="application/json", headers=headers)
+
+
+def json_response(payload, status=200):
+    # Flask's own JSON provider, so bodies match jsonify() exactly
+    with server.app.app_context():
+        body = server.app.json.response(payload).get_data()
+    return web.Response(body=body, status=status,
+                        content_type="application/json", headers=CORS_HEADERS)
+
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_pool, fn, *args)
+
+
+async def run_inference(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(inference_pool, fn, *args)
+
+
+async def index(request):
+    return json_response({"status": "Backend is running"})
+
+
+async def healthz(request):
+    return json_response({"status": "ok"})
+
+
+async def readyz(request):
+    model_info = server.model_registry.info()
+    history_info = server.history_store.info() if server.history_store is not None else {"loaded": False}
+    ready = server.warmup_info["done"] and model_info["loaded"] and history_info["loaded"]
+    return json_response({"ready": ready, "warmup": server.warmup_info, "model": model_info, "history": history_info},
+                         200 if ready else 503)
+
+
+async def aqi_for(lat, lon):
+    await run_io(server.ensure_warm)
+    model_dict = await run_io(server.load_model)
+    if not model_dict:
+        return {"error": "Model not trained"}, 503
+    try:
+        server.nearest_station(lat, lon)
+    except LookupError as e:
+        # out of range: no upstream lookup
+        return {"error": str(e)}, 404
+    # history read and upstream lookup overlap
+    (location, history), live_data = await asyncio.gather(run_io(server.station_history, lat, lon),
+                                                          live_cache.get(lat, lon))
+    return await run_inference(server.aqi_payload, model_dict, history, live_data, location)
+
+
+async def get_aqi(request):
+    try:
+        view = server.request_view(request.query)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    coding = payload_schema.negotiate(request.headers.get("Accept-Encoding"))
+    try:
+        lat, lon = server.parse_lat_lon(request.query.get("lat"), request.query.get("lon"))
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    if lat is not None:
+        try:
+            payload, status = await aqi_for(lat, lon)
+        except Exception as e:
+            print(f"Error: {e}")
+            payload, status = {"error": str(e)}, 500
+        body, applied = server.aqi_body(payload, status, view, coding)
+        return encoded_response(body, status, applied)
+
+    # default location: the precomputed snapshot, rebuilt off the request path
+    server.aqi_snapshot.start()
+    snap = server.aqi_snapshot.peek()
+    if snap is None:
+        snap = await asyncio.get_running_loop().run_in_executor(snapshot_pool, server.aqi_snapshot.current)
+    body, applied, etag = server.snapshot_body(snap, view, coding)
+    headers = dict(CORS_HEADERS)
+    if snap.status == 200:
+        etag = f'"{etag}"'
+        headers.update({"ETag": etag, "Cache-Control": "no-cache",
+                        "Last-Modified": snap.last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT")})
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+    return encoded_response(body, snap.status, applied, headers)
+
+
+async def get_history(request):
+    coding = payload_schema.negotiate(request.headers.get("Accept-Encoding"))
+    try:
+        # index refresh (file read) and rendering of an uncached range
+        body, applied, etag = await run_io(server.history_body, request.query, coding)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except LookupError as e:
+        return json_response({"error": str(e)}, 404)
+    etag = f'"{etag}"'
+    headers = dict(CORS_HEADERS)
+    headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    if etag in request.headers.get("If-None-Match", ""):
+        return web.Response(status=304, headers=headers)
+    return encoded_response(body, 200, applied, headers)
+
+
+async def get_aqi_batch(request):
+    try:
+        view = server.request_view(request.query)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    locations = body.get("locations") if isinstance(body, dict) else None
+    if not isinstance(locations, list) or not locations:
+        return json_response({"error": "Expected a non-empty 'locations' list"}, 400)
+    if len(locations) > server.BATCH_MAX_LOCATIONS:
+        return json_response({"error": f"At most {server.BATCH_MAX_LOCATIONS} locations per request"}, 400)
+    try:
+        lats, lons = server.parse_locations(locations)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+
+    await run_io(server.ensure_warm)
+    model_dict = await run_io(server.load_model)
+    if not model_dict:
+        return json_response({"error": "Model not trained"}, 503)
+
+    # all distinct upstream lookups of served locations in flight at once (the aiohttp connector bounds concurrency)
+    stations = server.batch_stations(lats, lons)
+    keys = server.batch_live_keys(lats, lons, stations)
+    lives, histories = await asyncio.gather(
+        asyncio.gather(*(live_cache.get(*k) for k in keys)),
+        run_io(server.batch_histories, stations))
+    live_by_key = {k: server.process_google_aqi(v) for k, v in zip(keys, lives)}
+    payload, status = await run_inference(server.batch_payload, model_dict, lats, lons, stations, histories, live_by_key)
+    body, applied = server.batch_body(payload, status, view, payload_schema.negotiate(request.headers.get("Accept-Encoding")))
+    return encoded_response(body, status, applied)
+
+
+async def post_ingest(request):
+    denied = server.ingest_denied(request.headers.get("X-Ingest-Token"))
+    if denied:
+        return json_response({"error": denied}, 403)
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    readings = body.get("readings") if isinstance(body, dict) else None
+    if not isinstance(readings, list) or not readings or not all(isinstance(r, dict) for r in readings):
+        return json_response({"error": "Expected a non-empty 'readings' list of objects"}, 400)
+    if len(readings) > server.INGEST_MAX_READINGS:
+        return json_response({"error": f"At most {server.INGEST_MAX_READINGS} readings per request"}, 400)
+    payload, status = await run_io(server.ingest_readings, readings, body.get("station"))
+    return json_response(payload, status)
+
+
+async def preflight(request):
+    headers = dict(CORS_HEADERS)
+    headers.update({"Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+                    "Access-Control-Allow-Headers": request.headers.get("Access-Control-Request-Headers", "*")})
+    return web.Response(status=204, headers=headers)
+
+
+@web.middleware
+async def record_request(request, handler):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else "unmatched"
+        metrics.request_seconds.observe(time.perf_counter() - t0, endpoint)
+        metrics.requests_total.inc(endpoint, str(status))
+
+
+@metrics.register_collector
+def collect_async_cache():
+    return metrics.cache_families("live_aqi_async", dict(live_cache.stats))
+
+
+async def get_metrics(request):
+    # shared registry: stage spans from server.aqi_payload, upstream calls, request timings
+    return web.Response(text=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE, **CORS_HEADERS})
+
+
+async def _close_session(app):
+    from live_aqi import close_async_session
+    await close_async_session()
+
+
+def create_app():
+    app = web.Application(middlewares=[record_request])
+    app.router.add_get("/", index)
+    app.router.add_get("/metrics", get_metrics)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/api/aqi", get_aqi)
+    app.router.add_get("/api/history", get_history)
+    app.router.add_post("/api/aqi/batch", get_aqi_batch)
+    app.router.add_post("/api/ingest", post_ingest)
+    app.router.add_route("OPTIONS", "/{tail:.*}", preflight)
+    app.on_cleanup.append(_close_session)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=PORT)
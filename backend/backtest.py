@@ -0,0 +1,184 @@
+# backtest.py
+"""
+Rolling backtest of the served forecast over the whole history.
+The history is resampled to the artifact's cadence (as in training and
+serving) and every step with a full lag window is a forecast origin;
+windows reaching across an unfilled gap are skipped. The recursive
+multi-horizon forecast get_aqi serves (ForecastEngine, same artifact, same
+step) is generated for all origins at once: one batched predict per
+horizon over a chunk of origins, chunks spread across cores. Each
+forecast is scored against the reading actually recorded at its target
+time (targets missing from the history are skipped). A joint model's
+windows hold all its targets and are rolled forward as served; only its
+AQI forecast is scored. Rolling features start from each origin's
+RollingState, taken from one pass over the series.
+
+Reported per horizon: MAE, bias, RMSE, the CPCB category hit rate
+(forecast and actual in the same NAQI band) and the MAE of a persistence
+forecast (last value) for reference. --step-minutes overrides the step
+(the history is then scored at that step instead). Origins at or before the
+artifact's trained_until are in-sample; --since restricts the origins.
+
+Usage: python backtest.py [--data cleaned_aqi_dataset.csv] [--model aq_model_aqi_time.forest]
+                          [--steps 6] [--step-minutes N] [--since 2025-11-20] [--jobs -1] [--out report.json]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from forecast import ForecastEngine
+from resample import resample_frame
+from rolling import RollingState
+from train_model import DATA_PATH, FOREST_PATH, MODEL_PATH, load_series
+
+CHUNK = 4096
+# upper bounds of the CPCB NAQI bands
+CATEGORY_BOUNDS = [50, 100, 200, 300, 400]
+CATEGORIES = ["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"]
+
+
+def category(aqi):
+    return np.searchsorted(CATEGORY_BOUNDS, aqi, side="left")
+
+
+def load_model_dict(path):
+    if path.endswith(".forest"):
+        from compact_forest import load_compact
+        return load_compact(path)
+    import joblib
+    return joblib.load(path)
+
+
+def origin_windows(values, lags):
+    """
+    Window ending at every row with a full history, oldest -> newest:
+    (origins, lags) of (n,) AQI, (origins, targets, lags) of (n, targets) values.
+    """
+    return np.lib.stride_tricks.sliding_window_view(values, lags, axis=0)
+
+
+def _forecast_chunk(model_path, windows, base_times, steps, step, state):
+    engine = ForecastEngine(load_model_dict(model_path))
+    return engine.forecast(windows, base_times, steps=steps, step=step, state=state)[1]
+
+
+def forecast_origins(model_path, windows, base_times, steps, step, n_jobs=-1, states=None):
+    """Recursive forecasts for every origin, shape (origins, steps). states: RollingState of every origin."""
+    chunks = [slice(i, i + CHUNK) for i in range(0, len(windows), CHUNK)]
+    parts = Parallel(n_jobs=n_jobs)(
+        delayed(_forecast_chunk)(model_path, windows[c], base_times[c], steps, step,
+                                 states.take(np.arange(len(windows))[c]) if states is not None else None)
+        for c in chunks)
+    return np.concatenate(parts) if parts else np.empty((0, steps))
+
+
+def actuals(times, aqi, base_times, steps, step):
+    """Recorded AQI at every origin's target times, NaN where the history has no reading."""
+    ns = times.as_unit("ns").asi8
+    target = base_times.as_unit("ns").asi8[:, None] + step.value * np.arange(1, steps + 1)
+    idx = np.minimum(np.searchsorted(ns, target), len(ns) - 1)
+    return np.where(ns[idx] == target, aqi[idx], np.nan)
+
+
+def score(preds, actual, last):
+    """Per-horizon metrics over the origins with an actual value."""
+    rows = []
+    for h in range(preds.shape[1]):
+        ok = ~np.isnan(actual[:, h])
+        p, a = preds[ok, h], actual[ok, h]
+        err = p - a
+        rows.append({
+            "horizon": h + 1,
+            "n": int(ok.sum()),
+            "mae": float(np.abs(err).mean()) if ok.any() else None,
+            "bias": float(err.mean()) if ok.any() else None,
+            "rmse": float(np.sqrt((err ** 2).mean())) if ok.any() else None,
+            "category_hit_rate": float((category(p) == category(a)).mean()) if ok.any() else None,
+            "persistence_mae": float(np.abs(last[ok] - a).mean()) if ok.any() else None,
+        })
+    return rows
+
+
+def backtest(data_path=DATA_PATH, model_path=None, steps=6, step=None, since=None, n_jobs=-1):
+    """Returns (report dict, per-origin preds, per-origin actuals). step: default the model's."""
+    model_path = model_path or (FOREST_PATH if os.path.exists(FOREST_PATH) else MODEL_PATH)
+    model_dict = load_model_dict(model_path)
+    engine = ForecastEngine(model_dict)
+    lags, step = engine.lags, step or engine.step
+    if model_dict.get("mode") == "direct":
+        steps = min(steps, model_dict["horizons"])
+
+    # complete buckets only: a partial last bucket is not a recorded value yet
+    raw = load_series(data_path, engine.targets)
+    missing = [t for t in engine.targets if t not in raw.columns]
+    if missing:
+        raise ValueError(f"History has no {', '.join(missing)} column(s); the model forecasts {', '.join(engine.targets)}")
+    df = resample_frame(raw, step, complete_only=True, columns=engine.targets)
+    aqi = df["AQI"].to_numpy(dtype=np.float64)
+    times = pd.DatetimeIndex(df["datetime"])
+    windows = origin_windows(df[engine.targets].to_numpy(dtype=np.float64) if engine.joint else aqi, lags)
+    base_times = times[lags - 1:]
+    rows = np.arange(lags - 1, len(df))
+    full = ~np.isnan(windows.reshape(len(windows), -1)).any(axis=1)
+    windows, base_times, rows = windows[full], base_times[full], rows[full]
+    if since is not None:
+        since = pd.Timestamp(since)
+        if since.tz is None and base_times.tz is not None:
+            since = since.tz_localize(base_times.tz)
+        keep = base_times >= since
+        windows, base_times, rows = windows[keep], base_times[keep], rows[keep]
+
+    t0 = time.perf_counter()
+    states = RollingState.at_rows(aqi, rows) if engine.rolling else None
+    preds = forecast_origins(model_path, windows, base_times, steps, step, n_jobs, states)
+    seconds = time.perf_counter() - t0
+    actual = actuals(times, aqi, base_times, steps, step)
+
+    trained_until = model_dict.get("trained_until")
+    in_sample = int((base_times <= pd.Timestamp(trained_until)).sum()) if trained_until else None
+    report = {
+        "data": os.path.basename(data_path), "model": os.path.basename(model_path),
+        "model_version": model_dict.get("version"), "origins": len(windows),
+        "in_sample_origins": in_sample, "steps": steps, "step_minutes": step / pd.Timedelta(minutes=1),
+        "forecast_seconds": seconds, "horizons": score(preds, actual, engine.aqi_window(windows)[:, -1]),
+    }
+    return report, preds, actual
+
+
+def print_report(report):
+    print(f"{report['origins']} origins from {report['data']}, model {report['model']} "
+          f"(v{report['model_version']}), step {report['step_minutes']:g} min, "
+          f"forecast in {report['forecast_seconds']:.2f}s")
+    if report["in_sample_origins"]:
+        print(f"Note: {report['in_sample_origins']} origins are inside the model's training range")
+    print(f"{'horizon':>8} {'n':>7} {'MAE':>8} {'bias':>8} {'RMSE':>8} {'cat hit':>8} {'persist MAE':>12}")
+    fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+    for r in report["horizons"]:
+        print(f"{r['horizon']:>8} {r['n']:>7} {fmt(r['mae'], '>8.2f')} {fmt(r['bias'], '>8.2f')} "
+              f"{fmt(r['rmse'], '>8.2f')} {fmt(r['category_hit_rate'], '>8.1%')} {fmt(r['persistence_mae'], '>12.2f')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling backtest of the served recursive forecast.")
+    parser.add_argument("--data", default=DATA_PATH, help="cleaned history CSV")
+    parser.add_argument("--model", default=None, help="artifact (.forest or .joblib); default: the served one")
+    parser.add_argument("--steps", type=int, default=6, help="forecast horizons")
+    parser.add_argument("--step-minutes", type=float, default=None,
+                        help="minutes between forecast steps (default: the model's cadence, as served)")
+    parser.add_argument("--since", default=None, help="only origins at or after this time")
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel workers (-1 = all cores)")
+    parser.add_argument("--out", default=None, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    step = pd.Timedelta(minutes=args.step_minutes) if args.step_minutes else None
+    report, _, _ = backtest(args.data, args.model, args.steps, step, args.since, args.jobs)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
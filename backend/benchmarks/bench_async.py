@@ -0,0 +1,126 @@
+# bench_async.py
+"""
+Concurrent /api/aqi?lat=&lon= load against the sync (Flask) and async
+(aiohttp) servers with a slow upstream. The Google endpoint is a local
+stub that answers after UPSTREAM_DELAY seconds; every request uses its
+own coordinates, so each one misses the live cache. The sync server gets
+SYNC_WORKERS request threads, like a sync gunicorn deployment.
+
+Usage: python benchmarks/bench_async.py [concurrency ...]
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+UPSTREAM_DELAY = 2.0
+SYNC_WORKERS = 8
+CONCURRENCY = [10, 50, 200]
+UPSTREAM_PORT, SYNC_PORT, ASYNC_PORT = 5901, 5902, 5903
+
+os.environ.update({"GOOGLE_AQI_URL": f"http://127.0.0.1:{UPSTREAM_PORT}/aqi", "GOOGLE_AQI_API_KEY": "bench",
+                   "GOOGLE_AQI_POOL_SIZE": "256", "GOOGLE_AQI_READ_TIMEOUT": "30", "STARTUP_MODE": "eager"})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+from werkzeug.serving import BaseWSGIServer
+
+import async_server
+import server
+
+STUB_RESPONSE = {
+    "indexes": [{"code": "uaqi", "aqi": 120, "category": "Moderate"}],
+    "pollutants": [{"code": "pm25", "concentration": {"value": 80.0}}],
+}
+
+
+async def stub_upstream(request):
+    await asyncio.sleep(UPSTREAM_DELAY)
+    return web.json_response(STUB_RESPONSE)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug server handling requests on a fixed number of threads."""
+
+    def __init__(self, *args, workers=SYNC_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_async_apps(ready):
+    """Stub upstream and the async API server on one background event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def start():
+        upstream = web.Application()
+        upstream.router.add_post("/aqi", stub_upstream)
+        for app, port in [(upstream, UPSTREAM_PORT), (async_server.create_app(), ASYNC_PORT)]:
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port, backlog=1024).start()
+
+    loop.run_until_complete(start())
+    ready.set()
+    loop.run_forever()
+
+
+async def load(port, n, offset):
+    rng = np.random.default_rng(offset)
+    # distinct cache keys around the default station, inside stations.MAX_DISTANCE_KM
+    coords = zip(server.DEFAULT_LAT + rng.uniform(-0.5, 0.5, n), server.DEFAULT_LON + rng.uniform(-0.5, 0.5, n))
+    latencies, statuses = [], []
+
+    async with ClientSession(connector=TCPConnector(limit=0), timeout=ClientTimeout(total=600)) as session:
+        async def one(lat, lon):
+            t0 = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{port}/api/aqi",
+                                   params={"lat": f"{lat:.5f}", "lon": f"{lon:.5f}"}) as resp:
+                await resp.read()
+                statuses.append(resp.status)
+            latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(la, lo) for la, lo in coords))
+        total = time.perf_counter() - t0
+    assert all(s == 200 for s in statuses), statuses
+    return total, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    concurrency = [int(a) for a in sys.argv[1:]] or CONCURRENCY
+    server.ensure_warm()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    ready = threading.Event()
+    threading.Thread(target=serve_async_apps, args=(ready,), daemon=True).start()
+    sync_server = PooledWSGIServer("127.0.0.1", SYNC_PORT, server.app)
+    threading.Thread(target=sync_server.serve_forever, daemon=True).start()
+    ready.wait()
+
+    print(f"upstream delay {UPSTREAM_DELAY}s, sync workers {SYNC_WORKERS}, "
+          f"async inference workers {async_server.INFERENCE_WORKERS}")
+    print(f"{'server':>7} {'requests':>9} {'total (s)':>10} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8}")
+    for i, n in enumerate(concurrency):
+        for name, port in [("sync", SYNC_PORT), ("async", ASYNC_PORT)]:
+            total, p50, p95 = asyncio.run(load(port, n, offset=2 * i + (name == "async")))
+            print(f"{name:>7} {n:>9} {total:>10.2f} {n / total:>8.1f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
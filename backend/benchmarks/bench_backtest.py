@@ -0,0 +1,36 @@
+# bench_backtest.py
+"""
+Wall time of backtest.backtest on a year of synthetic 15-minute history
+(35,040 readings, every target the served artifact forecasts) with the
+served artifact, using one worker and all cores.
+
+Usage: python benchmarks/bench_backtest.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import backtest
+from bench_multioutput import synthetic_readings
+
+YEAR_ROWS = 365 * 96
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else YEAR_ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.csv")
+        synthetic_readings(rows).rename(columns={"datetime": "datetimeLocal"}).to_csv(path, index=False)
+        print(f"{'jobs':>5} {'origins':>8} {'seconds':>8} {'origins/s':>10}")
+        for jobs in sorted({1, os.cpu_count() or 1}):
+            t0 = time.perf_counter()
+            report, _, _ = backtest(path, n_jobs=jobs)
+            dt = time.perf_counter() - t0
+            print(f"{jobs:>5} {report['origins']:>8} {dt:>8.2f} {report['origins'] / dt:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_batch.py
+"""
+Throughput of POST /api/aqi/batch for 1, 100 and 1000 locations.
+The Google upstream is replaced by a stub that sleeps UPSTREAM_DELAY
+seconds per call; 50 synthetic stations share the bundled history CSV.
+
+Usage: python benchmarks/bench_batch.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+from live_aqi import LiveAQICache
+from stations import StationRegistry
+
+UPSTREAM_DELAY = 0.02
+SIZES = [1, 100, 1000]
+N_STATIONS = 50
+
+STUB_RESPONSE = {
+    "indexes": [{"code": "uaqi", "aqi": 120, "category": "Moderate"}],
+    "pollutants": [{"code": "pm25", "concentration": {"value": 80.0}}],
+}
+
+
+def stub_fetch(lat, lon):
+    time.sleep(UPSTREAM_DELAY)
+    return STUB_RESPONSE
+
+
+def main():
+    server.ensure_warm()
+    rng = np.random.default_rng(0)
+    station_lat = rng.uniform(8, 32, N_STATIONS)
+    station_lon = rng.uniform(70, 88, N_STATIONS)
+    server.station_registry = StationRegistry([
+        {"id": f"st{i}", "lat": la, "lon": lo, "history": server.DATA_PATH}
+        for i, (la, lo) in enumerate(zip(station_lat, station_lon))
+    ])
+    client = server.app.test_client()
+
+    print(f"{'locations':>10} {'cold (s)':>10} {'warm (s)':>10} {'locations/s (warm)':>20}")
+    for n in SIZES:
+        # within ~40 km of a station, so every location is served (stations.MAX_DISTANCE_KM)
+        near = rng.integers(0, N_STATIONS, n)
+        locations = [{"lat": float(la), "lon": float(lo)}
+                     for la, lo in zip(station_lat[near] + rng.uniform(-0.25, 0.25, n),
+                                       station_lon[near] + rng.uniform(-0.25, 0.25, n))]
+        server.live_aqi_cache = LiveAQICache(fetch=stub_fetch)
+
+        t0 = time.perf_counter()
+        resp = client.post("/api/aqi/batch", json={"locations": locations})
+        cold = time.perf_counter() - t0
+        results = resp.get_json()["results"]
+        assert resp.status_code == 200 and len(results) == n and not any("error" in r for r in results)
+
+        t0 = time.perf_counter()
+        client.post("/api/aqi/batch", json={"locations": locations})
+        warm = time.perf_counter() - t0
+        print(f"{n:>10} {cold:>10.3f} {warm:>10.3f} {n / warm:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
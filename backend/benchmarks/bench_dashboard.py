@@ -0,0 +1,100 @@
+# bench_dashboard.py
+"""
+Per-rerun cost of the Streamlit dashboard's expensive steps, before and
+after caching (streamlit itself is not needed):
+
+  model       joblib.load of the artifact (every rerun before) vs the
+              compact .forest load st.cache_resource now does once
+  history     tail read of the history CSV (now cached by mtime + TTL)
+  charts      the five matplotlib figures rendered to PNG as st.pyplot
+              did vs building and serializing the Vega-Lite specs
+              (dashboard_charts.py) that replace them; with st.cache_data
+              an unchanged forecast reuses its specs (the matplotlib row
+              is skipped when matplotlib is not installed)
+
+Usage: python benchmarks/bench_dashboard.py
+"""
+import importlib.util
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dashboard_charts as charts
+from suite import format_seconds, measure
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BACKEND_DIR, "cleaned_aqi_dataset.csv")
+
+times = pd.date_range("2025-11-20 10:00", periods=3, freq="h")
+preds = [182.4, 201.7, 215.2]
+recent_times = pd.date_range("2025-11-20 04:00", periods=24, freq="15min")
+pm25 = np.random.default_rng(0).uniform(100, 300, 24)
+pm10 = np.random.default_rng(1).uniform(150, 400, 24)
+subs = {"pm25": 320.0, "pm10": 260.0, "no2": 40.0, "so2": 70.0, "co": 90.0}
+
+
+def matplotlib_charts():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    figs = []
+    fig, ax = plt.subplots(figsize=(8, 0.5))
+    for lo, hi, col in charts.AQI_BANDS:
+        ax.barh(0, hi - lo, left=lo, height=0.5, color=col, edgecolor="none")
+    ax.plot([150], [0], marker="o"); ax.plot([max(preds)], [0], marker="v")
+    figs.append(fig)
+    fig, ax = plt.subplots(figsize=(10, 3))
+    ax.plot(times, preds, marker="o", linestyle="--")
+    figs.append(fig)
+    fig, ax = plt.subplots(figsize=(6, 3))
+    ax.bar(["10am", "11am", "12pm"], preds)
+    figs.append(fig)
+    for series in (pm25, pm10):
+        fig, ax = plt.subplots(figsize=(3.5, 1.8))
+        ax.plot(recent_times, series, marker="o", linewidth=1)
+        figs.append(fig)
+    fig, ax = plt.subplots(figsize=(3.5, 1.8))
+    ax.bar(list(subs), list(subs.values()))
+    figs.append(fig)
+    for fig in figs:
+        # what st.pyplot does with a figure
+        fig.savefig(io.BytesIO(), format="png", bbox_inches="tight")
+        plt.close(fig)
+
+
+def vega_charts():
+    t = tuple(charts.wall_time(x) for x in times)
+    rt = tuple(charts.wall_time(x) for x in recent_times)
+    specs = [charts.gauge_spec(150, max(preds)), charts.forecast_spec(t, tuple(preds), "Next 3-hour AQI predictions"),
+             charts.bar_spec(("10am", "11am", "12pm"), tuple(preds), "Predicted AQI", "AQI"),
+             charts.series_spec(rt, tuple(pm25), "µg/m³", "#3b82f6"), charts.series_spec(rt, tuple(pm10), "µg/m³", "#f59e0b"),
+             charts.bar_spec(tuple(subs), tuple(subs.values()), None, None, charts.CONTRIBUTOR_COLORS)]
+    return [json.dumps(s) for s in specs]
+
+
+def main():
+    import joblib
+    from columnar_history import load_history_frame
+    from compact_forest import load_compact
+    rows = [
+        ("model: joblib.load", lambda: joblib.load(os.path.join(BACKEND_DIR, "aq_model_aqi_time.joblib"))),
+        ("model: compact load", lambda: load_compact(os.path.join(BACKEND_DIR, "aq_model_aqi_time.forest"))),
+        ("history: tail read", lambda: load_history_frame(DATA_PATH, tail=96)),
+        ("charts: matplotlib PNG", matplotlib_charts),
+        ("charts: Vega-Lite specs", vega_charts),
+    ]
+    if importlib.util.find_spec("matplotlib") is None:
+        rows = [r for r in rows if "matplotlib" not in r[0]]
+    for name, fn in rows:
+        print(f"{name:<26} {format_seconds(measure(fn)):>12}", flush=True)
+    print(f"{'Vega-Lite bytes':<26} {sum(len(s) for s in vega_charts()):>12}")
+
+
+if __name__ == "__main__":
+    main()
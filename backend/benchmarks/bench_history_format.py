@@ -0,0 +1,61 @@
+# bench_history_format.py
+"""
+Load time of the cleaned history as CSV vs the partitioned Parquet copy.
+A synthetic dataset (default 1M rows of 15-minute readings, ~28 years)
+is built by tiling the bundled CSV.
+
+Usage: python benchmarks/bench_history_format.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar_history import ColumnarHistoryStore, convert_csv, read_history
+from history_store import HistoryStore, TIME_COL
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(label, fn, repeat=3):
+    best = min(_once(fn) for _ in range(repeat))
+    print(f"{label:<45} {best:>8.3f} s")
+    return best
+
+
+def _once(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main(rows=1_000_000):
+    base = pd.read_csv(os.path.join(BASE_DIR, "cleaned_aqi_dataset.csv"))
+    df = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).iloc[:rows]
+    df[TIME_COL] = pd.date_range("1998-01-01", periods=rows, freq="15min", tz="Asia/Kolkata").strftime("%Y-%m-%d %H:%M:%S+05:30")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "history.csv")
+        df.to_csv(csv_path, index=False)
+        t0 = time.perf_counter()
+        pq_path = convert_csv(csv_path)
+        print(f"{rows} rows, CSV {os.path.getsize(csv_path) / 2**20:.0f} MiB, converted in {time.perf_counter() - t0:.1f} s")
+
+        last = pd.Timestamp(df[TIME_COL].iloc[-1])
+        week = last - pd.Timedelta(days=7)
+        timed("CSV read_csv(parse_dates) all columns", lambda: pd.read_csv(csv_path, parse_dates=[TIME_COL]))
+        timed("CSV read_csv(parse_dates) datetime+AQI", lambda: pd.read_csv(csv_path, usecols=[TIME_COL, "AQI"], parse_dates=[TIME_COL]))
+        timed("Parquet all columns", lambda: read_history(pq_path))
+        timed("Parquet datetime+AQI (training lags)", lambda: read_history(pq_path, columns=["AQI"]))
+        timed("Parquet datetime+AQI, last 7 days", lambda: read_history(pq_path, columns=["AQI"], start=week))
+        timed("Parquet newest 96 rows (dashboard)", lambda: read_history(pq_path, tail=96))
+        timed("HistoryStore (CSV tail) cold load", lambda: HistoryStore(csv_path).refresh())
+        timed("ColumnarHistoryStore cold load", lambda: ColumnarHistoryStore(pq_path).refresh())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,78 @@
+# bench_history_query.py
+"""
+/api/history over a multi-year history (default 5 years of 15-minute
+readings, synthetic). Compares what a chart of a range costs without the
+endpoint (read the CSV, filter, ship every row as JSON) with the indexed
+query: binary-search slice, downsampling to max_points and serialization
+(uncached), and a repeat request served from the range cache.
+
+Usage: python benchmarks/bench_history_query.py [rows] [max_points]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_query
+import payload_schema
+from bench_retrain import synthetic_history
+from history_store import HistoryIndex, TIME_COL
+from suite import format_seconds, measure
+
+RANGES = (("1 day", pd.Timedelta(days=1)), ("30 days", pd.Timedelta(days=30)),
+          ("1 year", pd.Timedelta(days=365)), ("all", None))
+
+
+def csv_range(path, start, end):
+    """Every row in [start, end] as JSON, read straight from the CSV."""
+    df = pd.read_csv(path, parse_dates=[TIME_COL])
+    df = df[(df[TIME_COL] >= start) & (df[TIME_COL] <= end)]
+    return df.to_json(orient="records").encode()
+
+
+def main(rows=5 * 365 * 96, max_points=1000):
+    history = synthetic_history(rows)
+    history["pm25"] = (history["AQI"] * 0.6).round(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.csv")
+        history.to_csv(path, index=False)
+
+        t0 = time.perf_counter()
+        index = HistoryIndex(path)
+        snapshot = index.snapshot()
+        print(f"{rows} rows; index load {format_seconds(time.perf_counter() - t0)}")
+        with open(path, "a") as f:
+            last = history[TIME_COL].iloc[-1]
+            f.write(f"{(last + pd.Timedelta(minutes=15)).isoformat(sep=' ')},200.0,120.0\n")
+        t0 = time.perf_counter()
+        index.refresh()
+        print(f"append refresh (1 row) {format_seconds(time.perf_counter() - t0)}\n")
+        snapshot = index.snapshot()
+
+        end = pd.Timestamp(int(snapshot.times[-1]), tz="UTC").tz_convert(snapshot.tz)
+        print(f"{'range':<9} {'rows':>7} {'csv + all rows':>15} {'bytes':>9} "
+              f"{'lttb':>10} {'minmax':>10} {'bytes':>7} {'cached':>10}")
+        for name, span in RANGES:
+            start = end - span if span is not None else pd.Timestamp(int(snapshot.times[0]), tz="UTC")
+            query = (start.value, end.value, ("AQI", "pm25"), max_points)
+            full = csv_range(path, start, end)
+            t_csv = measure(lambda: csv_range(path, start, end), once=True)
+            t_lttb = measure(lambda: payload_schema.dumps(history_query.render(snapshot, *query, "lttb")))
+            t_minmax = measure(lambda: payload_schema.dumps(history_query.render(snapshot, *query, "minmax")))
+            body = payload_schema.dumps(history_query.render(snapshot, *query, "lttb"))
+            cache = history_query.RangeCache()
+            build = lambda: payload_schema.dumps(history_query.render(snapshot, *query, "lttb"))
+            cache.get(cache.key(0, snapshot, *query, "lttb"), build)
+            t_cached = measure(lambda: cache.get(cache.key(0, snapshot, *query, "lttb"), build))
+            lo, hi = history_query.range_slice(snapshot.times, start.value, end.value)
+            print(f"{name:<9} {hi - lo:>7} {format_seconds(t_csv):>15} {len(full):>9} {format_seconds(t_lttb):>10} "
+                  f"{format_seconds(t_minmax):>10} {len(body):>7} {format_seconds(t_cached):>10}", flush=True)
+
+
+if __name__ == "__main__":
+    main(*[int(float(a)) for a in sys.argv[1:3]])
@@ -0,0 +1,70 @@
+# bench_ingest.py
+"""
+Ingestion throughput in readings per second.
+Synthetic 15-minute readings continuing the bundled history are pushed
+through Ingestor.ingest (validation, sub-indices, CSV append, HistoryStore
+refresh) in batches of 1, 100 and 10000, against a temporary copy of the
+CSV. The vectorized sub-index/AQI step is also timed on its own.
+
+Usage: python benchmarks/bench_ingest.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore
+from ingest import CADENCE, DATA_PATH, RAW_COLUMNS, Ingestor, add_indices
+
+BATCHES = [(1, 2_000), (100, 50_000), (10_000, 500_000)]   # (batch size, readings)
+INDEX_ROWS = 1_000_000
+
+
+def synthetic(start, n, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({c: rng.uniform(0, 400, n).round(1) for c in RAW_COLUMNS})
+    frame["co"] = rng.uniform(0, 12, n).round(2)
+    frame["relativehumidity"] = rng.uniform(20, 100, n).round(0)
+    frame["temperature"] = rng.uniform(5, 45, n).round(1)
+    frame["wind_direction"] = rng.uniform(0, 360, n).round(0)
+    frame["wind_speed"] = rng.uniform(0, 10, n).round(1)
+    frame.insert(0, "datetimeLocal", start + CADENCE * np.arange(1, n + 1))
+    return frame
+
+
+def main():
+    frame = synthetic(pd.Timestamp("2025-11-20 05:30:00+05:30"), INDEX_ROWS)
+    t0 = time.perf_counter()
+    add_indices(frame)
+    dt = time.perf_counter() - t0
+    print(f"sub-indices + AQI: {INDEX_ROWS} readings in {dt:.3f}s ({INDEX_ROWS / dt:,.0f} readings/s)")
+
+    print(f"{'batch':>7} {'readings':>9} {'seconds':>8} {'readings/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch, n in BATCHES:
+            path = os.path.join(tmp, "history.csv")
+            shutil.copy(DATA_PATH, path)
+            store = HistoryStore(path)
+            store.refresh()
+            base_rows = store.snapshot().total_rows
+            ingestor = Ingestor(path, [store])
+            readings = synthetic(ingestor._last_time, n, seed=batch)
+            readings["datetimeLocal"] = readings["datetimeLocal"].map(pd.Timestamp.isoformat)
+            chunks = [readings.iloc[i:i + batch] for i in range(0, n, batch)]
+
+            t0 = time.perf_counter()
+            for chunk in chunks:
+                ingestor.ingest(chunk)
+            dt = time.perf_counter() - t0
+            assert ingestor.stats["accepted"] == n and store.snapshot().total_rows == base_rows + n
+            print(f"{batch:>7} {n:>9} {dt:>8.2f} {n / dt:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
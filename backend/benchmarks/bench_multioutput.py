@@ -0,0 +1,147 @@
+# bench_multioutput.py
+"""
+One joint multi-output forest over every target (what train_model.py now
+trains) vs one forest per target on the same inputs, on a synthetic
+15-minute history of correlated pollutant and weather readings resampled
+to the model cadence:
+
+  train     wall time of the joint fit vs the sum of the per-target fits
+  serve     6-step recursive forecast of 1 and 1000 series with the
+            CompactForest(s) the server loads: one predict per step vs
+            one per target per step
+  size      bytes of the .forest file(s)
+  accuracy  one-step test MAE per target (newest 20% of origins), with a
+            persistence forecast (last value) for reference
+
+Usage: python benchmarks/bench_multioutput.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import train_model
+from compact_forest import CompactForest, compile_forest, save_compact
+from features import LAGS, lag_columns
+from forecast import ForecastEngine
+from suite import format_seconds, measure
+
+ROWS = 8_000
+SERIES = (1, 1000)
+
+# CPCB sub-index breakpoints (concentration -> index)
+PM25_BREAKS = ([0, 30, 60, 90, 120, 250, 500], [0, 50, 100, 200, 300, 400, 500])
+PM10_BREAKS = ([0, 50, 100, 250, 350, 430, 600], [0, 50, 100, 200, 300, 400, 500])
+
+
+def ar1(rng, n, level, phi, sigma):
+    out = np.empty(n)
+    out[0] = level[0]
+    noise = rng.normal(0, sigma, n)
+    for i in range(1, n):
+        out[i] = phi * out[i - 1] + (1 - phi) * level[i] + noise[i]
+    return out
+
+
+def synthetic_readings(n, seed=0):
+    """Readings of every train_model.TARGETS column: weather and traffic cycles drive the pollutants, AQI from PM."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2024-01-01", periods=n, freq="15min", tz="Asia/Kolkata")
+    day = 2 * np.pi * times.hour.to_numpy() / 24
+    temperature = ar1(rng, n, 18 + 6 * np.sin(day - 2), 0.95, 0.3)
+    humidity = np.clip(ar1(rng, n, 95 - 2.5 * temperature, 0.9, 1.5), 10, 100)
+    wind = np.abs(ar1(rng, n, np.full(n, 1.5), 0.9, 0.3))
+    # low wind and evening traffic accumulate particles and NO2; ozone follows the sun
+    traffic = 1 + 0.4 * np.cos(day - 5.5)
+    no2 = np.maximum(ar1(rng, n, 60 * traffic / (0.5 + wind / 3), 0.9, 4), 1)
+    pm25 = np.maximum(ar1(rng, n, 120 * traffic / (0.5 + wind / 3) + 0.5 * humidity, 0.93, 8), 1)
+    pm10 = np.maximum(1.5 * pm25 + ar1(rng, n, np.full(n, 40), 0.8, 10), 1)
+    so2 = np.maximum(ar1(rng, n, np.full(n, 20), 0.95, 2), 0.5)
+    o3 = np.maximum(ar1(rng, n, 20 + 3 * np.maximum(temperature - 12, 0) - 0.2 * no2, 0.9, 4), 1)
+    co = np.maximum(0.02 * no2 + ar1(rng, n, np.full(n, 0.3), 0.9, 0.05), 0.05)
+    aqi = np.maximum(np.interp(pm25, *PM25_BREAKS), np.interp(pm10, *PM10_BREAKS))
+    values = {"AQI": aqi, "pm25": pm25, "pm10": pm10, "no2": no2, "so2": so2, "o3": o3, "co": co,
+              "temperature": temperature, "relativehumidity": humidity, "wind_speed": wind}
+    return pd.DataFrame({"datetime": times, **{t: np.round(values[t], 2) for t in train_model.TARGETS}})
+
+
+class PerTargetForests:
+    """Separate single-output forests behind one predict(), as serving them would be."""
+
+    def __init__(self, forests):
+        self.forests = forests
+
+    def predict(self, X):
+        return np.column_stack([f.predict(X) for f in self.forests])
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    targets = train_model.TARGETS
+    series = train_model.resample_series(synthetic_readings(rows))
+    frame = train_model.build_features(series)
+    features = train_model.feature_names(LAGS, targets)
+    X = frame[features].to_numpy(dtype=np.float64)
+    Y = frame[[f"next_{t}" for t in targets]].to_numpy(dtype=np.float64)
+    split = int(len(X) * 0.8)
+    scale = train_model.target_scale(Y[:split])
+    print(f"{rows} readings -> {len(series)} steps, {split} training origins, {len(targets)} targets, "
+          f"{train_model.N_TREES} trees per forest")
+
+    joint, joint_s = timed(lambda: train_model.train_forest(X[:split], Y[:split] / scale))
+    separate, separate_s = timed(lambda: [train_model.train_forest(X[:split], Y[:split, j])
+                                          for j in range(len(targets))])
+    joint_forest = CompactForest(compile_forest(joint))
+    separate_forests = [CompactForest(compile_forest(m)) for m in separate]
+    meta = {"features": features, "lags": LAGS, "mode": "recursive", "targets": targets,
+            "cadence_minutes": train_model.cadence_minutes(train_model.CADENCE)}
+    engines = {
+        "joint": ForecastEngine({**meta, "model": joint_forest, "target_scale": scale.tolist()}),
+        "per target": ForecastEngine({**meta, "model": PerTargetForests(separate_forests)}),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_compact({**meta, "model": joint}, os.path.join(tmp, "joint.forest"))
+        joint_bytes = os.path.getsize(os.path.join(tmp, "joint.forest"))
+        separate_bytes = 0
+        for j, m in enumerate(separate):
+            save_compact({**meta, "model": m, "targets": [targets[j]]}, os.path.join(tmp, f"{j}.forest"))
+            separate_bytes += os.path.getsize(os.path.join(tmp, f"{j}.forest"))
+
+    print(f"\n{'':<24} {'joint':>12} {'per target':>12}")
+    print(f"{'train':<24} {joint_s:>11.2f}s {separate_s:>11.2f}s")
+    values = series[targets].to_numpy(dtype=np.float64)
+    windows = np.lib.stride_tricks.sliding_window_view(values, LAGS, axis=0)
+    windows = windows[~np.isnan(windows.reshape(len(windows), -1)).any(axis=1)]
+    base = pd.Timestamp(series["datetime"].iloc[-1])
+    rng = np.random.default_rng(0)
+    for n in SERIES:
+        batch = windows[rng.integers(0, len(windows), n)]
+        times = base + pd.to_timedelta(np.arange(n), unit="h")
+        cost = [measure(lambda e=e: e.forecast(batch, times, steps=6)) for e in engines.values()]
+        print(f"{f'serve {n} x 6 steps':<24} {format_seconds(cost[0]):>12} {format_seconds(cost[1]):>12}")
+    print(f"{'.forest bytes':<24} {joint_bytes:>12,} {separate_bytes:>12,}")
+
+    joint_pred = joint_forest.predict(X[split:]) * scale
+    separate_pred = PerTargetForests(separate_forests).predict(X[split:])
+    print(f"\n{'one-step test MAE':<24} {'joint':>12} {'per target':>12} {'persistence':>12}")
+    for j, t in enumerate(targets):
+        actual = Y[split:, j]
+        last = frame[lag_columns(1, t)[0]].to_numpy()[split:]
+        print(f"{t:<24} {np.abs(joint_pred[:, j] - actual).mean():>12.3f} "
+              f"{np.abs(separate_pred[:, j] - actual).mean():>12.3f} {np.abs(last - actual).mean():>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_payload.py
+"""
+Bytes on the wire and serialization time of the /api/aqi payload for the
+previous encoding (Flask's JSON provider, as jsonify wrote it) and the
+payload_schema views (schema 1, schema 2, schema 2 with the React app's
+field list), identity / gzip / br (br only when brotli is installed).
+Views of the default-location snapshot are built once per snapshot; the
+times are what a ?lat=&lon= request pays.
+
+Usage: python benchmarks/bench_payload.py
+"""
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+
+os.environ.setdefault("STARTUP_MODE", "lazy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payload_schema
+import server
+from live_aqi import LiveAQICache
+
+from suite import STUB_RESPONSE, format_seconds, measure
+
+HOOK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         "src", "hooks", "useAirQuality.js")
+
+
+def app_fields():
+    """The field list the React hook requests."""
+    with open(HOOK_PATH) as f:
+        block = re.search(r"const FIELDS = \[(.*?)\]", f.read(), re.S).group(1)
+    return ",".join(re.findall(r"'([^']+)'", block))
+
+
+def flask_dumps(payload):
+    with server.app.app_context():
+        return server.app.json.response(payload).get_data()
+
+
+def main():
+    server.live_aqi_cache = LiveAQICache(fetch=lambda lat, lon: STUB_RESPONSE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        payload, status = server.build_aqi_response()
+    assert status == 200, payload
+
+    views = {
+        "v1": payload_schema.parse_view(),
+        "v2": payload_schema.parse_view("2"),
+        "v2 app fields": payload_schema.parse_view("2", app_fields()),
+    }
+    codings = [None] + list(payload_schema.ENCODINGS)
+
+    print(f"{'payload':<24} " + " ".join(f"{c or 'identity':>9}" for c in codings))
+    body = flask_dumps(payload)
+    print(f"{'previous (jsonify)':<24} {len(body):>9}")
+    for name, view in views.items():
+        body = payload_schema.dumps(payload_schema.apply_view(payload, *view))
+        sizes = [len(payload_schema.encode(body, c)[0]) if c else len(body) for c in codings]
+        print(f"{name:<24} " + " ".join(f"{s:>9}" for s in sizes))
+
+    print(f"\n{'serialization':<24} {'time':>12}")
+    timings = {
+        "previous (jsonify)": lambda: flask_dumps(payload),
+        "v1 json": lambda: payload_schema.dumps_json(payload),
+    }
+    if payload_schema.has_orjson():
+        timings["v1 orjson"] = lambda: payload_schema.dumps_orjson(payload)
+    for name, view in views.items():
+        if name != "v1":
+            timings[f"{name} (served)"] = lambda view=view: payload_schema.dumps(payload_schema.apply_view(payload, *view))
+    timings["v1 + gzip (served)"] = lambda: payload_schema.encode(payload_schema.dumps(payload), "gzip")
+    for name, fn in timings.items():
+        print(f"{name:<24} {format_seconds(measure(fn)):>12}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
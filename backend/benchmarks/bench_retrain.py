@@ -0,0 +1,95 @@
+# bench_retrain.py
+"""
+Full retrain vs incremental retraining after new rows arrive.
+A synthetic 15-minute AQI series of BASE_ROWS rows is trained on once
+(filling the feature cache and saving the artifact), then NEW_ROWS rows
+are appended and the model is updated with each method. Every run is
+scored on the same held-out newest 20% by train_model.main. Artifacts and
+caches go to a temporary directory.
+
+Usage: python benchmarks/bench_retrain.py [base_rows] [new_rows]
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import train_model
+
+BASE_ROWS = 20_000
+NEW_ROWS = 2_000
+WINDOW = 8_000
+
+
+def synthetic_history(n, seed=0):
+    """AR(1) AQI around a daily cycle, with noise."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2024-01-01", periods=n, freq="15min", tz="Asia/Kolkata")
+    level = 200 + 80 * np.sin(2 * np.pi * times.hour.to_numpy() / 24)
+    noise = rng.normal(0, 12, n)
+    aqi = np.empty(n)
+    aqi[0] = 200
+    for i in range(1, n):
+        aqi[i] = 0.9 * aqi[i - 1] + 0.1 * level[i] + noise[i]
+    return pd.DataFrame({"datetimeLocal": times, "AQI": aqi.round(2)})
+
+
+def run(**kwargs):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out, mae = train_model.main(**kwargs)
+    return time.perf_counter() - t0, mae, len(out["model"].estimators_)
+
+
+def main():
+    base_rows = int(sys.argv[1]) if len(sys.argv) > 1 else BASE_ROWS
+    new_rows = int(sys.argv[2]) if len(sys.argv) > 2 else NEW_ROWS
+    history = synthetic_history(base_rows + new_rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        train_model.DATA_PATH = os.path.join(tmp, "history.csv")
+        train_model.MODEL_PATH = os.path.join(tmp, "model.joblib")
+        train_model.FOREST_PATH = os.path.join(tmp, "model.forest")
+        train_model.FEATURE_CACHE_DIR = os.path.join(tmp, "cache")
+        base_model = os.path.join(tmp, "base.joblib")
+
+        history.iloc[:base_rows].to_csv(train_model.DATA_PATH, index=False)
+        seconds, mae, _ = run()
+        shutil.copy(train_model.MODEL_PATH, base_model)
+        print(f"initial full train on {base_rows} rows: {seconds:.2f}s, MAE {mae:.3f}")
+
+        history.iloc[base_rows:].to_csv(train_model.DATA_PATH, index=False, header=False, mode="a")
+        cache = train_model.FEATURE_CACHE_DIR
+        cache_copy = os.path.join(tmp, "cache_base")
+        shutil.copytree(cache, cache_copy)
+
+        def fresh(model=True):
+            shutil.rmtree(cache)
+            shutil.copytree(cache_copy, cache)
+            if model:
+                shutil.copy(base_model, train_model.MODEL_PATH)
+
+        print(f"\nafter appending {new_rows} rows:")
+        print(f"{'method':<34} {'seconds':>8} {'test MAE':>9} {'trees':>6}")
+        fresh()
+        rows = [("full retrain, featurize all rows", run(cache=False))]
+        fresh()
+        rows.append(("full retrain, cached features", run()))
+        fresh()
+        rows.append((f"warm start (+{train_model.GROW_TREES} trees)", run(incremental=True)))
+        fresh()
+        rows.append((f"sliding window ({WINDOW} rows)", run(window=WINDOW)))
+        for name, (seconds, mae, trees) in rows:
+            print(f"{name:<34} {seconds:>8.2f} {mae:>9.3f} {trees:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench_rolling.py
+"""
+Cost of keeping the rolling AQI features (rolling.py) current as readings
+arrive, for histories of 1e3..1e5 model steps:
+
+  pandas recompute   batch_features over the whole series, what running
+                     rolling()/ewm() over the frame on every new reading
+                     (or retrain) costs
+  online update      RollingState.update + features for one new step (on
+                     a copy of the state)
+  station stream     FeatureStream.push of one step's raw readings plus
+                     origin_state(), what serving does per snapshot
+  cache append       train_model.cached_features over a series one day
+                     longer than the cached one, cache load and save
+                     included
+  full build         build_features over the whole series
+
+Usage: python benchmarks/bench_rolling.py
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import train_model
+from resample import CADENCE, RAW_CADENCE
+from rolling import FeatureStream, RollingState, batch_features
+from suite import format_seconds, measure
+
+SIZES = (1_000, 10_000, 100_000)
+DAY = 24
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.round(np.abs(200 + np.cumsum(rng.normal(0, 5, n))), 2)
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def cache_append(frame):
+    """Best-of-3 seconds of cached_features over a frame one day longer than the cached one."""
+    n = len(frame)
+    best = np.inf
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        train_model.FEATURE_CACHE_DIR = tmp
+        for _ in range(3):
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            train_model.cached_features(frame.iloc[:n - DAY], "/bench/rolling.csv")
+            best = min(best, timed(lambda: train_model.cached_features(frame, "/bench/rolling.csv")))
+    return best
+
+
+def main():
+    print(f"{'steps':>8} {'pandas recompute':>18} {'online update':>15} {'station stream':>16} "
+          f"{'cache append':>14} {'full build':>12}")
+    for n in SIZES:
+        values = series(n)
+        state = RollingState().advance(values[:-1])
+
+        # the stream holds n steps of 15-minute readings; every call pushes the next step's
+        start = pd.Timestamp("2024-01-01", tz="Asia/Kolkata")
+        offsets = pd.to_timedelta(np.arange(4) * RAW_CADENCE.value)
+        stream = FeatureStream(CADENCE).push(start + pd.to_timedelta(np.arange(n * 4) * RAW_CADENCE.value),
+                                             np.repeat(values, 4))
+        step = iter(range(n, 10 ** 9))
+
+        def push():
+            times = start + CADENCE * next(step) + offsets
+            return stream.push(times, values[-4:]).origin_state().features()
+
+        frame = pd.DataFrame({"datetime": start + pd.to_timedelta(np.arange(n) * CADENCE.value), "AQI": values})
+        cost = [measure(lambda: batch_features(values)),
+                measure(lambda: state.copy().update(values[-1]).features()),
+                measure(push),
+                cache_append(frame),
+                measure(lambda: train_model.build_features(frame), once=True)]
+        print(f"{n:>8} " + " ".join(f"{format_seconds(c):>{w}}" for c, w in zip(cost, (18, 15, 16, 14, 12))),
+              flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# bench_startup.py
+"""
+Cold-start regression check for server.py.
+Each measurement runs in a fresh interpreter:
+  import     time to `import server` (heavy imports must stay deferred)
+  healthz    import + first /healthz response
+  first_aqi  import + first /api/aqi response (includes warm-up; live
+             lookup disabled so no network is involved)
+Exits non-zero when the median exceeds its budget.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGETS = {
+    "import": float(os.getenv("IMPORT_BUDGET", "0.5")),
+    "healthz": float(os.getenv("HEALTHZ_BUDGET", "0.6")),
+    "first_aqi": float(os.getenv("FIRST_RESPONSE_BUDGET", "2.0")),
+}
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import server
+t_import = time.perf_counter() - t0
+client = server.app.test_client()
+client.get("/healthz")
+t_healthz = time.perf_counter() - t0
+resp = client.get("/api/aqi")
+t_first = time.perf_counter() - t0
+assert resp.status_code == 200, resp.status_code
+heavy = sorted(m for m in ("sklearn", "joblib", "matplotlib") if m in sys.modules)
+print(json.dumps({"import": t_import, "healthz": t_healthz, "first_aqi": t_first, "heavy": heavy}))
+"""
+
+
+def measure_once():
+    env = dict(os.environ, GOOGLE_AQI_API_KEY="", PYTHONWARNINGS="ignore")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    samples = [measure_once() for _ in range(runs)]
+    failed = False
+    for name, budget in BUDGETS.items():
+        median = statistics.median(s[name] for s in samples)
+        status = "ok" if median <= budget else "REGRESSION"
+        failed |= median > budget
+        print(f"{name:<10} median {median:7.3f} s   budget {budget:5.2f} s   {status}")
+    heavy = samples[0]["heavy"]
+    if heavy:
+        print(f"fallback-only modules imported while serving: {heavy}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
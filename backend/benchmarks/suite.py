@@ -0,0 +1,350 @@
+# suite.py
+"""
+Benchmark suite for the prediction hot path and the data loaders, with
+stored baselines (asv style: every benchmark is a named, parameterized
+function, results are compared against baselines.json).
+
+  load_model        compact .forest and joblib artifact load
+  load_csv          HistoryStore tail load, full load_aqi_series read
+  time_features     features.time_matrix for 1 / 1000 target times
+  predict           model.predict and a 6-step ForecastEngine forecast,
+                    one series and a batch of 1000, also with uncertainty
+                    (forecast_distribution without / with trajectories)
+  serialize         /api/aqi payload to bytes: schema 1, schema 2, schema 1
+                    gzipped (payload_schema)
+  api_aqi           GET /api/aqi (snapshot) and /api/aqi?lat=&lon= through
+                    the Flask test client, upstream stubbed
+  history_range     /api/history body for the whole of a 5-year synthetic
+                    index downsampled to 1000 points (LTTB, min/max), uncached
+  prepare_df        featurization of synthetic 15-minute histories
+  train_main        train_model.main (featurize, fit, save) on the same
+
+prepare_df runs at 1e3..--max-rows rows and train_main at
+1e3..--max-train-rows rows (SIZES goes up to 1e7). Fast benchmarks are
+looped until a sample takes SAMPLE_SECONDS and the median of --repeat
+samples is reported; the dataset-size ones are run once per sample, with
+at most ONCE_REPEAT samples.
+
+A benchmark is a regression when it is more than --threshold slower
+than its baseline (default 0.5 = 1.5x); the exit status is 1 if any is.
+
+Usage: python benchmarks/suite.py [--filter predict] [--save] [--threshold 0.5]
+                                  [--max-rows 1e5] [--max-train-rows 1e4]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("STARTUP_MODE", "lazy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_retrain import synthetic_history
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+SAMPLE_SECONDS = 0.2
+REPEAT = 5
+ONCE_REPEAT = 3
+THRESHOLD = 0.5
+HISTORY_YEARS_ROWS = 5 * 365 * 96
+
+STUB_RESPONSE = {
+    "indexes": [{"code": "uaqi", "aqi": 120, "category": "Moderate"}],
+    "pollutants": [{"code": "pm25", "concentration": {"value": 80.0}}],
+}
+
+BENCHMARKS = []
+
+
+def benchmark(name, params=(None,), once=False):
+    """Register setup(param) -> zero-argument callable to time."""
+    def register(setup):
+        BENCHMARKS.append((name, list(params), once, setup))
+        return setup
+    return register
+
+
+def key(name, param):
+    return name if param is None else f"{name}[{param}]"
+
+
+def measure(fn, once=False, repeat=REPEAT):
+    """Median seconds per call of fn."""
+    number = 1
+    if once:
+        repeat = min(repeat, ONCE_REPEAT)
+    else:
+        fn()
+        while True:
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - t0 >= SAMPLE_SECONDS:
+                break
+            number *= 10 if time.perf_counter() - t0 < SAMPLE_SECONDS / 10 else 2
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return float(np.median(samples))
+
+
+def _quiet(fn):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+# ---------- model and data loading ----------
+
+@benchmark("load_model", ["compact", "joblib"])
+def bench_load_model(kind):
+    import server
+    if kind == "compact":
+        return lambda: server.load_compact_artifact(server.FOREST_PATH)
+    import joblib
+    return lambda: joblib.load(server.MODEL_PATH)
+
+
+@benchmark("load_csv", ["history_store", "load_aqi_series"])
+def bench_load_csv(kind):
+    import server
+    import train_model
+    from history_store import HistoryStore
+    if kind == "history_store":
+        return lambda: HistoryStore(server.DATA_PATH).refresh()
+    return lambda: train_model.load_aqi_series(server.DATA_PATH)
+
+
+# ---------- features and prediction ----------
+
+@benchmark("time_features", [1, 1000])
+def bench_time_features(n):
+    from features import time_matrix, time_parts
+    times = pd.date_range("2025-01-01", periods=n, freq="15min", tz="Asia/Kolkata")
+    return lambda: time_matrix(*time_parts(times))
+
+
+def _serving_model():
+    import server
+    model_dict = server.load_model()
+    if model_dict is None:
+        raise RuntimeError("No model artifact found")
+    return model_dict
+
+
+@benchmark("predict", ["model_1", "model_1000", "forecast_1", "forecast_1000",
+                       "distribution_1", "distribution_1000", "trajectories_1"])
+def bench_predict(kind):
+    from forecast import TRAJECTORIES, ForecastEngine
+    model_dict = _serving_model()
+    engine = ForecastEngine(model_dict)
+    rng = np.random.default_rng(0)
+    target, n = kind.split("_")
+    n = int(n)
+    windows = rng.uniform(50, 450, (n,) + engine.window_shape)
+    if target == "model":
+        X = engine.builder.build(windows, rng.integers(0, 24, n), rng.integers(0, 7, n))
+        return lambda: engine.model.predict(X)
+    base_times = pd.Timestamp("2025-11-20 12:00", tz="Asia/Kolkata") + pd.to_timedelta(np.arange(n), unit="h")
+    if target == "forecast":
+        return lambda: engine.forecast(windows, base_times, steps=6)
+    # uncertainty: tree spread on the mean path, or with sampled trajectories
+    samples = TRAJECTORIES if target == "trajectories" else 0
+    return lambda: engine.forecast_distribution(windows, base_times, steps=6, samples=samples)
+
+
+# ---------- end to end ----------
+
+@benchmark("serialize", ["v1", "v2", "v1_gzip"])
+def bench_serialize(kind):
+    import payload_schema
+    import server
+    from live_aqi import LiveAQICache
+    server.ensure_warm()
+    server.live_aqi_cache = LiveAQICache(fetch=lambda lat, lon: STUB_RESPONSE)
+    payload, _ = _quiet(server.build_aqi_response)()
+    view = payload_schema.parse_view("2" if kind == "v2" else "1")
+    coding = "gzip" if kind.endswith("gzip") else None
+    return lambda: server.aqi_body(payload, 200, view, coding)
+
+
+@benchmark("api_aqi", ["snapshot", "location"])
+def bench_api_aqi(kind):
+    import server
+    from live_aqi import LiveAQICache
+    server.ensure_warm()
+    server.live_aqi_cache = LiveAQICache(fetch=lambda lat, lon: STUB_RESPONSE)
+    client = server.app.test_client()
+    url = "/api/aqi" if kind == "snapshot" else "/api/aqi?lat=28.6139&lon=77.2090"
+
+    def request():
+        resp = client.get(url)
+        assert resp.status_code == 200, resp.status_code
+    return _quiet(request)
+
+
+@benchmark("history_range", ["lttb", "minmax"])
+def bench_history_range(method):
+    import history_query
+    import payload_schema
+    from history_store import HistoryIndex
+    snapshot = HistoryIndex(dataset(HISTORY_YEARS_ROWS)).snapshot()
+    return lambda: payload_schema.dumps(history_query.render(snapshot, None, None, ("AQI",), 1000, method))
+
+
+# ---------- dataset size ----------
+
+_datasets = {}
+
+
+def dataset(rows):
+    """CSV of a synthetic history with `rows` rows, written once per run."""
+    if rows not in _datasets:
+        path = os.path.join(_workdir(), f"history_{rows}.csv")
+        synthetic_history(rows).to_csv(path, index=False)
+        _datasets[rows] = path
+    return _datasets[rows]
+
+
+_tmp = None
+
+
+def _workdir():
+    global _tmp
+    if _tmp is None:
+        _tmp = tempfile.TemporaryDirectory()
+    return _tmp.name
+
+
+@benchmark("prepare_df", SIZES, once=True)
+def bench_prepare_df(rows):
+    import train_model
+    path = dataset(rows)
+    return lambda: train_model.prepare_df(path)
+
+
+@benchmark("train_main", SIZES, once=True)
+def bench_train_main(rows):
+    import train_model
+    train_model.DATA_PATH = dataset(rows)
+    train_model.MODEL_PATH = os.path.join(_workdir(), "model.joblib")
+    train_model.FOREST_PATH = os.path.join(_workdir(), "model.forest")
+    train_model.FEATURE_CACHE_DIR = os.path.join(_workdir(), "cache")
+
+    def train():
+        # full retrain from scratch every time
+        if os.path.exists(train_model.MODEL_PATH):
+            os.remove(train_model.MODEL_PATH)
+        train_model.main(cache=False)
+    return _quiet(train)
+
+
+# ---------- runner ----------
+
+def size_limit(name, args):
+    return {"prepare_df": args.max_rows, "train_main": args.max_train_rows}.get(name)
+
+
+def run(args):
+    results = {}
+    for name, params, once, setup in BENCHMARKS:
+        limit = size_limit(name, args)
+        for param in params:
+            k = key(name, param)
+            if args.filter and not any(f in k for f in args.filter):
+                continue
+            if limit is not None and param > limit:
+                continue
+            fn = setup(param)
+            results[k] = measure(fn, once=once, repeat=args.repeat)
+            print(f"{k:<32} {format_seconds(results[k]):>12}", flush=True)
+    return results
+
+
+def format_seconds(s):
+    for unit, scale in (("s", 1), ("ms", 1e3), ("µs", 1e6)):
+        if s * scale >= 1:
+            return f"{s * scale:.3f} {unit}"
+    return f"{s * 1e9:.1f} ns"
+
+
+def machine():
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__}
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    stored = load_baselines(path)
+    merged = dict(stored.get("results", {}))
+    merged.update(results)
+    with open(path, "w") as f:
+        json.dump({"machine": machine(), "results": dict(sorted(merged.items()))}, f, indent=2)
+        f.write("\n")
+    print(f"Saved {len(results)} baselines to {path}")
+
+
+def compare(results, baselines, threshold=THRESHOLD):
+    """Print current vs baseline; returns the keys slower than (1 + threshold) x baseline."""
+    stored = baselines.get("results", {})
+    if baselines.get("machine") and baselines["machine"] != machine():
+        print("Note: baselines were recorded on a different machine/environment:", baselines["machine"])
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for k, seconds in results.items():
+        if k not in stored:
+            print(f"{k:<32} {'-':>12} {format_seconds(seconds):>12} {'new':>7}")
+            continue
+        ratio = seconds / stored[k]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(k)
+            flag = "  REGRESSION"
+        print(f"{k:<32} {format_seconds(stored[k]):>12} {format_seconds(seconds):>12} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AQI backend against stored baselines.")
+    parser.add_argument("--filter", action="append", help="only run benchmarks whose key contains this (repeatable)")
+    parser.add_argument("--save", action="store_true", help="store these results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown before flagging, 0.5 = 1.5x")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="samples per benchmark")
+    parser.add_argument("--max-rows", type=float, default=1e5, help="largest prepare_df dataset")
+    parser.add_argument("--max-train-rows", type=float, default=1e4, help="largest train_main dataset")
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="baselines JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.save:
+        save_baselines(results, args.baselines)
+        return 0
+    regressions = compare(results, load_baselines(args.baselines), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {1 + args.threshold:.2f}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
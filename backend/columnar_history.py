@@ -0,0 +1,301 @@
+# columnar_history.py
+"""
+Typed, month-partitioned Parquet copy of cleaned_aqi_dataset.csv.
+Layout (Hive partitioning, one directory per local-time month):
+
+    cleaned_aqi_dataset.parquet/month=2025-11/part-00000.parquet
+
+Loaders read only the columns and time window they need; partitions
+outside the window are never opened. pyarrow is optional: without it, or
+without a converted dataset, everything falls back to the CSV.
+
+The copy records the size and mtime of the CSV it was written from
+(_source.json; ingest.py updates it when it appends to both). Once the
+CSV has changed some other way the copy is stale and readers use the CSV
+again until it is converted anew.
+
+Usage: python columnar_history.py [cleaned_aqi_dataset.csv] [out.parquet]
+"""
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from history_store import HistoryIndex, HistorySnapshot, HistoryStore, DEFAULT_CAPACITY, TIME_COL, _generations
+
+CHUNK_ROWS = 1_000_000
+SOURCE_FILE = "_source.json"
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def has_pyarrow():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _arrow():
+    # pyarrow is imported on use, so CSV-only deployments never pay for it
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    return pa, ds, pq
+
+
+def _csv_signature(csv_path):
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def mark_source(csv_path, out_path=None):
+    """Record the CSV as it is now as the source the Parquet copy is up to date with."""
+    out_path = out_path or columnar_path(csv_path)
+    tmp_path = os.path.join(out_path, f"{SOURCE_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(_csv_signature(csv_path), f)
+    os.replace(tmp_path, os.path.join(out_path, SOURCE_FILE))
+
+
+def is_fresh(csv_path):
+    """The Parquet copy holds every row of the CSV (it has not changed since the copy was written)."""
+    try:
+        with open(os.path.join(columnar_path(csv_path), SOURCE_FILE)) as f:
+            source = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    try:
+        return source == _csv_signature(csv_path)
+    except FileNotFoundError:
+        return True     # Parquet-only deployment
+
+
+def has_columnar(csv_path):
+    """An up-to-date Parquet copy of the CSV exists and can be read."""
+    return os.path.isdir(columnar_path(csv_path)) and has_pyarrow() and is_fresh(csv_path)
+
+
+def _use_columnar(csv_path):
+    """has_columnar, saying so when a copy exists but is stale."""
+    if has_columnar(csv_path):
+        return True
+    if os.path.isdir(columnar_path(csv_path)) and has_pyarrow():
+        print(f"{columnar_path(csv_path)} is older than {os.path.basename(csv_path)}; reading the CSV "
+              f"(rerun columnar_history.py to refresh it)")
+    return False
+
+
+def convert_csv(csv_path, out_path=None, chunk_rows=CHUNK_ROWS):
+    """Convert the cleaned CSV into the partitioned Parquet layout. Returns the output path."""
+    if not has_pyarrow():
+        raise ImportError("pyarrow is required to write the columnar history")
+    pa, ds, pq = _arrow()
+    out_path = out_path or columnar_path(csv_path)
+    tmp_path = f"{out_path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    # taken before reading: rows appended meanwhile leave the copy stale rather than missing them silently
+    source = _csv_signature(csv_path)
+
+    part = 0
+    for chunk in pd.read_csv(csv_path, parse_dates=[TIME_COL], chunksize=chunk_rows):
+        for c in chunk.columns:
+            if c != TIME_COL:
+                chunk[c] = pd.to_numeric(chunk[c], errors="coerce").astype("float64")
+        months = chunk[TIME_COL].dt.strftime("%Y-%m")
+        for month, group in chunk.groupby(months, sort=True):
+            month_dir = os.path.join(tmp_path, f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            table = pa.Table.from_pandas(group.sort_values(TIME_COL), preserve_index=False)
+            pq.write_table(table, os.path.join(month_dir, f"part-{part:05d}.parquet"))
+        part += 1
+
+    os.makedirs(tmp_path, exist_ok=True)
+    with open(os.path.join(tmp_path, SOURCE_FILE), "w") as f:
+        json.dump(source, f)
+    if os.path.exists(out_path):
+        shutil.rmtree(out_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _month_dirs(path):
+    return sorted(d for d in os.listdir(path) if d.startswith("month="))
+
+
+def _in_tz(ts, tz):
+    """ts as a Timestamp in tz (naive times are taken to be in tz already)."""
+    ts = pd.Timestamp(ts)
+    if tz is None:
+        return ts
+    return ts.tz_localize(tz) if ts.tz is None else ts.tz_convert(tz)
+
+
+def read_history(path, columns=None, start=None, end=None, tail=None):
+    """
+    Read the Parquet history as a DataFrame sorted by time.
+    columns: columns to load (TIME_COL is always included).
+    start/end: inclusive time window, pushed down as partition and row filters.
+    tail: only the newest `tail` rows, reading partitions newest-first.
+    """
+    pa, ds, pq = _arrow()
+    cols = None if columns is None else [TIME_COL] + [c for c in columns if c != TIME_COL]
+    months = _month_dirs(path)
+    if months and (start is not None or end is not None):
+        # partitions are local-time months: compare in the data's timezone, not the bound's
+        tz = ds.dataset(os.path.join(path, months[0]), format="parquet").schema.field(TIME_COL).type.tz
+        start = None if start is None else _in_tz(start, tz)
+        end = None if end is None else _in_tz(end, tz)
+    if start is not None:
+        months = [m for m in months if m[len("month="):] >= start.strftime("%Y-%m")]
+    if end is not None:
+        months = [m for m in months if m[len("month="):] <= end.strftime("%Y-%m")]
+
+    tables, rows = [], 0
+    for month in (reversed(months) if tail else months):
+        dataset = ds.dataset(os.path.join(path, month), format="parquet", partitioning="hive")
+        flt = None
+        if start is not None:
+            flt = ds.field(TIME_COL) >= pa.scalar(start)
+        if end is not None:
+            upper = ds.field(TIME_COL) <= pa.scalar(end)
+            flt = upper if flt is None else flt & upper
+        table = dataset.to_table(columns=cols or [f for f in dataset.schema.names if f != "month"], filter=flt)
+        tables.append(table)
+        rows += table.num_rows
+        if tail and rows >= tail:
+            break
+
+    if not tables:
+        return pd.DataFrame(columns=cols or [TIME_COL])
+    if tail:
+        tables.reverse()
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    df = df.sort_values(TIME_COL, kind="stable").reset_index(drop=True)
+    return df.tail(tail).reset_index(drop=True) if tail else df
+
+
+def load_history_frame(csv_path, columns=None, start=None, end=None, tail=None):
+    """DataFrame of the cleaned history sorted by time, from Parquet when available, else the CSV."""
+    if _use_columnar(csv_path):
+        return read_history(columnar_path(csv_path), columns=columns, start=start, end=end, tail=tail)
+    usecols = None if columns is None else [TIME_COL] + [c for c in columns if c != TIME_COL]
+    df = pd.read_csv(csv_path, usecols=usecols, parse_dates=[TIME_COL])
+    tz = getattr(df[TIME_COL].dt, "tz", None)
+    if start is not None:
+        df = df[df[TIME_COL] >= _in_tz(start, tz)]
+    if end is not None:
+        df = df[df[TIME_COL] <= _in_tz(end, tz)]
+    df = df.sort_values(TIME_COL, kind="stable").reset_index(drop=True)
+    return df.tail(tail).reset_index(drop=True) if tail else df
+
+
+class ColumnarHistoryStore(HistoryStore):
+    """
+    HistoryStore over the Parquet layout: reloads the newest partitions when
+    any file changes (every partition with capacity=None). Given the CSV
+    it was converted from, it switches to reading the CSV (HistoryStore /
+    HistoryIndex) for good once the copy is stale.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, check_interval=1.0, csv_path=None):
+        self.path = path
+        self.capacity = capacity
+        self.check_interval = check_interval
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._signature = None
+        self._version = 0
+        self._snapshot = None
+        self._fallback = None
+
+    def _files(self):
+        sig = []
+        for month in _month_dirs(self.path):
+            month_dir = os.path.join(self.path, month)
+            for name in sorted(os.listdir(month_dir)):
+                if name.endswith(".parquet"):
+                    st = os.stat(os.path.join(month_dir, name))
+                    sig.append((month, name, st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _csv_store(self):
+        """The CSV-backed store once the Parquet copy is stale, else None."""
+        if self._fallback is None and self.csv_path is not None and not is_fresh(self.csv_path):
+            print(f"{self.path} is older than {os.path.basename(self.csv_path)}; serving the CSV")
+            self._fallback = (HistoryIndex(self.csv_path, check_interval=self.check_interval) if self.capacity is None
+                              else HistoryStore(self.csv_path, capacity=self.capacity,
+                                                check_interval=self.check_interval))
+        return self._fallback
+
+    def refresh(self):
+        self._last_check = time.monotonic()
+        fallback = self._csv_store()
+        if fallback is not None:
+            changed = fallback.refresh()
+            self._snapshot = fallback._snapshot
+            return changed
+        try:
+            sig = self._files()
+        except FileNotFoundError:
+            return False
+        if sig == self._signature:
+            return False
+
+        with self._lock:
+            if sig == self._signature:
+                return False
+            df = read_history(self.path, tail=self.capacity)
+            times = pd.to_datetime(df[TIME_COL], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+            tz = str(df[TIME_COL].dt.tz) if len(df) and df[TIME_COL].dt.tz is not None else "UTC"
+            columns = [c for c in df.columns if c != TIME_COL]
+            values = df[columns].to_numpy(dtype=np.float64) if columns else np.empty((len(df), 0))
+            pq = _arrow()[2]
+            total_rows = sum(pq.ParquetFile(os.path.join(self.path, m, n)).metadata.num_rows
+                             for m, n, _, _ in sig)
+            self._version += 1
+            self._snapshot = HistorySnapshot(columns, times, values, tz, self._version, total_rows)
+            # a reload may change any row; generations are shared with the CSV stores it can fall back to
+            self._snapshot.generation = next(_generations)
+            self._signature = sig
+            return True
+
+    def push(self, frame, data, start):
+        fallback = self._csv_store()
+        if fallback is not None:
+            changed = fallback.push(frame, data, start)
+            self._snapshot = fallback._snapshot
+            return changed
+        # new rows arrive as extra part files; picking them up means re-reading the tail
+        return self.refresh()
+
+
+def open_history_store(csv_path, capacity=DEFAULT_CAPACITY, check_interval=1.0):
+    """Columnar store when a converted dataset exists, else the incremental CSV store."""
+    if _use_columnar(csv_path):
+        return ColumnarHistoryStore(columnar_path(csv_path), capacity=capacity, check_interval=check_interval,
+                                    csv_path=csv_path)
+    return HistoryStore(csv_path, capacity=capacity, check_interval=check_interval)
+
+
+def open_history_index(csv_path, check_interval=1.0):
+    """Store of every row (for range queries): whole Parquet dataset, else the growing CSV index."""
+    if _use_columnar(csv_path):
+        return ColumnarHistoryStore(columnar_path(csv_path), capacity=None, check_interval=check_interval,
+                                    csv_path=csv_path)
+    return HistoryIndex(csv_path, check_interval=check_interval)
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "cleaned_aqi_dataset.csv")
+    dst = sys.argv[2] if len(sys.argv) > 2 else columnar_path(src)
+    convert_csv(src, dst)
+    print(f"Converted {src} -> {dst}")
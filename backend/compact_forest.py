@@ -0,0 +1,156 @@
+# compact_forest.py
+"""
+Array-backed export of a trained RandomForestRegressor.
+All trees are flattened into shared node arrays (feature, threshold,
+left, right, value) and written to a single file that the server mmaps.
+Evaluation walks every tree for every row at once with NumPy and does
+not import sklearn; results match RandomForestRegressor.predict exactly.
+
+Usage: python compact_forest.py [model.joblib] [out.forest]
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+MAGIC = b"AQFOREST"
+ALIGN = 64
+META_KEYS = ("features", "lags", "mode", "horizons", "version", "method", "trained_rows", "trained_until",
+             "cadence_minutes", "targets", "target_scale")
+
+
+def compile_forest(model):
+    """Flatten model.estimators_ into node arrays with global node indices."""
+    trees = [est.tree_ for est in model.estimators_]
+    offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]]).astype(np.int32)
+    total = sum(t.node_count for t in trees)
+    n_outputs = trees[0].value.shape[1]
+
+    feature = np.zeros(total, dtype=np.int32)
+    threshold = np.full(total, np.inf)
+    left = np.empty(total, dtype=np.int32)
+    right = np.empty(total, dtype=np.int32)
+    value = np.empty((total, n_outputs))
+    depth = 0
+    for off, t in zip(offsets, trees):
+        sl = slice(off, off + t.node_count)
+        own = np.arange(off, off + t.node_count, dtype=np.int32)
+        is_leaf = t.children_left == -1
+        # leaves point at themselves with an always-true test, so the walk needs no mask
+        feature[sl] = np.where(is_leaf, 0, t.feature)
+        threshold[sl] = np.where(is_leaf, np.inf, t.threshold)
+        left[sl] = np.where(is_leaf, own, t.children_left + off)
+        right[sl] = np.where(is_leaf, own, t.children_right + off)
+        value[sl] = t.value[:, :, 0]
+        depth = max(depth, t.max_depth)
+
+    return {
+        "roots": offsets,
+        "feature": feature,
+        "threshold": threshold,
+        "left": left,
+        "right": right,
+        "value": value,
+        "max_depth": depth,
+    }
+
+
+class CompactForest:
+    def __init__(self, arrays):
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.max_depth = int(arrays["max_depth"])
+        self.n_estimators = len(self.roots)
+        self.n_outputs = self.value.shape[1]
+
+    def apply(self, X):
+        """Leaf node index of every (tree, row), shape (n_trees, n_rows)."""
+        # sklearn evaluates splits on float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(X))[None, :]
+        node = np.repeat(self.roots[:, None], len(X), axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_trees, n_rows, n_outputs)."""
+        return self.value[self.apply(X)]
+
+    def mean(self, leaves):
+        """predict() from predict_trees() output, shape (n_rows,) or (n_rows, n_outputs)."""
+        # accumulate tree by tree like sklearn, so sums round identically
+        out = np.zeros(leaves.shape[1:])
+        for t in range(len(leaves)):
+            out += leaves[t]
+        out /= len(leaves)
+        return out[:, 0] if self.n_outputs == 1 else out
+
+    def predict(self, X):
+        return self.mean(self.value[self.apply(X)])
+
+
+def save_compact(model_dict, path):
+    """Write model_dict's forest and metadata to path (atomically)."""
+    arrays = compile_forest(model_dict["model"])
+    max_depth = arrays.pop("max_depth")
+    specs, blobs, pos = {}, [], 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        pos = -(-pos // ALIGN) * ALIGN
+        specs[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": pos}
+        blobs.append((pos, arr.tobytes()))
+        pos += arr.nbytes
+    meta = {k: model_dict.get(k) for k in META_KEYS}
+    meta["max_depth"] = max_depth
+    header = json.dumps({"meta": meta, "arrays": specs}).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+        for off, blob in blobs:
+            f.seek(data_start + off)
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def load_compact(path, mmap=True):
+    """Load a .forest file as a model dict ({"model": CompactForest, "features", ...})."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compact forest file")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    data_start = -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        if mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(data_start + spec["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    meta = header["meta"]
+    arrays["max_depth"] = meta.pop("max_depth")
+    model_dict = {k: v for k, v in meta.items() if v is not None}
+    model_dict["model"] = CompactForest(arrays)
+    return model_dict
+
+
+if __name__ == "__main__":
+    import joblib
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "aq_model_aqi_time.joblib")
+    dst = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(src)[0] + ".forest"
+    save_compact(joblib.load(src), dst)
+    print(f"Saved compact forest to {dst} ({os.path.getsize(dst) / 1024:.0f} KiB)")
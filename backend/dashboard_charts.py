@@ -0,0 +1,92 @@
+# dashboard_charts.py
+"""
+Vega-Lite specs for the Streamlit dashboard (st.vega_lite_chart).
+The charts are drawn in the browser, so a rerun only builds a small dict
+instead of rasterizing matplotlib figures on the server. Every builder is
+a pure function of its (hashable) inputs with the data inlined, so the
+dashboard memoizes specs by forecast content with st.cache_data.
+
+Times are passed as local wall-clock strings ("2025-11-20T10:00:00"),
+which Vega-Lite shows as is whatever the viewer's timezone.
+"""
+
+# (low, high, colour) of the AQI scale bands on the gauge
+AQI_BANDS = ((0, 50, "#16a34a"), (51, 100, "#f59e0b"), (101, 200, "#f97316"),
+             (201, 300, "#ef4444"), (301, 400, "#9f1239"), (401, 500, "#7c2d12"))
+CONTRIBUTOR_COLORS = ["#16a34a", "#f59e0b", "#f97316", "#ef4444", "#9f1239"]
+SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+
+def wall_time(ts):
+    return ts.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def gauge_spec(current, worst):
+    """AQI scale bar with the current value and the worst predicted one."""
+    marks = [{"aqi": float(current), "label": "Current", "shape": "circle"},
+             {"aqi": float(worst), "label": "Worst predicted", "shape": "triangle-down"}]
+    return {
+        "$schema": SCHEMA, "height": 40,
+        "layer": [
+            {"data": {"values": [{"lo": lo, "hi": hi, "color": c} for lo, hi, c in AQI_BANDS]},
+             "mark": {"type": "bar", "height": 20},
+             "encoding": {"x": {"field": "lo", "type": "quantitative", "scale": {"domain": [0, 500]},
+                                "title": "AQI scale"},
+                          "x2": {"field": "hi"},
+                          "color": {"field": "color", "type": "nominal", "scale": None}}},
+            {"data": {"values": marks},
+             "mark": {"type": "point", "filled": True, "size": 120, "stroke": "black"},
+             "encoding": {"x": {"field": "aqi", "type": "quantitative"},
+                          "shape": {"field": "shape", "type": "nominal", "scale": None},
+                          "color": {"value": "white"},
+                          "tooltip": [{"field": "label"}, {"field": "aqi", "format": ".0f"}]}},
+        ],
+    }
+
+
+def forecast_spec(times, preds, title):
+    """Predicted AQI per hour: dashed line, points and value labels."""
+    values = [{"time": t, "aqi": round(float(p))} for t, p in zip(times, preds)]
+    x = {"field": "time", "type": "temporal", "timeUnit": "yearmonthdatehours", "title": "Time",
+         "axis": {"format": "%I %p"}}
+    y = {"field": "aqi", "type": "quantitative", "title": "AQI",
+         "scale": {"domain": [0, max(500, max(preds) + 50)]}}
+    return {
+        "$schema": SCHEMA, "title": title, "height": 220,
+        "data": {"values": values},
+        "encoding": {"x": x, "y": y},
+        "layer": [
+            {"mark": {"type": "line", "point": True, "strokeDash": [6, 4], "color": "#f97316"}},
+            {"mark": {"type": "text", "dy": -12}, "encoding": {"text": {"field": "aqi"}}},
+        ],
+    }
+
+
+def bar_spec(labels, values, title, y_title, colors=None):
+    """One bar per label, in the given order."""
+    data = [{"label": l, "value": float(v)} for l, v in zip(labels, values)]
+    color = ({"field": "label", "type": "nominal", "scale": {"domain": list(labels), "range": colors[:len(labels)]},
+              "legend": None} if colors else {"value": "#3b82f6"})
+    spec = {
+        "$schema": SCHEMA, "height": 180,
+        "data": {"values": data},
+        "mark": {"type": "bar"},
+        "encoding": {"x": {"field": "label", "type": "nominal", "sort": None, "title": None},
+                     "y": {"field": "value", "type": "quantitative", "title": y_title},
+                     "color": color},
+    }
+    if title:
+        spec["title"] = title
+    return spec
+
+
+def series_spec(times, values, unit, color, time_format="%I %p"):
+    """Readings of one pollutant over time."""
+    data = [{"time": t, "value": float(v)} for t, v in zip(times, values) if v == v]
+    return {
+        "$schema": SCHEMA, "height": 140,
+        "data": {"values": data},
+        "mark": {"type": "line", "point": True, "color": color},
+        "encoding": {"x": {"field": "time", "type": "temporal", "title": None, "axis": {"format": time_format}},
+                     "y": {"field": "value", "type": "quantitative", "title": unit}},
+    }
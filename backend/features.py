@@ -0,0 +1,134 @@
+# features.py
+"""
+Model features, shared by training (train_model.py) and serving (forecast.py).
+A forecast origin is described by its AQI lag window and the time of the
+target step:
+
+    aqi_lag_1..aqi_lag_L   the L readings up to the origin (aqi_lag_1 = newest,
+                           i.e. one step before the target)
+    aqi_mean_6 .. aqi_delta_1
+                           rolling means, std, EWMA and change of the AQI
+                           series up to the origin (rolling.py)
+    sin_hour, cos_hour     hour of the target time on the unit circle
+    dow_0..dow_6           one-hot weekday of the target time (all seven, always)
+
+A joint model (several targets, e.g. AQI and the pollutants) has a lag
+block per target, in the order of its "targets" list: aqi_lag_1..L,
+pm25_lag_1..L, ... and its windows are (targets, L) per origin.
+
+FeatureBuilder lays these out as a float64 matrix in the column order of a
+trained artifact's "features" list, for any batch of windows, rolling
+features and target times. Older artifacts name lags "lag_i", may list
+only some dow_* columns and have no rolling columns; all are handled by
+name.
+"""
+import numpy as np
+import pandas as pd
+
+from rolling import ROLLING_COLUMNS, RollingState
+
+LAGS = 6
+DOW_COLUMNS = [f"dow_{d}" for d in range(7)]
+TIME_COLUMNS = ["sin_hour", "cos_hour"] + DOW_COLUMNS
+# bump when the features built for the same data change (invalidates cached frames)
+FEATURES_VERSION = 3
+
+
+def lag_columns(lags=LAGS, target="AQI"):
+    prefix = "aqi" if target == "AQI" else target
+    return [f"{prefix}_lag_{i}" for i in range(1, lags + 1)]
+
+
+def feature_names(lags=LAGS, targets=("AQI",)):
+    """Full feature list in training order."""
+    return [c for t in targets for c in lag_columns(lags, t)] + ROLLING_COLUMNS + TIME_COLUMNS
+
+
+def lag_matrix(values, lags=LAGS):
+    """
+    (n, lags) lag features of every row taken as an origin: column i-1 holds
+    values shifted by i-1, so row r is its window values[r-lags+1..r], newest
+    first (NaN where there is not enough history).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full((len(values), lags), np.nan)
+    for i in range(lags):
+        out[i:, i] = values[:len(values) - i]
+    return out
+
+
+def time_parts(times):
+    """hour and weekday arrays of a DatetimeIndex (or anything pd.DatetimeIndex accepts)."""
+    times = pd.DatetimeIndex(times)
+    return times.hour.to_numpy(), times.weekday.to_numpy()
+
+
+def time_matrix(hours, dows):
+    """(n, 9) array of TIME_COLUMNS from hour and weekday arrays."""
+    hours = np.asarray(hours)
+    dows = np.asarray(dows)
+    angle = 2 * np.pi * hours / 24.0
+    out = np.zeros((len(hours), len(TIME_COLUMNS)), dtype=np.float64)
+    out[:, 0] = np.sin(angle)
+    out[:, 1] = np.cos(angle)
+    out[np.arange(len(dows)), 2 + dows] = 1.0
+    return out
+
+
+class FeatureBuilder:
+    """Maps lag windows, rolling features and target times onto a trained artifact's feature columns."""
+
+    def __init__(self, features, lags=None, targets=("AQI",)):
+        self.features = list(features)
+        self.targets = list(targets)
+        col = {f: j for j, f in enumerate(self.features)}
+        lag_pos = {}
+        for k, target in enumerate(self.targets):
+            prefixes = ("aqi_lag_", "lag_") if target == "AQI" else (f"{target}_lag_",)
+            for f, j in col.items():
+                for prefix in prefixes:
+                    if f.startswith(prefix) and f[len(prefix):].isdigit():
+                        lag_pos[(k, int(f[len(prefix):]))] = j
+        self.lags = lags or max((i for _, i in lag_pos), default=0)
+        # (column, target, window offset from the newest value)
+        self._lag_cols = [(j, k, i) for (k, i), j in sorted(lag_pos.items())]
+        # (column, index into rolling.ROLLING_COLUMNS)
+        self._rolling_cols = [(col[f], k) for k, f in enumerate(ROLLING_COLUMNS) if f in col]
+        self.rolling = bool(self._rolling_cols)
+        # (column, index into time_matrix)
+        self._time_cols = [(col[f], k) for k, f in enumerate(TIME_COLUMNS) if f in col]
+        self.time_aware = bool(self._time_cols)
+
+    def build(self, window, hours=None, dows=None, rolling=None):
+        """
+        window: (n, >= lags) AQI values, oldest -> newest, ending just before
+        the target; (n, targets, >= lags) for a joint model.
+        hours/dows: (n,) hour and weekday of each target time.
+        rolling: (n, len(ROLLING_COLUMNS)) features at each origin, e.g.
+        RollingState.features(); without it they are taken from the window
+        alone.
+        Returns the (n, len(features)) model input.
+        """
+        window = np.asarray(window, dtype=np.float64)
+        if len(self.targets) == 1:
+            window = np.atleast_2d(window)[:, None, :]
+        elif window.ndim == 2:
+            window = window[None]
+        X = np.zeros((len(window), len(self.features)), dtype=np.float64)
+        for j, k, i in self._lag_cols:
+            X[:, j] = window[:, k, -i]
+        if self._rolling_cols:
+            if rolling is None:
+                rolling = RollingState.of_windows(window[:, 0]).features()
+            for j, k in self._rolling_cols:
+                X[:, j] = rolling[:, k]
+        if self._time_cols:
+            T = time_matrix(hours, dows)
+            for j, k in self._time_cols:
+                X[:, j] = T[:, k]
+        return X
+
+    def build_at(self, window, target_times, rolling=None):
+        """build() with target timestamps instead of hour/weekday arrays."""
+        hours, dows = time_parts(np.atleast_1d(pd.to_datetime(target_times)))
+        return self.build(window, hours, dows, rolling)
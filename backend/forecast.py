@@ -0,0 +1,313 @@
+# forecast.py
+"""
+Vectorized recursive multi-horizon AQI forecasting, shared by server.py
+and streamlit_app_api.py.
+Many independent series (base times / locations) are forecast together:
+each horizon step is one batched model.predict over all series, and the
+recursive lag update is done on a (series, lags) array.
+Direct (multi-output) artifacts skip the recursion: one predict call
+returns every horizon. Model inputs come from features.FeatureBuilder, the
+same code that lays out the training columns.
+
+Joint artifacts ("targets": AQI plus pollutants and weather) forecast
+every target together: a series' window is (targets, lags), each step's
+predict returns all targets (in their units: the model is fitted on
+targets / target_scale) and all of them are fed back as the next lags.
+AQI is always targets[0]; forecast() returns AQI unless all_targets=True.
+
+Artifacts with rolling features (rolling.py) take a RollingState per
+series at the origin (snapshot_state / frame_state); each recursive step
+advances a copy of it with the predicted AQI, as if it had been read.
+Without one, the state is built from the lag window alone.
+
+Steps are the artifact's cadence (cadence_minutes): the lag window is the
+history resampled to that cadence (resample.py, as in training) and each
+forecast step is one cadence later. Artifacts without a cadence were
+trained on the raw 15-minute rows and are served in those steps.
+
+forecast_distribution() adds per-horizon spread from the forest's trees:
+every tree's prediction comes out of one stacked (trees, rows) leaf
+lookup. Recursive models propagate `samples` trajectories per series,
+each continued with a randomly drawn tree's prediction and evaluated in
+the same pass as the mean path, so the cost grows with `samples`, not
+with the number of trees.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from compact_forest import CompactForest, compile_forest
+from features import FeatureBuilder
+from resample import RAW_CADENCE, from_minutes, recent_window
+from rolling import FeatureStream, RollingState, warmup_steps
+TRAJECTORIES = 32
+QUANTILES = (0.1, 0.9)
+
+
+class ForecastEngine:
+    def __init__(self, model_dict, n_jobs=1):
+        self.model = model_dict["model"]
+        self.features = list(model_dict.get("features", []))
+        self.mode = model_dict.get("mode", "recursive")
+        self.horizons = model_dict.get("horizons")
+        # per-row joblib dispatch costs far more than a few hundred tree walks
+        if hasattr(self.model, "n_jobs"):
+            self.model.n_jobs = n_jobs
+
+        # AQI first; a joint model has more targets and predicts them in units of target_scale
+        self.targets = list(model_dict.get("targets") or ["AQI"])
+        self.joint = len(self.targets) > 1
+        scale = model_dict.get("target_scale")
+        self.scale = np.asarray(scale, dtype=np.float64) if scale is not None else None
+
+        self.builder = FeatureBuilder(self.features, model_dict.get("lags"), self.targets) if self.features else None
+        self.time_aware = self.builder is not None and self.builder.time_aware
+        self.rolling = self.builder is not None and self.builder.rolling
+        self.lags = self.builder.lags if self.builder is not None else model_dict.get("lags")
+        self.cadence = from_minutes(model_dict.get("cadence_minutes"))
+        self.step = self.cadence or RAW_CADENCE
+        self._forest = None
+        self._stream_lock = threading.Lock()
+
+    @property
+    def window_shape(self):
+        """Shape of one series' full lag window: (lags,), or (targets, lags) for a joint model."""
+        return (len(self.targets), self.lags) if self.joint else (self.lags,)
+
+    def window_ready(self, window):
+        return window.shape[-1] >= self.lags
+
+    def aqi_window(self, window):
+        """The AQI lags of a window (or batch of windows)."""
+        return np.asarray(window)[..., 0, :] if self.joint else np.asarray(window)
+
+    def history_rows(self):
+        """Raw readings that cover the lag window and warm up the rolling features, plus the open bucket."""
+        steps = max(self.lags, warmup_steps() if self.rolling else 0) + 1
+        return steps * max(1, self.step // RAW_CADENCE)
+
+    def history_window(self, times, values):
+        """
+        Lag window (oldest -> newest) from raw readings, at the model's cadence.
+        values: (n,) AQI, or (n, targets) in self.targets order for a joint model.
+        """
+        window = recent_window(times, values, self.lags, self.cadence)
+        return window.T if self.joint else window
+
+    def _empty_window(self):
+        return np.empty(self.window_shape[:-1] + (0,))
+
+    def frame_window(self, df, time_col="datetime"):
+        """history_window of a frame of raw readings (empty if it lacks a target column)."""
+        if not all(t in df.columns for t in self.targets):
+            return self._empty_window()
+        values = df[self.targets].to_numpy(dtype=np.float64) if self.joint else df["AQI"].to_numpy(dtype=np.float64)
+        return self.history_window(pd.DatetimeIndex(df[time_col]), values)
+
+    def snapshot_window(self, snapshot):
+        """history_window of a HistorySnapshot, computed once per snapshot (empty if a target is not recorded)."""
+        key = ("window", tuple(self.targets), self.lags, self.cadence)
+        if key not in snapshot.memo:
+            if all(t in snapshot.columns for t in self.targets):
+                times = pd.DatetimeIndex(snapshot.times, tz="UTC").tz_convert(snapshot.tz)
+                values = (np.column_stack([snapshot.column(t) for t in self.targets]) if self.joint
+                          else snapshot.column("AQI"))
+                snapshot.memo[key] = self.history_window(times, values)
+            else:
+                snapshot.memo[key] = self._empty_window()
+        return snapshot.memo[key]
+
+    def history_state(self, times, aqi):
+        """RollingState at the origin of history_window() from raw AQI readings (None without rolling features)."""
+        if not self.rolling:
+            return None
+        return FeatureStream(self.cadence).push(pd.DatetimeIndex(times), aqi).origin_state()
+
+    def frame_state(self, df, time_col="datetime"):
+        """history_state of a frame of raw readings (None without rolling features or an AQI column)."""
+        if not self.rolling or "AQI" not in df.columns:
+            return None
+        return self.history_state(df[time_col], df["AQI"].to_numpy(dtype=np.float64))
+
+    def snapshot_state(self, snapshot):
+        """
+        history_state of a HistorySnapshot, once per snapshot. The station's
+        FeatureStream is kept in snapshot.carried (shared by the snapshots of
+        one append-only history) and only consumes the rows appended since it
+        last ran, so keeping the features current is O(new readings).
+        """
+        if not self.rolling or "AQI" not in snapshot.columns:
+            return None
+        key = ("rolling", self.cadence)
+        if key not in snapshot.memo:
+            with self._stream_lock:
+                stream = snapshot.carried.get(key)
+                new = snapshot.total_rows - stream.rows if stream is not None else len(snapshot) + 1
+                if not 0 <= new <= len(snapshot):
+                    # first snapshot, rows that left the buffer unseen, or an older snapshot: start over
+                    fresh = FeatureStream(self.cadence)
+                    if new > 0:
+                        snapshot.carried[key] = fresh
+                    stream, new = fresh, len(snapshot)
+                start = len(snapshot) - new
+                times = pd.DatetimeIndex(snapshot.times[start:], tz="UTC").tz_convert(snapshot.tz)
+                stream.push(times, snapshot.column("AQI")[start:])
+                stream.rows = snapshot.total_rows
+                snapshot.memo[key] = stream.origin_state()
+        return snapshot.memo[key]
+
+    def origin(self, now):
+        """Forecast origin for wall-clock time `now`: the start of its step."""
+        return pd.Timestamp(now).floor(self.step)
+
+    @property
+    def forest(self):
+        """CompactForest view of the model for per-tree predictions (None if it is not a forest)."""
+        if self._forest is None:
+            if isinstance(self.model, CompactForest):
+                self._forest = self.model
+            elif hasattr(self.model, "estimators_"):
+                self._forest = CompactForest(compile_forest(self.model))
+        return self._forest
+
+    def _time_block(self, base_times, steps, step):
+        """hour and weekday of every (series, horizon) target time, shape (n, steps)."""
+        offsets = np.arange(1, steps + 1) * step
+        fut = pd.DatetimeIndex(np.repeat(base_times, steps)) + pd.TimedeltaIndex(np.tile(offsets, len(base_times)))
+        shape = (len(base_times), steps)
+        return fut, fut.hour.to_numpy().reshape(shape), fut.weekday.to_numpy().reshape(shape)
+
+    def _features(self, window, hours, dows, state=None):
+        if self.builder is None:
+            return window
+        return self.builder.build(window, hours, dows, state.features() if state is not None else None)
+
+    def _origin_state(self, state, window, rows):
+        """A RollingState for each of `rows` (series indices) to advance: a copy of `state`'s, or the window's."""
+        if not self.rolling:
+            return None
+        if state is None:
+            return RollingState.of_windows(self.aqi_window(window)[rows])
+        return state.take(np.zeros(len(rows), dtype=np.int64) if state.n == 1 else rows)
+
+    def _predict(self, X):
+        """model.predict in target units: (n,), or (n, targets) for a joint model."""
+        p = self.model.predict(X)
+        return p * self.scale if self.scale is not None else p
+
+    def _inputs(self, last_vals, base_times, steps, step):
+        window = np.asarray(last_vals, dtype=np.float64)
+        window = window[None] if window.ndim == len(self.window_shape) else window
+        n = window.shape[0]
+        lags = self.lags or window.shape[-1]
+        window = window[..., -lags:]
+
+        base_times = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(base_times)))
+        if len(base_times) == 1 and n > 1:
+            base_times = base_times.repeat(n)
+        return window, n, self._time_block(base_times, steps, step)
+
+    def forecast(self, last_vals, base_times, steps=6, step=None, all_targets=False, state=None):
+        """
+        last_vals: (lags,) or (n_series, lags) AQI history, oldest -> newest;
+        (targets, lags) or (n_series, targets, lags) for a joint model.
+        base_times: one timestamp or n_series timestamps.
+        state: RollingState at the origin, of one series or n_series (not modified).
+        Returns (future_times, preds): a list of DatetimeIndex (one per series)
+        and an (n_series, steps) array of AQI predictions, with all_targets
+        (n_series, steps, targets) of every target.
+        """
+        window, n, (fut, hours, dows) = self._inputs(last_vals, base_times, steps, step or self.step)
+        preds = np.empty((n, steps) + ((len(self.targets),) if self.joint else ()), dtype=np.float64)
+        state = self._origin_state(state, window, np.arange(n))
+
+        if self.mode == "direct":
+            if steps > self.horizons:
+                raise ValueError(f"Direct model covers {self.horizons} steps, {steps} requested")
+            # time features describe the first target step, as in training
+            preds[:] = self.model.predict(self._features(window, hours[:, 0], dows[:, 0], state))[:, :steps]
+        else:
+            for h in range(steps):
+                p = self._predict(self._features(window, hours[:, h], dows[:, h], state))
+                preds[:, h] = p
+                window = np.concatenate([window[..., 1:], p[..., None]], axis=-1)
+                if state is not None:
+                    state.update(p[:, 0] if self.joint else p)
+
+        future_times = [fut[i * steps:(i + 1) * steps] for i in range(n)]
+        if all_targets and not self.joint:
+            preds = preds[:, :, None]
+        elif self.joint and not all_targets:
+            preds = preds[:, :, 0]
+        return future_times, preds
+
+    def forecast_distribution(self, last_vals, base_times, steps=6, step=None,
+                              samples=TRAJECTORIES, quantiles=QUANTILES, seed=0, all_targets=False, state=None):
+        """
+        forecast() plus the spread of the trees around its AQI.
+        Returns (future_times, preds, std, bands): preds equal forecast()'s
+        (with all_targets, every target's), std is (n_series, steps) and
+        bands (n_series, steps, len(quantiles)). A joint model's
+        trajectories continue with all targets of the drawn tree.
+        Recursive models with samples=0 take the tree spread along the mean
+        path only (no extra model evaluations, but no compounding either).
+        Raises ValueError for models that are not forests.
+        """
+        forest = self.forest
+        if forest is None:
+            raise ValueError("Uncertainty needs a forest model")
+        window, n, (fut, hours, dows) = self._inputs(last_vals, base_times, steps, step or self.step)
+        future_times = [fut[i * steps:(i + 1) * steps] for i in range(n)]
+        q = np.asarray(quantiles, dtype=np.float64)
+
+        if self.mode == "direct":
+            if steps > self.horizons:
+                raise ValueError(f"Direct model covers {self.horizons} steps, {steps} requested")
+            leaves = forest.predict_trees(self._features(window, hours[:, 0], dows[:, 0],
+                                                         self._origin_state(state, window, np.arange(n))))[:, :, :steps]
+            preds = forest.mean(leaves)
+            preds = preds[:, None] if preds.ndim == 1 else preds
+            return (future_times, preds, leaves.std(axis=0),
+                    np.moveaxis(np.quantile(leaves, q, axis=0), 0, -1))
+
+        rng = np.random.default_rng(seed)
+        n_trees = forest.n_estimators
+        k = len(self.targets)
+        scale = self.scale if self.scale is not None else np.ones(k)
+        preds = np.empty((n, steps, k))
+        std = np.empty((n, steps))
+        bands = np.empty((n, steps, len(q)))
+        # rows: n mean-path windows, then `samples` trajectories per series
+        paths = np.concatenate([window, np.repeat(window, samples, axis=0)])
+        series = np.concatenate([np.arange(n), np.repeat(np.arange(n), samples)])
+        state = self._origin_state(state, window, series)
+        for h in range(steps):
+            # (trees, rows, targets)
+            leaves = forest.predict_trees(self._features(paths, hours[series, h], dows[series, h], state))
+            preds[:, h] = forest.mean(leaves[:, :n]).reshape(n, k) * scale
+            aqi = leaves[:, :, 0] * scale[0]
+            # every tree on every trajectory: a (n, trees * samples) predictive sample
+            spread = aqi[:, n:] if samples else aqi
+            spread = spread.reshape(n_trees, n, max(samples, 1)).transpose(1, 0, 2).reshape(n, -1)
+            std[:, h] = spread.std(axis=1)
+            bands[:, h] = np.quantile(spread, q, axis=1).T
+            # each trajectory continues with one randomly drawn tree's prediction
+            drawn = leaves[rng.integers(0, n_trees, len(paths) - n), np.arange(n, len(paths))] * scale
+            step_vals = np.concatenate([preds[:, h], drawn])
+            step_vals = step_vals if self.joint else step_vals[:, 0]
+            paths = np.concatenate([paths[..., 1:], step_vals[..., None]], axis=-1)
+            if state is not None:
+                state.update(step_vals[:, 0] if self.joint else step_vals)
+        return future_times, (preds if all_targets else preds[:, :, 0]), std, bands
+
+
+_cached = (None, None)
+
+
+def engine_for(model_dict):
+    """ForecastEngine for model_dict, rebuilt only when the registry serves a new model."""
+    global _cached
+    if _cached[0] is not model_dict:
+        _cached = (model_dict, ForecastEngine(model_dict))
+    return _cached[1]
@@ -0,0 +1,183 @@
+# history_query.py
+"""
+Time-range queries over a station's whole history (/api/history).
+
+    /api/history?from=2025-01-01&to=2025-06-30&cols=AQI,pm25&max_points=800
+
+Rows come from a HistoryIndex snapshot (every row, sorted by time), so a
+range is two binary searches and a slice. Each column is downsampled to
+at most max_points points on the server, either with LTTB (Largest
+Triangle Three Buckets, keeps the visual shape of a line) or min/max
+bucketing (keeps every bucket's extremes, for spiky series). The work
+after the searches is linear in the rows in range plus a loop over the
+output points, whatever the length of the history. Rendered bodies are
+kept in an LRU keyed by the slice, so repeated chart loads are a lookup.
+
+Times are given as ISO timestamps (naive ones are in the history's
+timezone) or epoch milliseconds; series times are epoch milliseconds.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_COLS = ("AQI",)
+DEFAULT_MAX_POINTS = int(os.getenv("HISTORY_DEFAULT_POINTS", "1000"))
+MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "5000"))
+METHODS = ("lttb", "minmax")
+RANGE_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "256"))
+
+
+def parse_time(value, tz):
+    """ns since epoch of an ISO timestamp or epoch milliseconds, or None; ValueError if invalid."""
+    if not value:
+        return None
+    if value.lstrip("-").isdigit():
+        return int(value) * 1_000_000
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        ts = pd.NaT
+    if ts is pd.NaT:
+        raise ValueError(f"Invalid time {value!r}; expected ISO 8601 or epoch milliseconds")
+    return (ts.tz_localize(tz) if ts.tz is None else ts).value
+
+
+def parse_query(args, snapshot):
+    """(start, end, cols, max_points, method) from request args; ValueError if invalid."""
+    start = parse_time(args.get("from"), snapshot.tz)
+    end = parse_time(args.get("to"), snapshot.tz)
+    if start is not None and end is not None and start > end:
+        raise ValueError("'from' is after 'to'")
+    cols = tuple(c.strip() for c in (args.get("cols") or "").split(",") if c.strip()) or DEFAULT_COLS
+    unknown = [c for c in cols if c not in snapshot.columns]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    try:
+        max_points = int(args.get("max_points") or DEFAULT_MAX_POINTS)
+    except ValueError:
+        raise ValueError("max_points must be an integer")
+    if not 2 <= max_points <= MAX_POINTS:
+        raise ValueError(f"max_points must be between 2 and {MAX_POINTS}")
+    method = args.get("method") or METHODS[0]
+    if method not in METHODS:
+        raise ValueError(f"Unknown method; supported: {', '.join(METHODS)}")
+    return start, end, tuple(dict.fromkeys(cols)), max_points, method
+
+
+def range_slice(times, start, end):
+    """(lo, hi) so that times[lo:hi] are the rows with start <= time <= end (None: open)."""
+    lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+    hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+    return lo, max(lo, hi)
+
+
+# ---------- downsampling ----------
+
+def lttb(x, y, n):
+    """Indices of the n points Largest Triangle Three Buckets keeps (always the first and last)."""
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1])
+    # buckets of the interior points; bucket i is edges[i]:edges[i + 1]
+    edges = np.floor(np.arange(n - 1) * ((size - 2) / (n - 2))).astype(np.int64) + 1
+    edges[-1] = size - 1
+    cx, cy = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        s, e = edges[i], edges[i + 1]
+        # the third vertex is the average of the next bucket (the last point after the last bucket)
+        ns, ne = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (size - 1, size)
+        avg_x = (cx[ne] - cx[ns]) / (ne - ns)
+        avg_y = (cy[ne] - cy[ns]) / (ne - ns)
+        area = np.abs((x[a] - avg_x) * (y[s:e] - y[a]) - (x[a] - x[s:e]) * (avg_y - y[a]))
+        a = s + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax(y, n):
+    """Indices of the minimum and maximum of each of n // 2 equal-count buckets, in order."""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+    width = -(-size // max(n // 2, 1))
+    buckets = -(-size // width)
+    pad = buckets * width - size
+    lows = np.r_[y, np.full(pad, np.inf)].reshape(buckets, width).argmin(axis=1)
+    highs = np.r_[y, np.full(pad, -np.inf)].reshape(buckets, width).argmax(axis=1)
+    base = np.arange(buckets) * width
+    return np.unique(np.r_[base + lows, base + highs])
+
+
+def downsample(times, values, max_points, method):
+    """(times, values) of one column without its NaNs, reduced to at most max_points."""
+    ok = ~np.isnan(values)
+    times, values = times[ok], values[ok]
+    if len(times) <= max_points:
+        return times, values
+    if method == "minmax":
+        keep = minmax(values, max_points)
+    else:
+        keep = lttb((times - times[0]) / 1e9, values, max_points)
+    return times[keep], values[keep]
+
+
+def render(snapshot, start, end, cols, max_points, method):
+    """History payload for rows in [start, end]: per column, epoch-ms times and values."""
+    lo, hi = range_slice(snapshot.times, start, end)
+    times = snapshot.times[lo:hi]
+    tz = snapshot.tz
+    series = {}
+    for col in cols:
+        t, v = downsample(times, snapshot.column(col)[lo:hi], max_points, method)
+        series[col] = {"t": t // 1_000_000, "v": np.round(v, 2)}
+    return {
+        "from": pd.Timestamp(int(times[0]), tz="UTC").tz_convert(tz).isoformat() if len(times) else None,
+        "to": pd.Timestamp(int(times[-1]), tz="UTC").tz_convert(tz).isoformat() if len(times) else None,
+        "rows": hi - lo,
+        "method": method,
+        "max_points": max_points,
+        "series": series,
+    }
+
+
+class RangeCache:
+    """Small thread-safe LRU of rendered ranges."""
+
+    def __init__(self, size=RANGE_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(station, snapshot, start, end, cols, max_points, method, *extra):
+        """
+        Rows only ever get appended within a generation, so a range is
+        identified by its row slice: newer rows after `to` still hit.
+        """
+        lo, hi = range_slice(snapshot.times, start, end)
+        return (station, snapshot.generation, lo, hi, cols, max_points, method) + extra
+
+    def get(self, key, build):
+        with self._lock:
+            found = self._items.get(key)
+            if found is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return found
+        value = build()
+        with self._lock:
+            self.misses += 1
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
@@ -0,0 +1,326 @@
+# history_store.py
+"""
+In-memory store for the recent rows of cleaned_aqi_dataset.csv.
+The CSV is read once (only its tail), kept as a fixed-size ring buffer of
+numeric rows, and refreshed by parsing just the bytes appended since the
+last read. Per-request cost does not depend on the size of the file.
+HistoryIndex keeps every row instead, for time-range queries (/api/history).
+"""
+import io
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+TIME_COL = "datetimeLocal"
+DEFAULT_CAPACITY = 512
+_generations = itertools.count(1)
+
+
+class HistorySnapshot:
+    """Immutable, time-ordered view of the buffered rows (oldest -> newest)."""
+
+    def __init__(self, columns, times, values, tz, version, total_rows, carried=None):
+        self.columns = columns
+        self.times = times          # int64 ns since epoch (UTC)
+        self.values = values        # float64 (rows, columns)
+        self.tz = tz
+        self.version = version
+        self.total_rows = total_rows
+        # snapshots of one store with equal generation agree on the rows they share
+        self.generation = version
+        self._col_idx = {c: i for i, c in enumerate(columns)}
+        self.memo = {}              # values derived from this snapshot (e.g. resampled lag windows)
+        # state shared by the snapshots of one append-only run of a store (e.g. running rolling
+        # features): their rows only ever grow by total_rows - (rows seen before) at the end
+        self.carried = carried if carried is not None else {}
+        # newest row; unreported (NaN) columns are left out so callers' .get() defaults apply
+        self.latest = ({c: v for c, v in zip(columns, values[-1].tolist()) if v == v}
+                       if len(values) else {})
+
+    def __len__(self):
+        return len(self.values)
+
+    def column(self, col):
+        return self.values[:, self._col_idx[col]]
+
+    def last(self, col, n):
+        return self.column(col)[-n:].tolist()
+
+    def latest_time(self):
+        if not len(self.times):
+            return None
+        return pd.Timestamp(int(self.times[-1]), tz="UTC").tz_convert(self.tz)
+
+    def to_frame(self):
+        df = pd.DataFrame(self.values, columns=self.columns)
+        df.insert(0, TIME_COL, pd.to_datetime(self.times, utc=True).tz_convert(self.tz))
+        return df
+
+
+class HistoryStore:
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, check_interval=1.0):
+        self.path = path
+        self.capacity = capacity
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._header = None
+        self._columns = []
+        self._tz = "UTC"
+        self._ino = None
+        self._mtime = None
+        self._offset = 0
+        self._last_line = b""
+        self._times = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, 0), dtype=np.float64)
+        self._head = 0      # next write position in the ring
+        self._count = 0     # rows currently buffered
+        self._total_rows = 0
+        self._version = 0
+        self._snapshot = None
+        self._carried = {}
+
+    # ---------- parsing ----------
+    def _parse_lines(self, data):
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=self._header)
+        first = pd.Timestamp(frame[TIME_COL].iloc[0])
+        if first.tz is not None:
+            self._tz = str(first.tz)
+        times = pd.to_datetime(frame[TIME_COL], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+        values = np.empty((len(frame), len(self._columns)), dtype=np.float64)
+        for j, c in enumerate(self._columns):
+            values[:, j] = pd.to_numeric(frame[c], errors="coerce").to_numpy(dtype=np.float64)
+        return times, values
+
+    def _append(self, times, values):
+        n = len(times)
+        if n == 0:
+            return
+        if (n > 1 and np.any(np.diff(times) < 0)) or (self._count and times[0] < self._times[(self._head - 1) % self.capacity]):
+            # rows out of time order: what later snapshots hold is no longer an append
+            self._carried = {}
+        if n > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+            n = self.capacity
+        idx = (self._head + np.arange(n)) % self.capacity
+        self._times[idx] = times
+        self._values[idx] = values
+        self._head = (self._head + n) % self.capacity
+        self._count = min(self.capacity, self._count + n)
+
+    def _ordered(self):
+        start = (self._head - self._count) % self.capacity
+        idx = (start + np.arange(self._count)) % self.capacity
+        times, values = self._times[idx], self._values[idx]
+        if self._count > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+        return times, values
+
+    # ---------- file reading ----------
+    @staticmethod
+    def _tail_lines(f, end, n, start):
+        """Return raw bytes of the last n complete lines in f[start:end]."""
+        block = 1 << 16
+        pos = end
+        buf = b""
+        while pos > start and buf.count(b"\n") <= n:
+            read = min(block, pos - start)
+            pos -= read
+            f.seek(pos)
+            buf = f.read(read) + buf
+        lines = buf.split(b"\n")
+        if pos > start:
+            lines = lines[1:]   # first piece may be a partial line
+        return b"\n".join(lines[-(n + 1):])
+
+    def _full_load(self, f, st):
+        self._reset()
+        f.seek(0)   # _unchanged_prefix may have moved the position
+        header_line = f.readline()
+        self._header = header_line.decode("utf-8").strip().split(",")
+        if TIME_COL not in self._header:
+            raise ValueError(f"{TIME_COL} column not found in {self.path}")
+        self._columns = [c for c in self._header if c != TIME_COL]
+        self._ino = st.st_ino
+        self._mtime = st.st_mtime_ns
+        body_start = len(header_line)
+
+        # only complete lines count; a trailing partial line is picked up by a later refresh
+        end = self._last_newline(f, body_start, st.st_size)
+        self._load_rows(f, body_start, end)
+
+    def _load_rows(self, f, body_start, end):
+        """Buffer the newest rows of f[body_start:end] and count all of them."""
+        self._times = np.zeros(self.capacity, dtype=np.int64)
+        self._values = np.full((self.capacity, len(self._columns)), np.nan)
+        data = self._tail_lines(f, end, self.capacity, body_start) if end > body_start else b""
+        self._consume(data, end)
+
+        # total row count, by counting newlines rather than parsing the file
+        f.seek(body_start)
+        remaining = end - body_start
+        while remaining > 0:
+            chunk = f.read(min(1 << 20, remaining))
+            if not chunk:
+                break
+            self._total_rows += chunk.count(b"\n")
+            remaining -= len(chunk)
+
+    @staticmethod
+    def _last_newline(f, start, size):
+        """Offset just past the last newline in f[start:size] (start if there is none)."""
+        pos = size
+        while pos > start:
+            read = min(1 << 16, pos - start)
+            pos -= read
+            f.seek(pos)
+            i = f.read(read).rfind(b"\n")
+            if i >= 0:
+                return pos + i + 1
+        return start
+
+    def _consume(self, data, new_offset):
+        data = data.strip(b"\n")
+        if data:
+            times, values = self._parse_lines(data)
+            self._append(times, values)
+            self._last_line = data.rsplit(b"\n", 1)[-1] + b"\n"
+        self._offset = new_offset
+
+    def _unchanged_prefix(self, f):
+        """The last line we consumed is still where we left it (file was appended, not rewritten)."""
+        if not self._last_line:
+            return True
+        start = self._offset - len(self._last_line)
+        if start < 0:
+            return False
+        f.seek(start)
+        return f.read(len(self._last_line)) == self._last_line
+
+    def refresh(self):
+        """Pick up rows appended since the last read. Returns True if new rows were added."""
+        self._last_check = time.monotonic()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        # same length and mtime: nothing appended (a rewrite of equal length moves the mtime)
+        if (self._header is not None and st.st_ino == self._ino and st.st_size == self._offset
+                and st.st_mtime_ns == self._mtime):
+            return False
+
+        with self._lock:
+            with open(self.path, "rb") as f:
+                if (self._header is None or st.st_ino != self._ino or st.st_size < self._offset
+                        or not self._unchanged_prefix(f)):
+                    self._full_load(f, st)
+                else:
+                    self._mtime = st.st_mtime_ns
+                    f.seek(self._offset)
+                    chunk = f.read(st.st_size - self._offset)
+                    complete = chunk.rfind(b"\n") + 1
+                    if complete == 0:
+                        return False
+                    new_rows = chunk[:complete].count(b"\n")
+                    self._consume(chunk[:complete], self._offset + complete)
+                    self._total_rows += new_rows
+            self._publish()
+            return True
+
+    def _publish(self):
+        self._version += 1
+        times, values = self._ordered()
+        self._snapshot = HistorySnapshot(list(self._columns), times, values, self._tz,
+                                         self._version, self._total_rows, self._carried)
+
+    def push(self, frame, data, start):
+        """
+        Take rows the caller has just appended to the file (`data`, written at
+        byte offset `start`; `frame` holds the same rows) without re-reading
+        them. Falls back to refresh() if the file moved on in between.
+        """
+        with self._lock:
+            st = os.stat(self.path)
+            if (self._header is not None and st.st_ino == self._ino and start == self._offset
+                    and data.endswith(b"\n")):
+                times = pd.to_datetime(frame[TIME_COL], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+                self._append(times, frame.reindex(columns=self._columns).to_numpy(dtype=np.float64))
+                self._last_line = data.rstrip(b"\n").rsplit(b"\n", 1)[-1] + b"\n"
+                self._offset = start + len(data)
+                self._total_rows += len(frame)
+                self._publish()
+                return True
+        return self.refresh()
+
+    def snapshot(self):
+        """Current HistorySnapshot, checking the file for new rows at most every check_interval seconds."""
+        if self._snapshot is None or time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+        return self._snapshot
+
+    def info(self):
+        snap = self._snapshot
+        return {
+            "loaded": snap is not None,
+            "path": os.path.basename(self.path),
+            "buffered_rows": len(snap) if snap is not None else 0,
+            "total_rows": snap.total_rows if snap is not None else 0,
+            "latest": snap.latest_time().isoformat() if snap is not None and len(snap) else None,
+        }
+
+
+class HistoryIndex(HistoryStore):
+    """
+    The whole history of one CSV in time order (for range queries), kept
+    in arrays that grow in place: appended rows are parsed and copied once
+    and published snapshots are views, so a refresh costs O(new rows).
+    """
+
+    def _load_rows(self, f, body_start, end):
+        self._generation = next(_generations)
+        self._times = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, len(self._columns)), dtype=np.float64)
+        f.seek(body_start)
+        self._consume(f.read(end - body_start), end)
+        self._total_rows = self._count
+
+    def _append(self, times, values):
+        n = len(times)
+        if n == 0:
+            return
+        count = self._count
+        if (n > 1 and np.any(np.diff(times) < 0)) or (count and times[0] < self._times[count - 1]):
+            # out-of-order rows: rebuild sorted copies (published views must not change)
+            order = np.argsort(np.concatenate([self._times[:count], times]), kind="stable")
+            self._times = np.concatenate([self._times[:count], times])[order]
+            self._values = np.concatenate([self._values[:count], values])[order]
+            self._generation = next(_generations)
+            self._carried = {}
+            self._count = len(self._times)
+            return
+        if count + n > len(self._times):
+            # geometric growth keeps appends amortized O(new rows)
+            size = max(count + n, 2 * len(self._times), 1024)
+            grown_t = np.empty(size, dtype=np.int64)
+            grown_v = np.full((size, values.shape[1]), np.nan)
+            grown_t[:count], grown_v[:count] = self._times[:count], self._values[:count]
+            self._times, self._values = grown_t, grown_v
+        self._times[count:count + n] = times
+        self._values[count:count + n] = values
+        self._count = count + n
+
+    def _ordered(self):
+        return self._times[:self._count], self._values[:self._count]
+
+    def _publish(self):
+        super()._publish()
+        # appends keep earlier rows in place, so only a reload or re-sort starts a new generation
+        self._snapshot.generation = self._generation
@@ -0,0 +1,253 @@
+# ingest.py
+"""
+Streaming ingestion of raw 15-minute readings into cleaned_aqi_dataset.csv.
+Each batch is validated, gets its CPCB sub-indices (*_sub) and AQI from a
+vectorized breakpoint lookup, and is appended to the station CSV (plus a
+Parquet part file when a columnar copy exists). The same rows are pushed into
+the attached HistoryStores' ring buffers, so the serving process sees the
+new lags immediately, without re-reading the file.
+
+Fed by POST /api/ingest on the server, or from a file:
+
+    python ingest.py readings.csv [cleaned_aqi_dataset.csv]           # one shot
+    python ingest.py --follow readings.csv [cleaned_aqi_dataset.csv]  # tail
+"""
+import argparse
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from columnar_history import columnar_path, has_columnar, mark_source, _arrow
+from history_store import TIME_COL
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, "cleaned_aqi_dataset.csv")
+CADENCE = pd.Timedelta(minutes=15)
+FOLLOW_INTERVAL = 1.0
+
+# (C_lo, C_hi, I_lo, I_hi) per band, as used to build cleaned_aqi_dataset.csv.
+# Concentrations in the gap between two bands get no sub-index; above the
+# top band the sub-index is capped at 500.
+BREAKPOINTS = {
+    "pm25": [(0, 30, 0, 50), (31, 60, 51, 100), (61, 90, 101, 200), (91, 120, 201, 300),
+             (121, 250, 301, 400), (251, 350, 401, 500)],
+    "pm10": [(0, 50, 0, 50), (51, 100, 51, 100), (101, 250, 101, 200), (251, 350, 201, 300),
+             (351, 430, 301, 400), (431, 1000, 401, 500)],
+    "no2": [(0, 40, 0, 50), (41, 80, 51, 100), (81, 180, 101, 200), (181, 280, 201, 300),
+            (281, 400, 301, 400), (401, 1000, 401, 500)],
+    "so2": [(0, 40, 0, 50), (41, 80, 51, 100), (81, 380, 101, 200), (381, 800, 201, 300),
+            (801, 1600, 301, 400), (1601, 2000, 401, 500)],
+    "co": [(0, 1.0, 0, 50), (1.1, 2.0, 51, 100), (2.1, 10, 101, 200), (10.1, 17, 201, 300),
+           (17.1, 34, 301, 400), (34.1, 50, 401, 500)],
+    "o3": [(0, 50, 0, 50), (51, 100, 51, 100), (101, 168, 101, 200), (169, 208, 201, 300),
+           (209, 748, 301, 400), (749, 1000, 401, 500)],
+}
+_TABLES = {p: np.array(b, dtype=np.float64).T for p, b in BREAKPOINTS.items()}
+SUB_COLUMNS = [f"{p}_sub" for p in BREAKPOINTS]
+
+# accepted value ranges for the raw columns (NaN = not reported, allowed)
+RANGES = {
+    "co": (0, 200), "no": (0, 2000), "no2": (0, 2000), "nox": (0, 2000), "o3": (0, 2000),
+    "pm10": (0, 2000), "pm25": (0, 2000), "so2": (0, 4000),
+    "relativehumidity": (0, 100), "temperature": (-50, 60),
+    "wind_direction": (0, 360), "wind_speed": (0, 100),
+}
+RAW_COLUMNS = list(RANGES)
+
+
+def sub_index(pollutant, conc):
+    """Sub-index for an array of concentrations of one pollutant."""
+    c_lo, c_hi, i_lo, i_hi = _TABLES[pollutant]
+    conc = np.asarray(conc, dtype=np.float64)
+    band = np.clip(np.searchsorted(c_lo, conc, side="right") - 1, 0, len(c_lo) - 1)
+    out = i_lo[band] + (conc - c_lo[band]) * (i_hi[band] - i_lo[band]) / (c_hi[band] - c_lo[band])
+    out[conc > c_hi[band]] = np.nan           # between two bands
+    out[conc > c_hi[-1]] = i_hi[-1]           # off the scale
+    out[~(conc >= 0)] = np.nan                # missing or negative
+    return out
+
+
+def indices(columns):
+    """{*_sub: array, "AQI": array} from a mapping of raw pollutant arrays."""
+    out = {f"{p}_sub": sub_index(p, columns[p]) for p in BREAKPOINTS}
+    out["AQI"] = np.fmax.reduce(np.column_stack(list(out.values())), axis=1)
+    return out
+
+
+def add_indices(frame):
+    """Add the *_sub columns and AQI (max sub-index) to a frame of raw readings."""
+    for c, values in indices({p: frame[p].to_numpy(dtype=np.float64) for p in BREAKPOINTS}).items():
+        frame[c] = values
+    return frame
+
+
+def parse_times(raw, tz=None):
+    """
+    UTC DatetimeIndex of raw timestamps (NaT where invalid). Times without
+    an offset are wall-clock times in tz, the history's timezone, as
+    everywhere else in the backend (history_query.parse_time).
+    """
+    tz = tz or "UTC"
+    values = pd.Series(raw)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        times = pd.DatetimeIndex(values)
+        return (times.tz_localize(tz) if times.tz is None else times).tz_convert("UTC")
+    text = values.astype("string")
+    aware = text.str.contains(r"(?:Z|[+-]\d\d:?\d\d)$", regex=True, na=False).to_numpy()
+    out = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+    if aware.any():
+        out[aware] = pd.to_datetime(text[aware], errors="coerce", utc=True, format="ISO8601")
+    if not aware.all():
+        naive = pd.to_datetime(text[~aware], errors="coerce", format="ISO8601")
+        out[~aware] = naive.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT").dt.tz_convert("UTC")
+    return pd.DatetimeIndex(out)
+
+
+def validate(frame, last_time=None, tz=None):
+    """
+    Split raw readings into (valid frame, rejected list).
+    A reading needs a timestamp on the 15-minute grid that is newer than
+    last_time (and unique in the batch), numeric values inside RANGES, and
+    at least one pollutant that yields a sub-index. Timestamps without an
+    offset are local times in tz (the history's timezone).
+    """
+    n = len(frame)
+    reasons = np.full(n, "", dtype=object)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == "")] = reason
+
+    raw_times = frame[TIME_COL].to_numpy() if TIME_COL in frame else np.full(n, None)
+    times = parse_times(raw_times, tz)
+    ns = times.as_unit("ns").asi8
+    missing = times.isna()
+    reject(missing, f"missing or invalid {TIME_COL}")
+    # UTC offsets are whole quarter hours, so the local and UTC 15-minute grids coincide
+    reject(~missing & (ns % CADENCE.value != 0), "timestamp not on the 15-minute grid")
+    if last_time is not None:
+        reject(~missing & (ns <= pd.Timestamp(last_time).value), "not newer than the latest stored reading")
+
+    columns = {}
+    for c, (lo, hi) in RANGES.items():
+        raw = frame[c].to_numpy() if c in frame else np.full(n, np.nan)
+        values = np.asarray(pd.to_numeric(raw, errors="coerce"), dtype=np.float64)
+        reject(np.isnan(values) & ~pd.isna(raw), f"{c} is not numeric")
+        reject((values < lo) | (values > hi), f"{c} outside [{lo}, {hi}]")
+        columns[c] = values
+    columns.update(indices(columns))
+    reject(np.isnan(columns["AQI"]), "no pollutant with a valid sub-index")
+
+    candidates = np.flatnonzero(reasons == "")
+    duplicate = np.zeros(n, dtype=bool)
+    duplicate[candidates[pd.Index(ns[candidates]).duplicated(keep="first")]] = True
+    reject(duplicate, "duplicate timestamp in batch")
+
+    ok = reasons == ""
+    rejected = [{"index": int(i), "reason": reasons[i]} for i in np.flatnonzero(~ok)]
+    order = np.argsort(ns[ok], kind="stable")
+    valid = pd.DataFrame({c: values[ok][order] for c, values in columns.items()})
+    valid.insert(0, TIME_COL, times[ok][order].tz_convert(tz or "UTC"))
+    return valid, rejected
+
+
+class Ingestor:
+    """Appends validated readings to one station's cleaned CSV and pushes them to its stores."""
+
+    def __init__(self, csv_path=DATA_PATH, stores=()):
+        self.csv_path = csv_path
+        self.stores = list(stores)
+        self._lock = threading.Lock()
+        with open(csv_path) as f:
+            self.header = f.readline().strip().split(",")
+        self._last_time, self._tz = self._read_tail()
+        self.stats = {"accepted": 0, "rejected": 0, "batches": 0}
+
+    def _read_tail(self):
+        """Timestamp and tz of the newest row in the CSV."""
+        with open(self.csv_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - (1 << 16)))
+            lines = [line for line in f.read().split(b"\n") if line.strip()]
+        if not lines or lines[-1].startswith(TIME_COL.encode()):
+            return None, "UTC"
+        last = pd.read_csv(io.BytesIO(lines[-1]), header=None, names=self.header)[TIME_COL].iloc[0]
+        last = pd.Timestamp(last)
+        return last, str(last.tz) if last.tz is not None else "UTC"
+
+    def attach(self, store):
+        self.stores.append(store)
+
+    def ingest(self, records):
+        """Validate and append records (list of dicts or a DataFrame). Returns a summary dict."""
+        frame = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+        with self._lock:
+            valid, rejected = validate(frame, self._last_time, self._tz)
+            if len(valid):
+                out, data, start = self._append(valid)
+                self._last_time = valid[TIME_COL].iloc[-1]
+                # hand the new rows straight to the in-memory stores, no re-parse
+                for store in self.stores:
+                    store.push(out, data, start)
+            self.stats["accepted"] += len(valid)
+            self.stats["rejected"] += len(rejected)
+            self.stats["batches"] += 1
+        return {"accepted": len(valid), "rejected": rejected,
+                "latest": self._last_time.isoformat() if self._last_time is not None else None}
+
+    def _append(self, valid):
+        """Append rows to the CSV. Returns (rows in file column order, bytes written, start offset)."""
+        out = valid.reindex(columns=self.header)
+        data = out.to_csv(header=False, index=False, lineterminator="\n").encode("utf-8")
+        # only an up-to-date copy is extended (checked before the CSV changes); it then covers the CSV again
+        columnar = has_columnar(self.csv_path)
+        with open(self.csv_path, "ab") as f:
+            start = f.seek(0, os.SEEK_END)
+            f.write(data)
+        if columnar:
+            self._append_columnar(out)
+            mark_source(self.csv_path)
+        return out, data, start
+
+    def _append_columnar(self, out):
+        pa, ds, pq = _arrow()
+        for month, group in out.groupby(out[TIME_COL].dt.strftime("%Y-%m"), sort=True):
+            month_dir = os.path.join(columnar_path(self.csv_path), f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            name = f"part-ingest-{time.time_ns()}.parquet"
+            pq.write_table(pa.Table.from_pandas(group, preserve_index=False), os.path.join(month_dir, name))
+
+
+def follow(source, ingestor, interval=FOLLOW_INTERVAL, once=False):
+    """Ingest the raw CSV at `source`, then keep ingesting lines appended to it."""
+    offset, header = 0, None
+    while True:
+        with open(source, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+        complete = chunk.rfind(b"\n") + 1
+        if complete:
+            data = chunk[:complete]
+            if header is None:
+                header_line, _, data = data.partition(b"\n")
+                header = header_line.decode("utf-8").strip().split(",")
+            offset += complete
+            if data.strip():
+                frame = pd.read_csv(io.BytesIO(data), header=None, names=header)
+                result = ingestor.ingest(frame)
+                print(f"Ingested {result['accepted']} readings, rejected {len(result['rejected'])}")
+        if once:
+            return
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append raw readings to the cleaned AQI history.")
+    parser.add_argument("source", help="CSV of raw readings (datetimeLocal + pollutant/weather columns)")
+    parser.add_argument("target", nargs="?", default=DATA_PATH, help="cleaned history CSV to append to")
+    parser.add_argument("--follow", action="store_true", help="keep tailing the source file")
+    args = parser.parse_args()
+    follow(args.source, Ingestor(args.target), once=not args.follow)
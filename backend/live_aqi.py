@@ -0,0 +1,293 @@
+# live_aqi.py
+"""
+Live Google Air Quality lookup shared by server.py and streamlit_app_api.py.
+- pooled keep-alive session with hard connect/read timeouts
+- TTL cache keyed by (lat, lon) rounded to a grid, serving stale entries
+  while a background refresh runs (stale-while-revalidate); a failed
+  refresh keeps the stale value and is not retried for ERROR_TTL; at most
+  CACHE_MAX_ENTRIES keys, least recently used dropped first
+- single-flight: concurrent misses for one key trigger one upstream call
+- upstream latency/outcome and cache hit/stale/miss counts go to metrics.py
+An asyncio variant (AsyncLiveAQICache, aiohttp client) backs async_server.py.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from metrics import upstream_seconds, upstream_status, upstream_total
+
+load_dotenv()
+
+GOOGLE_AQI_API_KEY = os.getenv("GOOGLE_AQI_API_KEY")
+GOOGLE_AQI_URL = os.getenv("GOOGLE_AQI_URL", "https://airquality.googleapis.com/v1/currentConditions:lookup")
+CONNECT_TIMEOUT = float(os.getenv("GOOGLE_AQI_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.getenv("GOOGLE_AQI_READ_TIMEOUT", "5"))
+CACHE_TTL = float(os.getenv("GOOGLE_AQI_CACHE_TTL", "300"))
+STALE_TTL = float(os.getenv("GOOGLE_AQI_STALE_TTL", "600"))
+ERROR_TTL = float(os.getenv("GOOGLE_AQI_ERROR_TTL", "30"))
+CACHE_PRECISION = int(os.getenv("GOOGLE_AQI_CACHE_PRECISION", "2"))  # 2 decimals ~ 1 km
+# keys come from client coordinates: bound the memory they can take
+CACHE_MAX_ENTRIES = int(os.getenv("GOOGLE_AQI_CACHE_MAX_ENTRIES", "4096"))
+POOL_SIZE = int(os.getenv("GOOGLE_AQI_POOL_SIZE", "16"))
+ASYNC_POOL_SIZE = int(os.getenv("GOOGLE_AQI_ASYNC_POOL_SIZE", "100"))
+
+DEFAULT_LAT, DEFAULT_LON = 28.6139, 77.2090
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared pooled session; requests is imported on the first lookup, not at startup."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _record_upstream(t0, status):
+    upstream_seconds.observe(time.perf_counter() - t0, status)
+    upstream_total.inc(status)
+
+
+def fetch_google_aqi(lat=DEFAULT_LAT, lon=DEFAULT_LON, url=None, api_key=None):
+    """Fetch live AQI data from Google Air Quality API."""
+    api_key = api_key or GOOGLE_AQI_API_KEY
+    if not api_key:
+        print("Google AQI API Key not found.")
+        return None
+
+    data = {
+        "location": {
+            "latitude": lat,
+            "longitude": lon
+        },
+        "extraComputations": [
+            "POLLUTANT_ADDITIONAL_INFO",
+            "DOMINANT_POLLUTANT_CONCENTRATION",
+            "POLLUTANT_CONCENTRATION",
+            "LOCAL_AQI"
+        ]
+    }
+
+    t0 = time.perf_counter()
+    try:
+        response = get_session().post(url or GOOGLE_AQI_URL, params={"key": api_key}, json=data,
+                                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        response.raise_for_status()
+        body = response.json()
+        _record_upstream(t0, str(response.status_code))
+        return body
+    except Exception as e:
+        _record_upstream(t0, upstream_status(e))
+        print(f"Error fetching Google AQI data: {e}")
+        return None
+
+
+class LiveAQICache:
+    def __init__(self, fetch=fetch_google_aqi, ttl=CACHE_TTL, stale_ttl=STALE_TTL,
+                 error_ttl=ERROR_TTL, precision=CACHE_PRECISION, max_entries=CACHE_MAX_ENTRIES):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.precision = precision
+        self.max_entries = max_entries
+        self.wait_timeout = CONNECT_TIMEOUT + READ_TIMEOUT + 1
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (value, fetched_at), least recently used first
+        self._inflight = {}     # key -> threading.Event
+        self._failed_at = {}    # key -> when a refresh of its stale value last failed
+        self.stats = {"hit": 0, "stale": 0, "miss": 0, "upstream": 0}
+
+    def key(self, lat, lon):
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def _lookup(self, key):
+        """("hit" | "stale" | "miss", value) for key; caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            value, fetched_at = entry
+            now = time.monotonic()
+            age = now - fetched_at
+            if age < (self.ttl if value is not None else self.error_ttl):
+                self.stats["hit"] += 1
+                return "hit", value
+            if value is not None and age < self.ttl + self.stale_ttl:
+                self.stats["stale"] += 1
+                # after a failed refresh the stale value is served without retrying until error_ttl passes
+                failed_at = self._failed_at.get(key)
+                if failed_at is not None and now - failed_at < self.error_ttl:
+                    return "hit", value
+                return "stale", value
+        self.stats["miss"] += 1
+        return "miss", None
+
+    def _store(self, key, value):
+        """Record a refresh result; caller holds the lock."""
+        now = time.monotonic()
+        old = self._entries.get(key)
+        # a failed refresh keeps serving the stale value until its window runs out
+        keep_stale = (value is None and old is not None and old[0] is not None
+                      and now - old[1] < self.ttl + self.stale_ttl)
+        if keep_stale:
+            self._failed_at[key] = now
+        else:
+            self._failed_at.pop(key, None)
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._failed_at.pop(self._entries.popitem(last=False)[0], None)
+
+    def get(self, lat=DEFAULT_LAT, lon=DEFAULT_LON):
+        """Cached upstream response for (lat, lon), or None if the lookup failed."""
+        key = self.key(lat, lon)
+        with self._lock:
+            state, value = self._lookup(key)
+            if state == "hit":
+                return value
+            if state == "stale":
+                if key not in self._inflight:
+                    self._inflight[key] = threading.Event()
+                    threading.Thread(target=self._refresh, args=(key, self._inflight[key]),
+                                     daemon=True).start()
+                return value
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if leader:
+            return self._refresh(key, event)
+        # another request is already fetching this key; wait for its result
+        event.wait(self.wait_timeout)
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def _refresh(self, key, event):
+        value = None
+        try:
+            self.stats["upstream"] += 1
+            value = self._fetch(key[0], key[1])
+        except Exception as e:
+            print(f"Error refreshing live AQI for {key}: {e}")
+        finally:
+            with self._lock:
+                self._store(key, value)
+                self._inflight.pop(key, None)
+                event.set()
+        return value
+
+    def fetched_at(self, lat=DEFAULT_LAT, lon=DEFAULT_LON):
+        """When the cached entry for (lat, lon) was last fetched (None if absent)."""
+        entry = self._entries.get(self.key(lat, lon))
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failed_at.clear()
+
+
+live_aqi_cache = LiveAQICache()
+
+
+# ---------- asyncio variant (used by async_server.py) ----------
+_async_session = None
+
+
+async def get_async_session():
+    """Pooled aiohttp session for the running event loop (aiohttp imported on first use)."""
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        import aiohttp
+        _async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT))
+    return _async_session
+
+
+async def close_async_session():
+    global _async_session
+    if _async_session is not None:
+        await _async_session.close()
+        _async_session = None
+
+
+async def fetch_google_aqi_async(lat=DEFAULT_LAT, lon=DEFAULT_LON, url=None, api_key=None):
+    """Non-blocking fetch_google_aqi."""
+    api_key = api_key or GOOGLE_AQI_API_KEY
+    if not api_key:
+        print("Google AQI API Key not found.")
+        return None
+
+    data = {
+        "location": {"latitude": lat, "longitude": lon},
+        "extraComputations": [
+            "POLLUTANT_ADDITIONAL_INFO",
+            "DOMINANT_POLLUTANT_CONCENTRATION",
+            "POLLUTANT_CONCENTRATION",
+            "LOCAL_AQI"
+        ]
+    }
+    t0 = time.perf_counter()
+    try:
+        session = await get_async_session()
+        async with session.post(url or GOOGLE_AQI_URL, params={"key": api_key}, json=data) as response:
+            response.raise_for_status()
+            body = await response.json()
+            _record_upstream(t0, str(response.status))
+            return body
+    except Exception as e:
+        _record_upstream(t0, upstream_status(e))
+        print(f"Error fetching Google AQI data: {e!r}")
+        return None
+
+
+class AsyncLiveAQICache(LiveAQICache):
+    """Same TTL / stale-while-revalidate rules; single-flight via one asyncio task per key."""
+
+    def __init__(self, fetch=fetch_google_aqi_async, **kwargs):
+        super().__init__(fetch=fetch, **kwargs)
+        self._tasks = {}
+
+    async def get(self, lat=DEFAULT_LAT, lon=DEFAULT_LON):
+        key = self.key(lat, lon)
+        with self._lock:
+            state, value = self._lookup(key)
+        if state == "hit":
+            return value
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(self._refresh_async(key))
+        if state == "stale":
+            return value
+        # shield: one caller being cancelled must not cancel the shared lookup
+        return await asyncio.shield(task)
+
+    async def _refresh_async(self, key):
+        value = None
+        try:
+            self.stats["upstream"] += 1
+            value = await self._fetch(key[0], key[1])
+        except Exception as e:
+            print(f"Error refreshing live AQI for {key}: {e!r}")
+        finally:
+            with self._lock:
+                self._store(key, value)
+            self._tasks.pop(key, None)
+        return value
@@ -0,0 +1,237 @@
+# metrics.py
+"""
+In-process metrics for the serving hot path, rendered at /metrics in the
+Prometheus text exposition format (no client library needed).
+
+- Counter and Histogram keyed by label values; an update is a lock, a
+  bisect over the buckets and two additions, cheap enough to leave on.
+- span(stage) times a block into aqi_stage_seconds{stage=...}, so a slow
+  /api/aqi can be split into model load, history read, live lookup,
+  predict and payload formatting.
+- register_collector() adds values other modules already keep (cache
+  stats, registry versions) at scrape time instead of on every request.
+- SamplingProfiler samples one thread's Python stack at a fixed interval
+  and reports collapsed stacks (flamegraph.pl / speedscope input); the
+  server runs it for a single request when PROFILE_REQUESTS=1 and the
+  request carries ?profile=1.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.002"))
+
+_registry = []
+_collectors = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}       # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *label_values):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, label_values)
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        names = self.labels + ("le",)
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}")
+            lines.append(f'{self.name}_bucket{_labels(names, key + ("+Inf",))} {series[-1]}')
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "t0")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.t0, *self.label_values)
+        return False
+
+
+def register_collector(fn):
+    """fn() -> list of (name, type, help, [(labels dict, value), ...]), called on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """All metrics in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------- hot-path metrics ----------
+request_seconds = Histogram("aqi_request_seconds", "Request handling time by endpoint.", ["endpoint"])
+requests_total = Counter("aqi_requests_total", "Requests by endpoint and status code.", ["endpoint", "status"])
+stage_seconds = Histogram("aqi_stage_seconds", "Time spent in each stage of building an AQI response.", ["stage"])
+upstream_seconds = Histogram("aqi_upstream_seconds", "Google Air Quality API call latency by outcome.", ["status"])
+upstream_total = Counter("aqi_upstream_requests_total", "Google Air Quality API calls by outcome.", ["status"])
+current_source_total = Counter("aqi_current_source_total",
+                               "Payloads whose current reading came from the live API or the CSV fallback.",
+                               ["source"])
+
+
+def cache_families(cache, stats):
+    """Lookup counts and hit ratio of a LiveAQICache-style stats dict, for a collector."""
+    lookups = stats["hit"] + stats["stale"] + stats["miss"]
+    return [
+        ("aqi_cache_lookups_total", "counter", "Cache lookups by result.",
+         [({"cache": cache, "result": r}, stats[r]) for r in ("hit", "stale", "miss")]),
+        ("aqi_cache_hit_ratio", "gauge", "Share of lookups answered from cache (fresh or stale).",
+         [({"cache": cache}, (stats["hit"] + stats["stale"]) / lookups if lookups else 0.0)]),
+    ]
+
+
+def span(stage):
+    """with span("predict"): ... records the block's duration under that stage."""
+    return stage_seconds.time(stage)
+
+
+def upstream_status(exc):
+    """Label for a failed upstream call."""
+    name = type(exc).__name__.lower()
+    if "timeout" in name:
+        return "timeout"
+    status = getattr(getattr(exc, "response", None), "status_code", None) or getattr(exc, "status", None)
+    return str(status) if status else "error"
+
+
+# ---------- sampling profiler ----------
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds from a background thread."""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = None
+        self.seconds = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="aqi-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._t0
+        return self
+
+    def collapsed(self):
+        """One "frame;frame;frame count" line per distinct stack, hottest first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
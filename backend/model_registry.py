@@ -0,0 +1,88 @@
+# model_registry.py
+"""
+Process-lifetime registry for the trained AQI model.
+The artifact (joblib pickle or compact .forest file) is loaded once at
+startup and only reloaded when train_model.py writes a new file
+(mtime/size change, confirmed by hash).
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def joblib_load(path):
+    # imported on use: the compact .forest path never needs joblib/sklearn
+    import joblib
+    return joblib.load(path)
+
+
+class ModelRegistry:
+    def __init__(self, path, check_interval=5.0, loader=joblib_load):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model_dict = None
+        self._version = None
+        self._stat = None
+        self._loaded_at = None
+        self._last_check = 0.0
+
+    def _file_hash(self):
+        h = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()[:12]
+
+    def refresh(self):
+        """Reload the artifact if it changed on disk. Returns True on reload."""
+        self._last_check = time.monotonic()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        sig = (st.st_mtime_ns, st.st_size)
+        if sig == self._stat:
+            return False
+
+        with self._lock:
+            if sig == self._stat:
+                return False
+            version = self._file_hash()
+            if version == self._version:
+                # touched but identical content, nothing to unpickle
+                self._stat = sig
+                return False
+            try:
+                model_dict = self.loader(self.path)
+            except Exception as e:
+                # half-written or corrupt artifact: keep serving the old one
+                print(f"Error loading model {self.path}: {e}")
+                return False
+            self._model_dict = model_dict
+            self._version = version
+            self._stat = sig
+            self._loaded_at = datetime.now()
+            print(f"Loaded model {os.path.basename(self.path)} (version {version})")
+            return True
+
+    def get(self):
+        """Current model dict (or None), checking for a new artifact at most every check_interval seconds."""
+        if self._model_dict is None or time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+        return self._model_dict
+
+    @property
+    def version(self):
+        return self._version
+
+    def info(self):
+        return {
+            "loaded": self._model_dict is not None,
+            "path": os.path.basename(self.path),
+            "version": self._version,
+            "loaded_at": self._loaded_at.isoformat() if self._loaded_at else None,
+        }
@@ -0,0 +1,195 @@
+# model_search.py
+"""
+Model-family and hyperparameter search for the one-step model train_model.py
+serves: by default the joint multi-output model over train_model.TARGETS
+(fitted on targets divided by their training spread, as train_model.main
+does), --targets AQI for the AQI-only model. Candidates are ranked by the
+MAE of their AQI output. Every candidate (random forest grid, XGBoost hist grid when xgboost is
+installed, ridge baseline) is scored with rolling-origin time-series CV:
+each fold trains on all origins before a cut and tests on the block after
+it. All (candidate, fold) fits run in parallel across cores. Afterwards
+each candidate's single-row and batched predict latency is timed the way
+the server would evaluate it (forests through CompactForest).
+
+Selection: lowest CV MAE among candidates within --budget-ms single-row
+latency, or lowest MAE + --latency-weight * latency_ms.
+
+Usage: python model_search.py [--data cleaned_aqi_dataset.csv] [--folds 5] [--targets AQI,pm25,...]
+                              [--budget-ms 2] [--latency-weight 0] [--out results.json]
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from compact_forest import CompactForest, compile_forest
+from features import feature_names
+from train_model import DATA_PATH, LAGS, TARGETS, prepare_df, target_scale
+
+LATENCY_REPEATS = 200
+LATENCY_BATCH = 1000
+
+RF_GRID = {"n_estimators": [50, 100, 200], "max_depth": [None, 12], "min_samples_leaf": [1, 5]}
+XGB_GRID = {"n_estimators": [100, 300], "max_depth": [4, 6], "learning_rate": [0.05, 0.1]}
+RIDGE_GRID = {"alpha": [0.1, 1.0, 10.0]}
+
+
+def has_xgboost():
+    return importlib.util.find_spec("xgboost") is not None
+
+
+def _grid(family, grid):
+    keys = sorted(grid)
+    return [(family, dict(zip(keys, values))) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def candidates():
+    out = _grid("rf", RF_GRID) + _grid("ridge", RIDGE_GRID)
+    if has_xgboost():
+        out += _grid("xgb", XGB_GRID)
+    else:
+        print("xgboost not installed; skipping XGBoost candidates")
+    return out
+
+
+def build(family, params):
+    # one thread per model: parallelism comes from running fits side by side
+    if family == "rf":
+        return RandomForestRegressor(random_state=0, n_jobs=1, **params)
+    if family == "xgb":
+        from xgboost import XGBRegressor
+        return XGBRegressor(tree_method="hist", n_jobs=1, random_state=0, **params)
+    if family == "ridge":
+        return make_pipeline(StandardScaler(), Ridge(**params))
+    raise ValueError(f"Unknown model family {family!r}")
+
+
+def label(family, params):
+    return family + "(" + ", ".join(f"{k}={v}" for k, v in params.items()) + ")"
+
+
+def fit_fold(family, params, X, y, train_idx, test_idx, keep_model=False):
+    """(AQI MAE, fit seconds, model or None); y: (n,) AQI or (n, targets) with AQI first."""
+    model = build(family, params)
+    # joint targets are fitted in units of their spread on the fold's training rows
+    scale = target_scale(y[train_idx]) if y.ndim == 2 else 1.0
+    t0 = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx] / scale)
+    fit_seconds = time.perf_counter() - t0
+    preds = model.predict(X[test_idx]) * scale
+    if y.ndim == 2:
+        return mean_absolute_error(y[test_idx, 0], preds[:, 0]), fit_seconds, model if keep_model else None
+    return mean_absolute_error(y[test_idx], preds), fit_seconds, model if keep_model else None
+
+
+def serving_predict(family, model):
+    """predict() the server would run for this model."""
+    if family == "rf":
+        return CompactForest(compile_forest(model)).predict
+    return model.predict
+
+
+def predict_latency(predict, X):
+    """(median single-row ms, batched µs per row)."""
+    row = X[-1:]
+    predict(row)
+    times = []
+    for _ in range(LATENCY_REPEATS):
+        t0 = time.perf_counter()
+        predict(row)
+        times.append(time.perf_counter() - t0)
+    batch = X[np.arange(LATENCY_BATCH) % len(X)]
+    t0 = time.perf_counter()
+    predict(batch)
+    return float(np.median(times) * 1e3), (time.perf_counter() - t0) / LATENCY_BATCH * 1e6
+
+
+def search(X, y, folds=5, n_jobs=-1):
+    """Cross-validate every candidate; returns one result dict per candidate."""
+    cands = candidates()
+    splits = list(TimeSeriesSplit(n_splits=folds).split(X))
+    jobs = [(c, f) for c in range(len(cands)) for f in range(len(splits))]
+    t0 = time.perf_counter()
+    # the last fold's model (largest training set) is kept for the latency measurement
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(fit_fold)(*cands[c], X, y, *splits[f], keep_model=f == len(splits) - 1) for c, f in jobs)
+    print(f"Cross-validated {len(cands)} candidates x {len(splits)} folds in {time.perf_counter() - t0:.1f}s")
+
+    results = []
+    for c, (family, params) in enumerate(cands):
+        scores = [fitted[j] for j, (cj, _) in enumerate(jobs) if cj == c]
+        maes = [s[0] for s in scores]
+        # latency is timed sequentially so parallel fits don't skew it
+        single_ms, batch_us = predict_latency(serving_predict(family, scores[-1][2]), X)
+        results.append({
+            "family": family, "params": params, "name": label(family, params),
+            "mae": float(np.mean(maes)), "mae_std": float(np.std(maes)), "fold_mae": [float(m) for m in maes],
+            "fit_seconds": float(np.mean([s[1] for s in scores])),
+            "latency_ms": single_ms, "batch_us_per_row": batch_us,
+        })
+    return results
+
+
+def select(results, budget_ms=None, latency_weight=0.0):
+    """Best candidate by MAE (+ latency_weight * latency_ms) among those within budget_ms."""
+    pool = [r for r in results if budget_ms is None or r["latency_ms"] <= budget_ms]
+    if not pool:
+        print(f"No candidate within {budget_ms} ms; ignoring the budget")
+        pool = results
+    return min(pool, key=lambda r: r["mae"] + latency_weight * r["latency_ms"])
+
+
+def main(data_path=DATA_PATH, folds=5, budget_ms=None, latency_weight=0.0, n_jobs=-1, out=None, targets=TARGETS):
+    # AQI is always the first target; only the ones the history records are searched over
+    targets = ["AQI"] + [t for t in targets if t != "AQI"]
+    df = prepare_df(data_path, targets=targets)
+    targets = [t for t in targets if t in df.columns]
+    features = feature_names(LAGS, targets)
+    X = df[features].to_numpy(dtype=np.float64)
+    y = (df[[f"next_{t}" for t in targets]] if len(targets) > 1 else df["target"]).to_numpy(dtype=np.float64)
+    print(f"{len(X)} origins, {len(features)} features, targets: {', '.join(targets)}")
+
+    results = search(X, y, folds=folds, n_jobs=n_jobs)
+    results.sort(key=lambda r: r["mae"])
+    best = select(results, budget_ms, latency_weight)
+
+    print(f"{'candidate':<58} {'CV MAE':>8} {'±':>6} {'fit s':>7} {'1-row ms':>9} {'µs/row':>8}")
+    for r in results:
+        mark = " *" if r is best else ""
+        print(f"{r['name']:<58} {r['mae']:>8.3f} {r['mae_std']:>6.2f} {r['fit_seconds']:>7.2f} "
+              f"{r['latency_ms']:>9.3f} {r['batch_us_per_row']:>8.1f}{mark}")
+    print(f"Selected: {best['name']}")
+
+    if out:
+        with open(out, "w") as f:
+            json.dump({"data": os.path.basename(data_path), "targets": targets, "folds": folds, "budget_ms": budget_ms,
+                       "latency_weight": latency_weight, "features": features,
+                       "selected": best["name"], "results": results}, f, indent=2)
+        print(f"Wrote {out}")
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-series CV search over model families.")
+    parser.add_argument("--data", default=DATA_PATH, help="cleaned history CSV")
+    parser.add_argument("--folds", type=int, default=5, help="rolling-origin CV folds")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help="comma-separated model outputs, as train_model.py --targets (AQI: AQI-only model)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="max single-row predict latency")
+    parser.add_argument("--latency-weight", type=float, default=0.0, help="MAE points per ms of latency")
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel fits (-1 = all cores)")
+    parser.add_argument("--out", default=None, help="write all results to this JSON file")
+    args = parser.parse_args()
+    main(args.data, args.folds, args.budget_ms, args.latency_weight, args.jobs, args.out,
+         [t.strip() for t in args.targets.split(",") if t.strip()])
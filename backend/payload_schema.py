@@ -0,0 +1,214 @@
+# payload_schema.py
+"""
+Wire format of the /api/aqi payload.
+
+- Schema 1 is the payload format_aqi_payload builds (the React app's
+  shape). Schema 2 (?schema=2) is the compact form: the pollutant names,
+  units and colours and the advice texts are sent once as tables; every
+  reading carries only its pollutant values (in the order of the
+  "pollutants" legend) and an index into "advice". The duplicate
+  top-level metrics.pollutants and advice blocks are dropped, trend values
+  are rounded to 0.1 and ranges become [low, high].
+- ?fields=current.val,forecast.time,forecast.val keeps only the listed
+  dotted paths (a path into a list applies to every element), in either
+  schema; "schema" and "location" are always kept.
+- dumps() uses orjson when it is installed (AQI_JSON=json forces the
+  standard library); both write sorted keys, compact separators and UTF-8.
+- negotiate()/encode() pick and apply br (when the brotli package is
+  installed) or gzip from the Accept-Encoding header; bodies under
+  MIN_COMPRESS_BYTES are sent as is.
+"""
+import gzip
+import importlib.util
+import json
+import os
+from functools import lru_cache
+
+SCHEMAS = (1, 2)
+DEFAULT_VIEW = (1, None)
+MIN_COMPRESS_BYTES = int(os.getenv("MIN_COMPRESS_BYTES", "512"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# (name, unit, colour) in the order of every pollutant value list
+POLLUTANTS = (
+    ("PM2.5", "µg/m³", "#3b82f6"),
+    ("PM10", "µg/m³", "#f59e0b"),
+    ("NO2", "ppb", "#10b981"),
+    ("SO2", "ppb", "#eab308"),
+    ("O3", "ppb", "#8b5cf6"),
+    ("CO", "ppm", "#64748b"),
+)
+
+
+def pollutant_list(values):
+    """Schema 1 pollutant entries for values in POLLUTANTS order."""
+    return [{"name": name, "val": val, "unit": unit, "color": color}
+            for (name, unit, color), val in zip(POLLUTANTS, values)]
+
+
+def advice_for(val):
+    return {
+        "activity": "Safe for all outdoor activities" if val <= 50 else "Sensitive groups should limit prolonged exertion" if val <= 100 else "Avoid prolonged outdoor exertion",
+        "mask": "No mask needed" if val <= 100 else "Mask recommended for sensitive groups" if val <= 150 else "N95 mask recommended",
+        "ventilation": "Open windows for fresh air" if val <= 50 else "Keep windows closed during peak traffic",
+    }
+
+
+# ---------- schema 2 ----------
+
+def compact(payload):
+    """Schema 2 form of a schema 1 payload."""
+    advice = []
+
+    def advice_ref(block):
+        if block not in advice:
+            advice.append(block)
+        return advice.index(block)
+
+    def reading(item):
+        out = {k: v for k, v in item.items() if k not in ("metrics", "advice", "range")}
+        out["pollutants"] = [p["val"] for p in item["metrics"]["pollutants"]]
+        out["advice"] = advice_ref(item["advice"])
+        if "range" in item:
+            out["range"] = [item["range"]["low"], item["range"]["high"]]
+        return out
+
+    out = {
+        "schema": 2,
+        "pollutants": [{"name": name, "unit": unit, "color": color} for name, unit, color in POLLUTANTS],
+        "current": reading(payload["current"]),
+        "forecast": [reading(item) for item in payload["forecast"]],
+        "trend": [round(float(v), 1) for v in payload["metrics"]["trend"]],
+        "confidence": payload["confidence"],
+        "advice": advice,
+    }
+    if "location" in payload:
+        out["location"] = payload["location"]
+    return out
+
+
+# ---------- views ----------
+
+def parse_view(schema=None, fields=None):
+    """(schema, fields) of a request from its ?schema= and ?fields= values; ValueError if invalid."""
+    try:
+        schema = int(schema) if schema else 1
+    except ValueError:
+        schema = None
+    if schema not in SCHEMAS:
+        raise ValueError(f"Unknown schema; supported: {', '.join(map(str, SCHEMAS))}")
+    paths = tuple(sorted({f.strip() for f in fields.split(",") if f.strip()})) if fields else ()
+    return schema, paths or None
+
+
+@lru_cache(maxsize=256)
+def _tree(paths):
+    """{"forecast": {"val": True}} from ["forecast.val"]; True keeps the whole value."""
+    tree = {}
+    for path in paths:
+        node = tree
+        *parents, leaf = path.split(".")
+        for part in parents:
+            if node.get(part) is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = True
+    return tree
+
+
+def _select(value, tree):
+    if tree is True:
+        return value
+    if isinstance(value, list):
+        return [_select(v, tree) for v in value]
+    if isinstance(value, dict):
+        return {k: _select(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+
+# always kept: what the payload is and where it is for (batch results)
+KEEP = ("schema", "location")
+
+
+def project(payload, fields):
+    """payload with only the dotted paths in fields (unknown paths are ignored)."""
+    out = _select(payload, _tree(fields))
+    for k in KEEP:
+        if k in payload:
+            out[k] = payload[k]
+    return out
+
+
+def apply_view(payload, schema, fields):
+    if schema == 2:
+        payload = compact(payload)
+    return project(payload, fields) if fields else payload
+
+
+# ---------- serialization ----------
+
+def has_orjson():
+    return importlib.util.find_spec("orjson") is not None
+
+
+def _default(obj):
+    # numpy scalars and arrays
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(payload):
+    return json.dumps(payload, default=_default, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode() + b"\n"
+
+
+def dumps_orjson(payload):
+    import orjson
+    return orjson.dumps(payload, default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                        | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+dumps = dumps_orjson if has_orjson() and os.getenv("AQI_JSON") != "json" else dumps_json
+
+
+# ---------- content coding ----------
+
+def has_brotli():
+    return importlib.util.find_spec("brotli") is not None
+
+
+ENCODINGS = ("br", "gzip") if has_brotli() else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """Preferred supported coding allowed by an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[coding.strip().lower()] = q
+    for coding in ENCODINGS:
+        if offered.get(coding, offered.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def encode(body, coding):
+    """(body, coding actually applied)."""
+    if coding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if coding == "br":
+        import brotli
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
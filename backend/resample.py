@@ -0,0 +1,135 @@
+# resample.py
+"""
+Aggregation of the raw 15-minute readings into the model's time step.
+Readings are grouped into buckets of `cadence` (floored in local wall
+time, labelled by bucket start) and averaged. The buckets are laid on a
+regular grid, so one row is one step for lags and targets. Gaps of up to
+MAX_GAP empty buckets are linearly interpolated. Longer gaps stay NaN, so
+featurization drops the origins whose lags or targets would reach across
+them.
+
+Per-bucket sums and counts are kept, so an aggregated series can be
+extended with newly appended readings (merge) without re-reading the
+history: train_model caches them next to the feature frames, and the
+server resamples only the in-memory tail of each station's history.
+Training uses complete buckets only; serving also uses the newest
+(possibly partial) bucket as the forecast origin.
+
+values may be one column (n,) or several (n, k) (the joint model's
+targets); each column is averaged over its own non-NaN readings.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+RAW_CADENCE = pd.Timedelta(minutes=15)
+CADENCE = pd.Timedelta(os.getenv("AQI_CADENCE", "1h"))
+MAX_GAP = int(os.getenv("AQI_MAX_GAP", "2"))
+
+
+def cadence_minutes(cadence):
+    return None if cadence is None else int(cadence / pd.Timedelta(minutes=1))
+
+
+def from_minutes(minutes):
+    return None if not minutes else pd.Timedelta(minutes=minutes)
+
+
+def aggregate(times, values, cadence):
+    """
+    Sum and count of the non-NaN values per bucket (per column for 2-D values).
+    times: sorted tz-aware DatetimeIndex. Returns (bucket starts, sums, counts).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    ok = ~missing if values.ndim == 1 else ~missing.all(axis=1)
+    times, values, missing = times[ok], values[ok], missing[ok]
+    buckets = pd.DatetimeIndex(times).floor(cadence)
+    if not len(buckets):
+        shape = (0,) + values.shape[1:]
+        return buckets, np.empty(shape), np.empty(shape, dtype=np.int64)
+    ns = buckets.as_unit("ns").asi8
+    starts = np.flatnonzero(np.r_[True, ns[1:] != ns[:-1]])
+    if values.ndim == 1:
+        return buckets[starts], np.add.reduceat(values, starts), np.diff(np.r_[starts, len(ns)])
+    sums = np.add.reduceat(np.where(missing, 0.0, values), starts)
+    return buckets[starts], sums, np.add.reduceat((~missing).astype(np.int64), starts)
+
+
+def merge(old, new):
+    """Combine aggregate() outputs where `new` covers readings after `old`'s."""
+    (b_old, s_old, c_old), (b_new, s_new, c_new) = old, new
+    if not len(b_old):
+        return new
+    if not len(b_new):
+        return old
+    s_old, c_old = s_old.copy(), c_old.copy()
+    if b_new[0] == b_old[-1]:
+        # the first new reading falls into the last (partial) bucket
+        s_old[-1] += s_new[0]
+        c_old[-1] += c_new[0]
+        b_new, s_new, c_new = b_new[1:], s_new[1:], c_new[1:]
+    return b_old.append(b_new), np.concatenate([s_old, s_new]), np.concatenate([c_old, c_new])
+
+
+def fill_gaps(values, max_gap=MAX_GAP):
+    """Linearly interpolate interior NaN runs of at most max_gap values."""
+    values = np.array(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any() or max_gap <= 0:
+        return values
+    edges = np.diff(np.r_[0, missing.astype(np.int8), 0])
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    # per missing value: is its run short and bounded by readings on both sides
+    fill = np.repeat((lengths <= max_gap) & (starts > 0) & (ends < len(values)), lengths)
+    known = np.flatnonzero(~missing)
+    pos = np.flatnonzero(missing)[fill]
+    values[pos] = np.interp(pos, known, values[known])
+    return values
+
+
+def to_grid(aggregated, cadence, max_gap=MAX_GAP, complete_only=False, columns=("AQI",)):
+    """DataFrame (datetime, *columns) on a regular cadence grid from aggregate() output."""
+    buckets, sums, counts = aggregated
+    if complete_only and len(buckets):
+        # the newest bucket may still receive readings
+        buckets, sums, counts = buckets[:-1], sums[:-1], counts[:-1]
+    if not len(buckets):
+        return pd.DataFrame({"datetime": buckets, **{c: np.empty(0) for c in columns}})
+    grid = pd.date_range(buckets[0], buckets[-1], freq=cadence)
+    values = np.full((len(grid),) + sums.shape[1:], np.nan)
+    pos = grid.get_indexer(buckets)
+    ok = pos >= 0  # only DST-shifted buckets fall off the grid
+    # a column with no reading in a bucket stays NaN there
+    values[pos[ok]] = np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)[ok]
+    if values.ndim == 1:
+        return pd.DataFrame({"datetime": grid, columns[0]: fill_gaps(values, max_gap)})
+    return pd.DataFrame({"datetime": grid, **{c: fill_gaps(values[:, j], max_gap) for j, c in enumerate(columns)}})
+
+
+def resample_frame(df, cadence=CADENCE, max_gap=MAX_GAP, complete_only=False, columns=("AQI",)):
+    """(datetime, *columns) frame of raw readings -> the same at `cadence` (None: unchanged)."""
+    columns = list(columns)
+    if cadence is None:
+        return df[["datetime"] + columns].reset_index(drop=True)
+    times = pd.DatetimeIndex(df["datetime"])
+    values = df[columns[0]].to_numpy() if len(columns) == 1 else df[columns].to_numpy(dtype=np.float64)
+    return to_grid(aggregate(times, values, cadence), cadence, max_gap, complete_only, columns)
+
+
+def recent_window(times, values, lags, cadence=CADENCE, max_gap=MAX_GAP):
+    """
+    Last `lags` values at `cadence`, oldest -> newest, ending with the newest
+    (possibly partial) bucket. Buckets left empty by a longer gap are
+    skipped rather than breaking the window. For (n, k) values: the last
+    `lags` buckets with every column present, shape (<= lags, k).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if cadence is not None:
+        columns = list(range(values.shape[1])) if values.ndim == 2 else ["AQI"]
+        grid = to_grid(aggregate(pd.DatetimeIndex(times), values, cadence), cadence, max_gap, columns=columns)
+        values = grid[columns].to_numpy() if values.ndim == 2 else grid["AQI"].to_numpy()
+    present = ~np.isnan(values) if values.ndim == 1 else ~np.isnan(values).any(axis=1)
+    return values[present][-lags:]
@@ -0,0 +1,471 @@
+# rolling.py
+"""
+Rolling-window AQI features, computed in batch with pandas (training,
+prepare_df / build_features) and online from running state (serving and
+the incremental feature cache), with identical results:
+
+    aqi_mean_6, aqi_mean_24   rolling(n, min_periods=1).mean()
+    aqi_std_24                rolling standard deviation (ddof=1, >= 2 values)
+    aqi_ewm_12                ewm(span=12, adjust=False).mean()
+    aqi_delta_1               diff(1)
+
+RollingState keeps the state of n series advanced together (one AQI value
+per series per step) and update() costs O(1) per series, whatever the
+length of the history: a ring of the last values plus Kahan-compensated
+windowed sums, an EWMA and its weight. The arithmetic and its order are
+pandas' own (remove the value leaving the window, then add the new one;
+constant windows return the value itself), so online and batch values are
+bit for bit equal, NaN steps included.
+
+The standard deviation comes from the windowed means of x and x*x rather
+than from pandas' rolling var(): its Welford update has changed between
+pandas releases and is not reproducible step by step, while the windowed
+means are. The price is cancellation in E[x*x] - E[x]^2. Both means are
+within a few ulp, so the variance is within 8 * eps * max(x*x) of the
+window's and aqi_std_24 within STD_ERROR_BOUND * max|x| of
+rolling(24).std(): 4e-5 for AQI values up to 1000, far below a reading's
+resolution, but not for near-constant windows of large values (1e6 +-
+1e-3 has an error of the order of the std itself). verify_backend.py
+checks the bound on the shipped CSV.
+
+FeatureStream feeds a RollingState from raw readings as they arrive,
+bucketing them as resample.py does, so serving keeps each station's state
+current in O(new readings) instead of re-running pandas over the history.
+"""
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+
+from resample import MAX_GAP
+
+# (kind, window) per feature, in column order
+ROLLING = (("mean", 6), ("mean", 24), ("std", 24), ("ewm", 12), ("delta", 1))
+
+
+def rolling_columns(spec=ROLLING):
+    return [f"aqi_{kind}_{size}" for kind, size in spec]
+
+
+ROLLING_COLUMNS = rolling_columns()
+
+# |aqi_std_24 - rolling(24).std()| <= STD_ERROR_BOUND * max|x| over the window
+STD_ERROR_BOUND = math.sqrt(8 * np.finfo(np.float64).eps)
+# weight an EWM may still give to values before the history it was started on
+WARMUP_TOLERANCE = 1e-6
+
+
+def warmup_steps(spec=ROLLING, tolerance=WARMUP_TOLERANCE):
+    """Steps of history after which no feature depends on older values (EWMs: up to `tolerance`)."""
+    steps = 1
+    for kind, size in spec:
+        if kind == "ewm":
+            steps = max(steps, math.ceil(math.log(tolerance) / math.log(1 - 2.0 / (size + 1))))
+        else:
+            steps = max(steps, size + 1)
+    return steps
+
+
+def batch_features(values, spec=ROLLING):
+    """(n, len(spec)) rolling features of every row of a series on the model grid (pandas)."""
+    s = pd.Series(np.asarray(values, dtype=np.float64))
+    out = np.empty((len(s), len(spec)))
+    for j, (kind, size) in enumerate(spec):
+        if kind == "mean":
+            col = s.rolling(size, min_periods=1).mean()
+        elif kind == "std":
+            n = s.rolling(size, min_periods=1).count()
+            m1 = s.rolling(size, min_periods=1).mean()
+            m2 = (s * s).rolling(size, min_periods=1).mean()
+            col = np.sqrt(((m2 - m1 * m1) * (n / (n - 1))).clip(lower=0)).where(n >= 2)
+        elif kind == "ewm":
+            col = s.ewm(span=size, adjust=False).mean()
+        elif kind == "delta":
+            col = s.diff(size)
+        else:
+            raise ValueError(f"Unknown rolling feature {kind!r}")
+        out[:, j] = col.to_numpy(dtype=np.float64)
+    return out
+
+
+class _Part:
+    """Per-series state arrays (leading axis: series) of one running statistic."""
+    fields = ()
+
+    def take(self, idx):
+        part = copy.copy(self)
+        for f in self.fields:
+            setattr(part, f, getattr(self, f)[idx])
+        return part
+
+    @classmethod
+    def concat(cls, parts):
+        part = copy.copy(parts[0])
+        for f in cls.fields:
+            setattr(part, f, np.concatenate([getattr(p, f) for p in parts]))
+        return part
+
+
+class _Window(_Part):
+    """Mean of the last `size` values, as pandas rolling(size, min_periods=1).mean()."""
+    fields = ("ring", "pos", "nobs", "total", "comp_add", "comp_rem", "neg", "same", "prev")
+
+    def __init__(self, n, size):
+        self.size = size
+        self.ring = np.full((n, size), np.nan)   # NaN slots are "no value" and leave nothing to remove
+        self.pos = np.zeros(n, dtype=np.int64)
+        self.nobs = np.zeros(n, dtype=np.int64)
+        self.total = np.zeros(n)
+        self.comp_add = np.zeros(n)
+        self.comp_rem = np.zeros(n)
+        self.neg = np.zeros(n, dtype=np.int64)
+        self.same = np.zeros(n, dtype=np.int64)     # run of equal values ending at the newest
+        self.prev = np.full(n, np.nan)
+
+    def update(self, v):
+        rows = np.arange(len(v))
+        old = self.ring[rows, self.pos]
+        self._remove(old, ~np.isnan(old))
+        self._add(v, ~np.isnan(v))
+        self.ring[rows, self.pos] = v
+        self.pos = (self.pos + 1) % self.size
+
+    def _remove(self, old, ok):
+        y = -old - self.comp_rem
+        t = self.total + y
+        if ok.all():
+            self.comp_rem, self.total = t - self.total - y, t
+        elif ok.any():
+            self.comp_rem = np.where(ok, t - self.total - y, self.comp_rem)
+            self.total = np.where(ok, t, self.total)
+        else:
+            return
+        self.nobs = self.nobs - ok
+        self.neg = self.neg - (ok & np.signbit(old))
+
+    def _add(self, v, ok):
+        y = v - self.comp_add
+        t = self.total + y
+        if ok.all():
+            self.comp_add, self.total = t - self.total - y, t
+            self.same = np.where(v == self.prev, self.same + 1, 1)
+            self.prev = v
+        elif ok.any():
+            self.comp_add = np.where(ok, t - self.total - y, self.comp_add)
+            self.total = np.where(ok, t, self.total)
+            self.same = np.where(ok, np.where(v == self.prev, self.same + 1, 1), self.same)
+            self.prev = np.where(ok, v, self.prev)
+        else:
+            return
+        self.nobs = self.nobs + ok
+        self.neg = self.neg + (ok & np.signbit(v))
+
+    def advance(self, xs):
+        """update() with each value of one series (n == 1) in Python floats, without per-step numpy calls."""
+        ring, pos = self.ring[0].tolist(), int(self.pos[0])
+        nobs, neg, same = int(self.nobs[0]), int(self.neg[0]), int(self.same[0])
+        total, comp_add, comp_rem, prev = (float(self.total[0]), float(self.comp_add[0]),
+                                           float(self.comp_rem[0]), float(self.prev[0]))
+        for v in xs:
+            old = ring[pos]
+            if old == old:
+                y = -old - comp_rem
+                t = total + y
+                comp_rem = t - total - y
+                total = t
+                nobs -= 1
+                neg -= math.copysign(1.0, old) < 0
+            if v == v:
+                y = v - comp_add
+                t = total + y
+                comp_add = t - total - y
+                total = t
+                nobs += 1
+                neg += math.copysign(1.0, v) < 0
+                same = same + 1 if v == prev else 1
+                prev = v
+            ring[pos] = v
+            pos = (pos + 1) % self.size
+        self.ring[0], self.pos[0], self.nobs[0], self.neg[0], self.same[0] = ring, pos, nobs, neg, same
+        self.total[0], self.comp_add[0], self.comp_rem[0], self.prev[0] = total, comp_add, comp_rem, prev
+
+    def value(self):
+        mean = np.divide(self.total, self.nobs, out=np.full(len(self.nobs), np.nan), where=self.nobs > 0)
+        # pandas' checks, in its order: a constant window is its value, a sum of one sign keeps it
+        mean = np.where(((self.neg == 0) & (mean < 0)) | ((self.neg == self.nobs) & (mean > 0)), 0.0, mean)
+        return np.where(self.nobs > 0, np.where(self.same >= self.nobs, self.prev, mean), np.nan)
+
+    def value1(self):
+        """value() of a single series as a float."""
+        nobs = int(self.nobs[0])
+        if nobs <= 0:
+            return math.nan
+        if self.same[0] >= nobs:
+            return float(self.prev[0])
+        mean = float(self.total[0]) / nobs
+        neg = int(self.neg[0])
+        return 0.0 if (neg == 0 and mean < 0) or (neg == nobs and mean > 0) else mean
+
+
+class _Ewm(_Part):
+    """pandas ewm(span=span, adjust=False).mean()."""
+    fields = ("mean", "weight", "nobs", "started")
+
+    def __init__(self, n, span):
+        self.alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+        self.mean = np.full(n, np.nan)
+        self.weight = np.ones(n)
+        self.nobs = np.zeros(n, dtype=np.int64)
+        self.started = np.zeros(n, dtype=bool)
+
+    def update(self, v):
+        ok = ~np.isnan(v)
+        has = ~np.isnan(self.mean) & self.started
+        weight = np.where(has, self.weight * (1.0 - self.alpha), self.weight)
+        blended = (weight * self.mean + self.alpha * v) / (weight + self.alpha)
+        mean = np.where(has & ok & (self.mean != v), blended, self.mean)
+        mean = np.where(~has & ok, v, mean)
+        self.mean = np.where(self.started, mean, v)
+        self.weight = np.where(has & ok, 1.0, weight)
+        self.nobs = self.nobs + ok
+        self.started = np.ones_like(self.started)
+
+    def advance(self, xs):
+        """update() with each value of one series (n == 1) in Python floats."""
+        a, f = self.alpha, 1.0 - self.alpha
+        mean, weight, nobs, started = float(self.mean[0]), float(self.weight[0]), int(self.nobs[0]), bool(self.started[0])
+        for v in xs:
+            if not started:
+                mean, started = v, True
+            elif mean == mean:
+                weight *= f
+                if v == v:
+                    if mean != v:
+                        mean = (weight * mean + a * v) / (weight + a)
+                    weight = 1.0
+            elif v == v:
+                mean = v
+            nobs += v == v
+        self.mean[0], self.weight[0], self.nobs[0], self.started[0] = mean, weight, nobs, started
+
+    def value(self):
+        return np.where(self.nobs > 0, self.mean, np.nan)
+
+    def value1(self):
+        return float(self.mean[0]) if self.nobs[0] > 0 else math.nan
+
+
+class _Delta(_Part):
+    """pandas diff(size)."""
+    fields = ("ring", "pos", "last")
+
+    def __init__(self, n, size):
+        self.size = size
+        self.ring = np.full((n, size), np.nan)
+        self.pos = np.zeros(n, dtype=np.int64)
+        self.last = np.full(n, np.nan)
+
+    def update(self, v):
+        rows = np.arange(len(v))
+        self.last = v - self.ring[rows, self.pos]
+        self.ring[rows, self.pos] = v
+        self.pos = (self.pos + 1) % self.size
+
+    def advance(self, xs):
+        """update() with each value of one series (n == 1) in Python floats."""
+        ring, pos, last = self.ring[0].tolist(), int(self.pos[0]), float(self.last[0])
+        for v in xs:
+            last = v - ring[pos]
+            ring[pos] = v
+            pos = (pos + 1) % self.size
+        self.ring[0], self.pos[0], self.last[0] = ring, pos, last
+
+    def value(self):
+        return self.last
+
+    def value1(self):
+        return float(self.last[0])
+
+
+class RollingState:
+    """Running rolling-feature state of n series, at the newest value each has been fed."""
+
+    def __init__(self, n=1, spec=ROLLING):
+        self.n = n
+        self.spec = tuple(spec)
+        self.columns = rolling_columns(self.spec)
+        # one part per distinct statistic; ("x2", size) is the window of squared values
+        self._parts = {}
+        for kind, size in self.spec:
+            if kind in ("mean", "std"):
+                self._parts[("x", size)] = _Window(n, size)
+            if kind == "std":
+                self._parts[("x2", size)] = _Window(n, size)
+            if kind == "ewm":
+                self._parts[("ewm", size)] = _Ewm(n, size)
+            if kind == "delta":
+                self._parts[("delta", size)] = _Delta(n, size)
+
+    def update(self, values):
+        """Advance every series by one step; values: (n,) AQI (NaN: no value at this step)."""
+        v = np.asarray(values, dtype=np.float64).reshape(self.n)
+        if self.n == 1:
+            # one series (a station's forecast): plain floats cost less than a numpy call per operation
+            x = float(v[0])
+            for (kind, _), part in self._parts.items():
+                part.advance((x * x,) if kind == "x2" else (x,))
+            return self
+        for (kind, _), part in self._parts.items():
+            part.update(v * v if kind == "x2" else v)
+        return self
+
+    def features(self):
+        """(n, len(spec)) features after the newest value."""
+        if self.n == 1:
+            return np.array([self._features1()])
+        out = np.empty((self.n, len(self.spec)))
+        for j, (kind, size) in enumerate(self.spec):
+            if kind == "std":
+                x, x2 = self._parts[("x", size)], self._parts[("x2", size)]
+                m1 = x.value()
+                ddof = np.divide(x.nobs, x.nobs - 1, out=np.full(self.n, np.nan), where=x.nobs >= 2)
+                out[:, j] = np.sqrt(np.maximum((x2.value() - m1 * m1) * ddof, 0))
+            else:
+                out[:, j] = self._parts[("x" if kind == "mean" else kind, size)].value()
+        return out
+
+    def _features1(self):
+        out = []
+        for kind, size in self.spec:
+            if kind == "std":
+                x, x2 = self._parts[("x", size)], self._parts[("x2", size)]
+                nobs, m1 = int(x.nobs[0]), x.value1()
+                out.append(math.sqrt(max((x2.value1() - m1 * m1) * (nobs / (nobs - 1)), 0.0)) if nobs >= 2 else math.nan)
+            else:
+                out.append(self._parts[("x" if kind == "mean" else kind, size)].value1())
+        return out
+
+    def advance(self, values):
+        """update() with each step of (steps,) or (steps, n) values."""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.n)
+        if self.n == 1:
+            # one series (training cache, backtest origins): a plain float loop per statistic
+            xs = values[:, 0]
+            for (kind, _), part in self._parts.items():
+                part.advance((xs * xs if kind == "x2" else xs).tolist())
+            return self
+        for v in values:
+            self.update(v)
+        return self
+
+    def run(self, values):
+        """Feed a series of steps, (steps,) or (steps, n); returns the features after each, (steps, n, len(spec))."""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.n)
+        out = np.empty((len(values), self.n, len(self.spec)))
+        for i, v in enumerate(values):
+            out[i] = self.update(v).features()
+        return out
+
+    def take(self, idx):
+        """State of the series at idx (e.g. np.repeat to branch trajectories)."""
+        idx = np.asarray(idx, dtype=np.int64)
+        state = copy.copy(self)
+        state.n = len(idx)
+        state._parts = {k: p.take(idx) for k, p in self._parts.items()}
+        return state
+
+    def copy(self):
+        return self.take(np.arange(self.n))
+
+    @classmethod
+    def concat(cls, states):
+        """One state holding the series of every state in `states`, in order."""
+        state = copy.copy(states[0])
+        state.n = sum(s.n for s in states)
+        state._parts = {k: type(p).concat([s._parts[k] for s in states]) for k, p in states[0]._parts.items()}
+        return state
+
+    @classmethod
+    def at_rows(cls, values, rows, spec=ROLLING):
+        """State of len(rows) series: one series' state after each of `rows` (ascending indices into values)."""
+        values = np.asarray(values, dtype=np.float64)
+        state, done, states = cls(1, spec), 0, []
+        for r in rows:
+            state.advance(values[done:r + 1])
+            done = r + 1
+            states.append(state.copy())
+        return cls.concat(states) if states else cls(0, spec)
+
+    @classmethod
+    def of_windows(cls, windows, spec=ROLLING):
+        """State after feeding each row of an (n, steps) array of values, oldest -> newest."""
+        windows = np.atleast_2d(np.asarray(windows, dtype=np.float64))
+        return cls(len(windows), spec).advance(windows.T)
+
+
+class FeatureStream:
+    """
+    RollingState of one station fed from its raw readings: readings are
+    averaged per `cadence` bucket (floored in local time) and each bucket
+    is fed once it is complete, with gaps of up to max_gap empty buckets
+    interpolated, as resample.to_grid lays out the training series.
+    origin_state() adds the newest (possibly partial) bucket on a copy, as
+    resample.recent_window serves it. cadence None feeds every reading.
+    """
+
+    def __init__(self, cadence, max_gap=MAX_GAP, spec=ROLLING):
+        self.cadence = cadence
+        self.max_gap = max_gap
+        self.state = RollingState(1, spec)
+        self.rows = 0           # readings consumed (e.g. of a HistorySnapshot's total_rows)
+        self._bucket = None     # start (ns) of the open bucket
+        self._readings = []     # its non-NaN values
+        self._last = None       # (bucket start ns, value) of the newest complete non-empty bucket
+
+    def push(self, times, values):
+        """Consume readings (tz-aware DatetimeIndex, AQI values) newer than any pushed before."""
+        values = np.asarray(values, dtype=np.float64)
+        self.rows += len(values)
+        ok = ~np.isnan(values)
+        if self.cadence is None:
+            self.state.advance(values[ok])
+            return self
+        if not ok.any():
+            return self
+        steps = []
+        buckets = pd.DatetimeIndex(times[ok]).floor(self.cadence).as_unit("ns").asi8
+        for b, v in zip(buckets.tolist(), values[ok].tolist()):
+            if b != self._bucket:
+                if self._bucket is not None:
+                    value = self._mean()
+                    steps += self._steps(self._bucket, value)
+                    self._last = (self._bucket, value)
+                self._bucket, self._readings = b, []
+            self._readings.append(v)
+        self.state.advance(steps)
+        return self
+
+    def _mean(self):
+        # resample.aggregate's per-bucket sum and to_grid's division
+        return np.add.reduceat(np.array(self._readings), [0])[0] / len(self._readings)
+
+    def _steps(self, bucket, value):
+        """Grid values from the last complete bucket up to `bucket` (holding value)."""
+        if self._last is None:
+            return [value]
+        last_bucket, last_value = self._last
+        gap = (bucket - last_bucket) // self.cadence.value - 1
+        if gap <= 0:
+            return [value]
+        if gap > self.max_gap:
+            return [np.nan] * gap + [value]
+        # np.interp between the two neighbours, as resample.fill_gaps does over the grid
+        return np.interp(np.arange(1, gap + 1), [0, gap + 1], [last_value, value]).tolist() + [value]
+
+    def origin_state(self):
+        """State at the newest bucket (a copy; the stream itself only holds complete buckets)."""
+        state = self.state.copy()
+        if self._bucket is not None:
+            state.advance(self._steps(self._bucket, self._mean()))
+        return state
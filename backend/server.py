@@ -1,70 +1,174 @@
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request, Response
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-import joblib
-from datetime import timedelta
+import hashlib
+import hmac
 import os
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from dotenv import load_dotenv
+from model_registry import ModelRegistry
+from live_aqi import fetch_google_aqi, live_aqi_cache, DEFAULT_LAT, DEFAULT_LON
+from snapshot import SnapshotScheduler
+import metrics
+import payload_schema
+from metrics import span
+from payload_schema import advice_for, pollutant_list
+
+# numpy/pandas (and the modules built on them: history_query, stations, ingest,
+# pyarrow, requests, joblib/sklearn on the pickle path) are imported by
+# warm_up() or inside the handlers, not here, so the process can answer
+# /healthz before the heavy imports and model load have finished.
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["ETag", "Last-Modified"])
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "aq_model_aqi_time.joblib")
+FOREST_PATH = os.path.join(BASE_DIR, "aq_model_aqi_time.forest")
 DATA_PATH = os.path.join(BASE_DIR, "cleaned_aqi_dataset.csv")
-GOOGLE_AQI_API_KEY = os.getenv("GOOGLE_AQI_API_KEY")
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "5"))
+HISTORY_CHECK_INTERVAL = float(os.getenv("HISTORY_CHECK_INTERVAL", "1"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "5"))
+BATCH_MAX_LOCATIONS = int(os.getenv("BATCH_MAX_LOCATIONS", "1000"))
+BATCH_FETCH_WORKERS = int(os.getenv("BATCH_FETCH_WORKERS", "16"))
+INGEST_MAX_READINGS = int(os.getenv("INGEST_MAX_READINGS", "10000"))
+# sampled forecast trajectories per location for the uncertainty range (0 = tree spread on the mean path only)
+TRAJECTORIES = int(os.getenv("FORECAST_TRAJECTORIES", "32"))
+BATCH_TRAJECTORIES = int(os.getenv("BATCH_FORECAST_TRAJECTORIES", "0"))
+# POST /api/ingest requires a matching X-Ingest-Token header; without INGEST_TOKEN it refuses every write
+INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+# eager: warm up during import; background: warm up in a thread at import;
+# lazy: warm up on the first request that needs the model
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+
+def load_compact_artifact(path):
+    from compact_forest import load_compact
+    return load_compact(path)
+
+# Loaded once per process; hot-reloads when train_model.py writes a new artifact.
+# The compact array export (no sklearn needed) is preferred over the joblib pickle.
+if os.path.exists(FOREST_PATH):
+    model_registry = ModelRegistry(FOREST_PATH, check_interval=MODEL_CHECK_INTERVAL, loader=load_compact_artifact)
+else:
+    model_registry = ModelRegistry(MODEL_PATH, check_interval=MODEL_CHECK_INTERVAL)
+
+# Recent CSV rows kept in memory per station; only newly appended rows are parsed on refresh.
+# history_store is the default (Delhi) station behind the plain /api/aqi snapshot.
+# history_cache holds rendered /api/history bodies, keyed by station, row slice, query and coding.
+# All three are created by warm_up().
+station_registry = None
+history_store = None
+history_cache = None
+
+# Bounded pool for concurrent upstream lookups in batch requests
+fetch_pool = ThreadPoolExecutor(max_workers=BATCH_FETCH_WORKERS)
+
+_warm_lock = threading.Lock()
+warmup_info = {"done": False, "seconds": None, "error": None}
+
+def warm_up():
+    """Heavy imports, model + history load and one forecast, done once per process."""
+    global station_registry, history_store, history_cache
+    with _warm_lock:
+        if warmup_info["done"]:
+            return
+        t0 = time.perf_counter()
+        try:
+            import pandas as pd
+            import history_query
+            from stations import StationRegistry
+
+            if history_cache is None:
+                history_cache = history_query.RangeCache()
+            if station_registry is None:
+                station_registry = StationRegistry.from_file(default_history=DATA_PATH,
+                                                             check_interval=HISTORY_CHECK_INTERVAL)
+            if history_store is None:
+                history_store = station_registry.store(int(station_registry.nearest([DEFAULT_LAT], [DEFAULT_LON])[0]))
+            history_store.refresh()
+            model_dict = model_registry.get()
+            history = history_store.snapshot()
+            last_vals = lag_window(model_dict, history) if model_dict else None
+            if last_vals is not None:
+                # first predict pays for lazy numpy/pandas/tree setup outside any request
+                run_forecast(model_dict, last_vals, pd.Timestamp.now(), state=rolling_state(model_dict, history))
+        except Exception as e:
+            warmup_info["error"] = str(e)
+            print(f"Warm-up failed: {e}")
+        warmup_info["seconds"] = round(time.perf_counter() - t0, 3)
+        warmup_info["done"] = True
+        print(f"Warm-up finished in {warmup_info['seconds']}s")
+
+def ensure_warm():
+    if not warmup_info["done"]:
+        warm_up()
+
+if STARTUP_MODE == "eager":
+    warm_up()
+elif STARTUP_MODE == "background":
+    threading.Thread(target=warm_up, name="aqi-warmup", daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    g.t0 = time.perf_counter()
+    # one-off stack sampling of this request, returned instead of the response
+    if metrics.PROFILE_REQUESTS and request.args.get("profile") == "1":
+        g.profiler = metrics.SamplingProfiler().start()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.request_seconds.observe(time.perf_counter() - g.t0, endpoint)
+    metrics.requests_total.inc(endpoint, str(response.status_code))
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+        return Response(profiler.collapsed(), mimetype="text/plain",
+                        headers={"X-Profile-Samples": str(profiler.samples),
+                                 "X-Profile-Seconds": f"{profiler.seconds:.6f}"})
+    return response
+
+@metrics.register_collector
+def collect_serving_state():
+    families = metrics.cache_families("live_aqi", dict(live_aqi_cache.stats))
+    history = history_store.snapshot() if history_store is not None else None
+    families += [
+        ("aqi_model_info", "gauge", "Artifact currently served (content hash in the version label).",
+         [({"version": model_registry.version}, 1)] if model_registry.version else []),
+        ("aqi_history_rows", "gauge", "Rows in the default station's history file.",
+         [({}, history.total_rows if history is not None else 0)]),
+        ("aqi_warmup_seconds", "gauge", "Time the startup warm-up took.",
+         [({}, warmup_info["seconds"] or 0)]),
+    ]
+    return families
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/')
 def index():
     return jsonify({"status": "Backend is running"})
 
-def load_model():
-    if os.path.exists(MODEL_PATH):
-        return joblib.load(MODEL_PATH)
-    return None
+@app.route('/healthz')
+def healthz():
+    # liveness only: the process is up and serving requests
+    return jsonify({"status": "ok"})
 
-def make_time_feats(ts):
-    hr = ts.hour
-    sin_h = np.sin(2*np.pi*hr/24.0)
-    cos_h = np.cos(2*np.pi*hr/24.0)
-    dow = ts.weekday()
-    dow_cols = {f"dow_{i}": 1 if i==dow else 0 for i in range(7)}
-    base = {"sin_hour":sin_h, "cos_hour":cos_h}
-    base.update(dow_cols)
-    return base
-
-def fetch_google_aqi(lat=28.6139, lon=77.2090):
-    """Fetch live AQI data from Google Air Quality API."""
-    if not GOOGLE_AQI_API_KEY:
-        print("Google AQI API Key not found.")
-        return None
+@app.route('/readyz')
+def readyz():
+    model_info = model_registry.info()
+    history_info = history_store.info() if history_store is not None else {"loaded": False}
+    ready = warmup_info["done"] and model_info["loaded"] and history_info["loaded"]
+    return jsonify({"ready": ready, "warmup": warmup_info, "model": model_info, "history": history_info}), 200 if ready else 503
 
-    url = f"https://airquality.googleapis.com/v1/currentConditions:lookup?key={GOOGLE_AQI_API_KEY}"
-    data = {
-        "location": {
-            "latitude": lat,
-            "longitude": lon
-        },
-        "extraComputations": [
-            "POLLUTANT_ADDITIONAL_INFO",
-            "DOMINANT_POLLUTANT_CONCENTRATION",
-            "POLLUTANT_CONCENTRATION",
-            "LOCAL_AQI"
-        ]
-    }
-    
-    try:
-        response = requests.post(url, json=data)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching Google AQI data: {e}")
-        return None
+def load_model():
+    return model_registry.get()
 
 def process_google_aqi(api_data):
     """Process Google AQI API response into app format."""
@@ -112,173 +216,534 @@ def process_google_aqi(api_data):
         print(f"Error processing API data: {e}")
         return None
 
-@app.route('/api/aqi', methods=['GET'])
-def get_aqi():
-    try:
-        model_dict = load_model()
-        if not model_dict:
-            return jsonify({"error": "Model not trained"}), 503
+def forecast_confidence(preds, std):
+    """0-100 reliability score: 100 minus the mean tree spread as a percentage of the forecast."""
+    import numpy as np
+    rel = np.asarray(std) / np.maximum(np.asarray(preds), 1.0)
+    return int(round(100 * float(np.clip(1 - rel.mean(), 0, 1))))
 
-        df = pd.read_csv(DATA_PATH, parse_dates=["datetimeLocal"])
-        df = df.sort_values("datetimeLocal")
-        
-        # Get last known values for lags (from CSV)
-        lags = model_dict.get("lags", 6)
-        if len(df) < lags:
-            return jsonify({"error": "Not enough data"}), 500
-            
-        last_vals = df["AQI"].tail(lags).tolist()
-        
-        # --- LIVE DATA FETCHING ---
-        live_data = fetch_google_aqi()
-        processed_live = process_google_aqi(live_data)
-        
-        # Fallback to CSV if live fetch fails
-        if processed_live:
-            current_val = processed_live["val"]
-            current_pm25 = processed_live["pm25"]
-            current_pm10 = processed_live["pm10"]
-            current_no2 = processed_live["no2"]
-            current_so2 = processed_live["so2"]
-            current_o3 = processed_live["o3"]
-            current_co = processed_live["co"]
-            current_status = processed_live["status"]
-            current_color = processed_live["color"]
-            print("Using LIVE Google AQI data")
-        else:
-            current_val = last_vals[-1]
-            current_pm25 = int(current_val) # Approximation
-            current_pm10 = int(df.iloc[-1].get('pm10', 0))
-            current_no2 = int(df.iloc[-1].get('no2', 0))
-            current_so2 = int(df.iloc[-1].get('so2', 0))
-            current_o3 = int(df.iloc[-1].get('o3', 0))
-            current_co = round(df.iloc[-1].get('co', 0), 1)
-            current_status = "Good" if current_val <= 50 else "Moderate" if current_val <= 100 else "Unhealthy"
-            current_color = "#16a34a" if current_val <= 50 else "#f59e0b" if current_val <= 100 else "#ef4444"
-            print("Using CSV fallback data")
-
-        # Predict next 6 hours (using CSV history + model)
-        model = model_dict["model"]
-        features = model_dict["features"]
-        
-        now = pd.Timestamp.now()
-        predictions = []
-        vals = list(last_vals)
-        
-        for h in range(1, 7):
-            fut = now + timedelta(hours=h)
-            tf = make_time_feats(fut)
-            feat = {}
-            for i in range(1, lags+1):
-                feat[f"aqi_lag_{i}"] = vals[-lags + (i-1)]
-            feat.update(tf)
-            
-            # Ensure all features are present
-            Xrow = np.array([feat.get(f, 0.0) for f in features]).reshape(1, -1)
-            pred = float(model.predict(Xrow)[0])
-            
-            # Simulate future variations for other metrics
-            variation = 1.0 + (np.sin(h) * 0.1) # +/- 10% variation
-            
-            pred_pm10 = int(df.iloc[-1].get('pm10', 0) * variation)
-            pred_no2 = int(df.iloc[-1].get('no2', 0) * variation)
-            pred_so2 = int(df.iloc[-1].get('so2', 0) * variation)
-            pred_o3 = int(df.iloc[-1].get('o3', 0) * variation)
-            pred_co = round(df.iloc[-1].get('co', 0) * variation, 1)
-            pred_temp = int(df.iloc[-1].get('temperature', 28) + (h * 0.5)) # Temp rises slightly
-            
-            # Simulate weather variations
-            base_humidity = df.iloc[-1].get('relativehumidity', 65)
-            pred_humidity = int(max(0, min(100, base_humidity - (h * 2)))) # Humidity drops as temp rises
-            
-            base_wind = df.iloc[-1].get('wind_speed', 12)
-            pred_wind = int(max(0, base_wind + (np.sin(h) * 3))) # Wind varies
-            
-            base_wind_dir = df.iloc[-1].get('wind_direction', 0)
-            pred_wind_dir = int((base_wind_dir + (h * 15)) % 360) # Wind direction shifts
-            
-            predictions.append({
-                "time": fut.strftime("%I %p"),
-                "val": int(round(pred)),
-                "label": "Good" if pred <= 50 else "Moderate" if pred <= 100 else "Unhealthy",
-                "color": "#16a34a" if pred <= 50 else "#f59e0b" if pred <= 100 else "#ef4444",
-                "metrics": {
-                    "pollutants": [
-                        {"name": "PM2.5", "val": int(round(pred)), "unit": "µg/m³", "color": "#3b82f6"},
-                        {"name": "PM10", "val": pred_pm10, "unit": "µg/m³", "color": "#f59e0b"},
-                        {"name": "NO2", "val": pred_no2, "unit": "ppb", "color": "#10b981"},
-                        {"name": "SO2", "val": pred_so2, "unit": "ppb", "color": "#eab308"},
-                        {"name": "O3", "val": pred_o3, "unit": "ppb", "color": "#8b5cf6"},
-                        {"name": "CO", "val": pred_co, "unit": "ppm", "color": "#64748b"}
-                    ]
-                },
-                "current": { # Weather details for this hour
-                     "temp": f"{pred_temp}°C",
-                     "humidity": f"{pred_humidity}%",
-                     "wind": f"{pred_wind} km/h",
-                     "wind_dir": pred_wind_dir
-                },
-                "advice": {
-                    "activity": "Safe for all outdoor activities" if pred <= 50 else "Sensitive groups should limit prolonged exertion" if pred <= 100 else "Avoid prolonged outdoor exertion",
-                    "mask": "No mask needed" if pred <= 100 else "Mask recommended for sensitive groups" if pred <= 150 else "N95 mask recommended",
-                    "ventilation": "Open windows for fresh air" if pred <= 50 else "Keep windows closed during peak traffic"
-                }
-            })
-            vals.append(pred)
-
-        # Construct response with all variables
-        response = {
-            "current": {
-                "time": "Now",
-                "val": int(current_val),
-                "pm25": int(current_pm25),
-                "status": current_status,
-                "color": current_color,
-                "recommendation": "Air quality is good. Enjoy outdoor activities!" if current_val <= 50 else "Air quality is acceptable.",
-                "temp": f"{int(df.iloc[-1].get('temperature', 28))}°C",
-                "humidity": f"{int(df.iloc[-1].get('relativehumidity', 65))}%",
-                "wind": f"{int(df.iloc[-1].get('wind_speed', 12))} km/h",
-                "wind_dir": int(df.iloc[-1].get('wind_direction', 0)),
-                "metrics": { # Add metrics to current object for consistent structure
-                    "pollutants": [
-                        {"name": "PM2.5", "val": int(current_pm25), "unit": "µg/m³", "color": "#3b82f6"},
-                        {"name": "PM10", "val": int(current_pm10), "unit": "µg/m³", "color": "#f59e0b"},
-                        {"name": "NO2", "val": int(current_no2), "unit": "ppb", "color": "#10b981"},
-                        {"name": "SO2", "val": int(current_so2), "unit": "ppb", "color": "#eab308"},
-                        {"name": "O3", "val": int(current_o3), "unit": "ppb", "color": "#8b5cf6"},
-                        {"name": "CO", "val": round(current_co, 1), "unit": "ppm", "color": "#64748b"}
-                    ]
-                },
-                "advice": {
-                    "activity": "Safe for all outdoor activities" if current_val <= 50 else "Sensitive groups should limit prolonged exertion" if current_val <= 100 else "Avoid prolonged outdoor exertion",
-                    "mask": "No mask needed" if current_val <= 100 else "Mask recommended for sensitive groups" if current_val <= 150 else "N95 mask recommended",
-                    "ventilation": "Open windows for fresh air" if current_val <= 50 else "Keep windows closed during peak traffic"
-                }
+def lag_window(model_dict, history):
+    """Lag window of a history snapshot at the model's cadence, or None if there is not enough data."""
+    from forecast import engine_for
+    if history is None:
+        return None
+    engine = engine_for(model_dict)
+    window = engine.snapshot_window(history)
+    return window if engine.window_ready(window) else None
+
+def rolling_state(model_dict, history):
+    """RollingState at the origin of a history snapshot, or None if the model has no rolling features."""
+    from forecast import engine_for
+    return engine_for(model_dict).snapshot_state(history)
+
+def run_forecast(model_dict, last_vals, now, samples=TRAJECTORIES, state=None):
+    """
+    (future_times, preds, spread, others): spread = (std, bands) per series,
+    or None for non-forest models; others = {target: (n_series, steps)}
+    for the non-AQI targets of a joint model. state: the series'
+    RollingState (rolling_state()).
+    """
+    from forecast import engine_for
+    engine = engine_for(model_dict)
+    origin = engine.origin(now)
+    if engine.forest is None:
+        future_times, preds = engine.forecast(last_vals, origin, steps=6, all_targets=True, state=state)
+        spread = None
+    else:
+        future_times, preds, std, bands = engine.forecast_distribution(last_vals, origin, steps=6, samples=samples,
+                                                                       all_targets=True, state=state)
+        spread = (std, bands)
+    others = {t: preds[:, :, k] for k, t in enumerate(engine.targets) if k}
+    return future_times, preds[:, :, 0], spread, others
+
+def aqi_lags(model_dict, window):
+    """The AQI row of a lag window, as a list."""
+    from forecast import engine_for
+    return engine_for(model_dict).aqi_window(window).tolist()
+
+def format_aqi_payload(processed_live, last_vals, latest, future_times, preds, spread=None, forecast_metrics=None):
+    """
+    Build the /api/aqi payload for one location from its inputs and forecast.
+    last_vals: the AQI lag window (the trend).
+    spread: (std, bands) of this location's forecast; adds a low/high range
+    per hour and the confidence score.
+    forecast_metrics: {column: per-hour values} from a joint model; columns
+    it does not cover hold their current reading.
+    """
+    import numpy as np
+    # Fallback to CSV if live fetch fails
+    if processed_live:
+        current_val = processed_live["val"]
+        current_pm25 = processed_live["pm25"]
+        current_pm10 = processed_live["pm10"]
+        current_no2 = processed_live["no2"]
+        current_so2 = processed_live["so2"]
+        current_o3 = processed_live["o3"]
+        current_co = processed_live["co"]
+        current_status = processed_live["status"]
+        current_color = processed_live["color"]
+    else:
+        current_val = latest.get('AQI', last_vals[-1])
+        current_pm25 = int(latest.get('pm25', 0))
+        current_pm10 = int(latest.get('pm10', 0))
+        current_no2 = int(latest.get('no2', 0))
+        current_so2 = int(latest.get('so2', 0))
+        current_o3 = int(latest.get('o3', 0))
+        current_co = round(latest.get('co', 0), 1)
+        current_status = "Good" if current_val <= 50 else "Moderate" if current_val <= 100 else "Unhealthy"
+        current_color = "#16a34a" if current_val <= 50 else "#f59e0b" if current_val <= 100 else "#ef4444"
+
+    # Next 6 hours: model forecasts where the artifact has them, else persistence
+    predictions = []
+    vals = list(last_vals) + list(preds)
+    forecast_metrics = forecast_metrics or {}
+
+    def hourly(col, current):
+        values = forecast_metrics.get(col)
+        return list(values) if values is not None else [current] * len(preds)
+
+    pred_pm25, pred_pm10, pred_no2, pred_so2, pred_o3, pred_co = (
+        hourly(col, current) for col, current in zip(
+            ("pm25", "pm10", "no2", "so2", "o3", "co"),
+            (current_pm25, current_pm10, current_no2, current_so2, current_o3, current_co)))
+    pred_temp = hourly("temperature", latest.get('temperature', 28))
+    pred_humidity = hourly("relativehumidity", latest.get('relativehumidity', 65))
+    pred_wind = hourly("wind_speed", latest.get('wind_speed', 12))
+    # not forecast: the direction is circular, the last reading is held
+    pred_wind_dir = int(latest.get('wind_direction', 0))
+
+    for h, (fut, pred) in enumerate(zip(future_times, preds), start=1):
+        i = h - 1
+        item = {
+            "time": fut.strftime("%I %p"),
+            "val": int(round(pred)),
+            "label": "Good" if pred <= 50 else "Moderate" if pred <= 100 else "Unhealthy",
+            "color": "#16a34a" if pred <= 50 else "#f59e0b" if pred <= 100 else "#ef4444",
+            "metrics": {
+                "pollutants": pollutant_list((int(round(pred_pm25[i])), int(round(pred_pm10[i])),
+                                              int(round(pred_no2[i])), int(round(pred_so2[i])),
+                                              int(round(pred_o3[i])), round(float(pred_co[i]), 1)))
             },
-            "forecast": predictions,
-            "confidence": 85,
-            "metrics": { # Keep global metrics for backward compatibility if needed
-                "trend": [v for v in vals[-10:]],
-                "pollutants": [
-                    {"name": "PM2.5", "val": int(current_pm25), "unit": "µg/m³", "color": "#3b82f6"},
-                    {"name": "PM10", "val": int(current_pm10), "unit": "µg/m³", "color": "#f59e0b"},
-                    {"name": "NO2", "val": int(current_no2), "unit": "ppb", "color": "#10b981"},
-                    {"name": "SO2", "val": int(current_so2), "unit": "ppb", "color": "#eab308"},
-                    {"name": "O3", "val": int(current_o3), "unit": "ppb", "color": "#8b5cf6"},
-                    {"name": "CO", "val": round(current_co, 1), "unit": "ppm", "color": "#64748b"}
-                ]
+            "current": { # Weather details for this hour
+                 "temp": f"{int(round(pred_temp[i]))}°C",
+                 "humidity": f"{int(round(min(100, max(0, pred_humidity[i]))))}%",
+                 "wind": f"{int(round(max(0, pred_wind[i])))} km/h",
+                 "wind_dir": pred_wind_dir
             },
-            "advice": {
-                "activity": "Safe for all outdoor activities" if current_val <= 50 else "Sensitive groups should limit prolonged exertion" if current_val <= 100 else "Avoid prolonged outdoor exertion",
-                "mask": "No mask needed" if current_val <= 100 else "Mask recommended for sensitive groups" if current_val <= 150 else "N95 mask recommended",
-                "ventilation": "Open windows for fresh air" if current_val <= 50 else "Keep windows closed during peak traffic"
-            }
+            "advice": advice_for(pred)
         }
-        return jsonify(response)
+        if spread is not None:
+            # 10th-90th percentile of the forest's forecasts for this hour
+            low, high = spread[1][i]
+            item["range"] = {"low": int(round(low)), "high": int(round(high))}
+        predictions.append(item)
 
+    # Construct response with all variables
+    current_pollutants = (int(current_pm25), int(current_pm10), int(current_no2),
+                          int(current_so2), int(current_o3), round(current_co, 1))
+    response = {
+        "current": {
+            "time": "Now",
+            "val": int(current_val),
+            "pm25": int(current_pm25),
+            "status": current_status,
+            "color": current_color,
+            "recommendation": "Air quality is good. Enjoy outdoor activities!" if current_val <= 50 else "Air quality is acceptable.",
+            "temp": f"{int(latest.get('temperature', 28))}°C",
+            "humidity": f"{int(latest.get('relativehumidity', 65))}%",
+            "wind": f"{int(latest.get('wind_speed', 12))} km/h",
+            "wind_dir": int(latest.get('wind_direction', 0)),
+            "metrics": { # Add metrics to current object for consistent structure
+                "pollutants": pollutant_list(current_pollutants)
+            },
+            "advice": advice_for(current_val)
+        },
+        "forecast": predictions,
+        "confidence": forecast_confidence(preds, spread[0]) if spread is not None else None,
+        "metrics": { # Keep global metrics for backward compatibility if needed
+            "trend": [v for v in vals[-10:]],
+            "pollutants": pollutant_list(current_pollutants)
+        },
+        "advice": advice_for(current_val)
+    }
+    return response
+
+def aqi_payload(model_dict, history, live_data, location=None):
+    """Forecast + payload for one location from already-fetched inputs. Returns (payload, status)."""
+    import pandas as pd
+    if history is None:
+        return {"error": "History not loaded"}, 503
+
+    # Last known values for lags (from CSV), resampled to the model's cadence
+    window = lag_window(model_dict, history)
+    if window is None:
+        return {"error": "Not enough data"}, 500
+    processed_live = process_google_aqi(live_data)
+    metrics.current_source_total.inc("live" if processed_live else "csv_fallback")
+
+    # Predict next 6 hours, one batched step per horizon (mean path and sampled trajectories together)
+    now = pd.Timestamp.now()
+    with span("predict"):
+        future_times, preds, spread, others = run_forecast(model_dict, window, now,
+                                                           state=rolling_state(model_dict, history))
+    with span("format"):
+        response = format_aqi_payload(processed_live, aqi_lags(model_dict, window), history.latest, future_times[0],
+                                      preds[0].tolist(), (spread[0][0], spread[1][0]) if spread is not None else None,
+                                      {t: v[0] for t, v in others.items()})
+    if location is not None:
+        response["location"] = location
+    return response, 200
+
+def parse_lat_lon(lat, lon):
+    """
+    (lat, lon) floats from request values, (None, None) if both are
+    absent. ValueError if only one is given, either is not a number
+    (NaN included) or they are outside -90..90 / -180..180.
+    """
+    if lat is None and lon is None:
+        return None, None
+    if lat is None or lon is None:
+        raise ValueError("Both lat and lon are required")
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("lat and lon must be numbers")
+    # NaN fails both comparisons
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat must be within -90..90 and lon within -180..180")
+    return lat, lon
+
+def nearest_station(lat, lon):
+    """Index of the station serving (lat, lon); LookupError if none is within MAX_DISTANCE_KM."""
+    from stations import MAX_DISTANCE_KM
+    station = int(station_registry.nearest([lat], [lon], max_km=MAX_DISTANCE_KM)[0])
+    if station < 0:
+        raise LookupError(f"No monitoring station within {MAX_DISTANCE_KM:g} km of this location")
+    return station
+
+def station_history(lat=None, lon=None):
+    """
+    (station location block or None, history snapshot) serving (lat, lon);
+    default station without lat. LookupError if no station is close enough.
+    """
+    if lat is None:
+        return None, history_store.snapshot()
+    station = nearest_station(lat, lon)
+    location = {"lat": lat, "lon": lon, "station": station_registry.stations[station]["id"]}
+    return location, station_registry.store(station).snapshot()
+
+def build_aqi_response(lat=None, lon=None):
+    """Compute the /api/aqi payload. Returns (payload, status)."""
+    ensure_warm()
+    try:
+        with span("model_load"):
+            model_dict = load_model()
+        if not model_dict:
+            return {"error": "Model not trained"}, 503
+        with span("history"):
+            location, history = station_history(lat, lon)
+        with span("live_lookup"):
+            live_data = live_aqi_cache.get() if lat is None else live_aqi_cache.get(lat, lon)
+        return aqi_payload(model_dict, history, live_data, location)
+
+    except LookupError as e:
+        # out of range: answered before any upstream lookup
+        return {"error": str(e)}, 404
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+def batch_stations(lats, lons):
+    """Nearest station per location, -1 where none is within MAX_DISTANCE_KM."""
+    from stations import MAX_DISTANCE_KM
+    return station_registry.nearest(lats, lons, max_km=MAX_DISTANCE_KM)
+
+def batch_histories(stations):
+    """History snapshot of every station involved."""
+    import numpy as np
+    return {int(i): station_registry.store(int(i)).snapshot() for i in np.unique(stations) if i >= 0}
+
+def batch_live_keys(lats, lons, stations):
+    """Distinct live lookup keys of the locations a station serves (no upstream call for the others)."""
+    return list(dict.fromkeys(live_aqi_cache.key(la, lo) for la, lo, i in zip(lats, lons, stations) if i >= 0))
+
+def batch_payload(model_dict, lats, lons, stations, histories, live_by_key):
+    """Batch response from fetched inputs: one batched forecast over every location with enough history."""
+    import numpy as np
+    import pandas as pd
+    results = [None] * len(lats)
+    ok, windows = [], []
+    for j, i in enumerate(stations.tolist()):
+        if i < 0:
+            from stations import MAX_DISTANCE_KM
+            results[j] = {"error": f"No monitoring station within {MAX_DISTANCE_KM:g} km of this location",
+                          "location": {"lat": lats[j], "lon": lons[j]}}
+            continue
+        window = lag_window(model_dict, histories[i])
+        if window is None:
+            results[j] = {"error": "Not enough data", "location": {"lat": lats[j], "lon": lons[j]}}
+        else:
+            ok.append(j)
+            windows.append(window)
+    if not ok:
+        return {"results": results}, 200
+
+    # one model evaluation per horizon step for every location
+    last_vals = np.array(windows)
+    states = [rolling_state(model_dict, histories[stations[j]]) for j in ok]
+    state = None
+    if states[0] is not None:
+        from rolling import RollingState
+        state = RollingState.concat(states)
+    now = pd.Timestamp.now()
+    with span("predict"):
+        future_times, preds, spread, others = run_forecast(model_dict, last_vals, now, samples=BATCH_TRAJECTORIES,
+                                                           state=state)
+    with span("format"):
+        for row, j in enumerate(ok):
+            history = histories[stations[j]]
+            live = live_by_key[live_aqi_cache.key(lats[j], lons[j])]
+            metrics.current_source_total.inc("live" if live else "csv_fallback")
+            payload = format_aqi_payload(live, aqi_lags(model_dict, last_vals[row]), history.latest, future_times[row],
+                                         preds[row].tolist(), (spread[0][row], spread[1][row]) if spread is not None else None,
+                                         {t: v[row] for t, v in others.items()})
+            payload["location"] = {"lat": lats[j], "lon": lons[j], "station": station_registry.stations[stations[j]]["id"]}
+            results[j] = payload
+    return {"results": results}, 200
+
+def parse_locations(locations):
+    """(lats, lons) arrays of a batch request; ValueError naming the first invalid location."""
+    import numpy as np
+    coords = []
+    for j, loc in enumerate(locations):
+        try:
+            lat, lon = parse_lat_lon(loc.get("lat"), loc.get("lon")) if isinstance(loc, dict) else (None, None)
+        except ValueError as e:
+            raise ValueError(f"Location {j}: {e}")
+        if lat is None:
+            raise ValueError(f"Location {j}: needs numeric 'lat' and 'lon'")
+        coords.append((lat, lon))
+    return np.array([c[0] for c in coords]), np.array([c[1] for c in coords])
+
+def build_aqi_batch(locations):
+    """Payloads for many locations: parallel live lookups, then one batched forecast."""
+    ensure_warm()
+    with span("model_load"):
+        model_dict = load_model()
+    if not model_dict:
+        return {"error": "Model not trained"}, 503
+    lats, lons = parse_locations(locations)
+    stations = batch_stations(lats, lons)
+
+    # bounded-parallel upstream lookups, one per distinct cache key
+    keys = batch_live_keys(lats, lons, stations)
+    with span("live_lookup"):
+        live_by_key = dict(zip(keys, fetch_pool.map(lambda k: process_google_aqi(live_aqi_cache.get(*k)), keys)))
+
+    with span("history"):
+        histories = batch_histories(stations)
+    return batch_payload(model_dict, lats, lons, stations, histories, live_by_key)
+
+def aqi_inputs_token():
+    """Changes whenever a rebuilt response could differ."""
+    from forecast import engine_for
+    ensure_warm()
+    model_dict = model_registry.get()
+    history = history_store.snapshot()
+    live_aqi_cache.get()  # keeps the live entry warm; refreshes it once its TTL runs out
+    return (model_registry.version,
+            history.version if history is not None else None,
+            live_aqi_cache.fetched_at(),
+            # forecast times start at the model step holding now (run_forecast's origin), not the hour
+            engine_for(model_dict).origin(datetime.now()) if model_dict is not None else None)
+
+def serialize_payload(payload, view=payload_schema.DEFAULT_VIEW):
+    """JSON body of an /api/aqi payload in view = (schema, fields)."""
+    with span("serialize"):
+        return payload_schema.dumps(payload_schema.apply_view(payload, *view))
+
+def request_view(args):
+    """(schema, fields) from ?schema= and ?fields=; ValueError for an unknown schema."""
+    return payload_schema.parse_view(args.get("schema"), args.get("fields"))
+
+def aqi_body(payload, status, view, coding):
+    """(body, coding) of a computed payload; error payloads ignore the view."""
+    if status != 200:
+        view = payload_schema.DEFAULT_VIEW
+    return payload_schema.encode(serialize_payload(payload, view), coding)
+
+def snapshot_body(snap, view, coding):
+    """(body, coding, etag) of the snapshot in a view, built once per snapshot."""
+    if snap.status != 200:
+        return snap.body, None, snap.etag
+    def build():
+        body = snap.body if view == payload_schema.DEFAULT_VIEW else serialize_payload(snap.payload, view)
+        return payload_schema.encode(body, coding)
+    return snap.variant((view, coding), build)
+
+def batch_body(payload, status, view, coding):
+    """(body, coding) of a batch response, the view applied to every location's payload."""
+    if status == 200 and view != payload_schema.DEFAULT_VIEW:
+        payload = {"results": [r if "error" in r else payload_schema.apply_view(r, *view)
+                               for r in payload["results"]]}
+    with span("serialize"):
+        return payload_schema.encode(payload_schema.dumps(payload), coding)
+
+def encoded_response(body, status, coding):
+    resp = Response(body, status=status, mimetype="application/json")
+    if coding:
+        resp.headers["Content-Encoding"] = coding
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+aqi_snapshot = SnapshotScheduler(build_aqi_response, serialize_payload, aqi_inputs_token, interval=SNAPSHOT_INTERVAL)
+
+def history_station(args):
+    """Station index for ?station= or ?lat=&lon=, the default station without either."""
+    station_id = args.get("station")
+    if station_id:
+        station = station_registry.index(station_id)
+        if station is None:
+            raise LookupError(f"Unknown station {station_id!r}")
+        return station
+    lat, lon = parse_lat_lon(args.get("lat"), args.get("lon"))
+    if lat is None:
+        lat, lon = DEFAULT_LAT, DEFAULT_LON
+    return nearest_station(lat, lon)
+
+def history_body(args, coding):
+    """
+    (body, coding, etag) of /api/history for the request args. ValueError
+    for invalid arguments, LookupError for an unknown station, no station near
+    lat/lon or missing history.
+    """
+    import history_query
+
+    ensure_warm()
+    station = history_station(args)
+    with span("history"):
+        snapshot = station_registry.history_index(station).snapshot()
+    if snapshot is None:
+        raise LookupError("No history for this station")
+    query = history_query.parse_query(args, snapshot)
+
+    def build():
+        with span("history_range"):
+            payload = history_query.render(snapshot, *query)
+        payload["station"] = station_registry.stations[station]["id"]
+        with span("serialize"):
+            body, applied = payload_schema.encode(payload_schema.dumps(payload), coding)
+        return body, applied, hashlib.sha1(body).hexdigest()
+
+    return history_cache.get(history_cache.key(station, snapshot, *query, coding), build)
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    coding = payload_schema.negotiate(request.headers.get("Accept-Encoding"))
+    try:
+        body, applied, etag = history_body(request.args, coding)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    resp = encoded_response(body, 200, applied)
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+@app.route('/api/aqi', methods=['GET'])
+def get_aqi():
+    try:
+        view = request_view(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    coding = payload_schema.negotiate(request.headers.get("Accept-Encoding"))
+    try:
+        lat, lon = parse_lat_lon(request.args.get("lat"), request.args.get("lon"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if lat is not None:
+        payload, status = build_aqi_response(lat, lon)
+        body, applied = aqi_body(payload, status, view, coding)
+        return encoded_response(body, status, applied)
+
+    aqi_snapshot.start()
+    snap = aqi_snapshot.current()
+    body, applied, etag = snapshot_body(snap, view, coding)
+    resp = encoded_response(body, snap.status, applied)
+    if snap.status == 200:
+        resp.set_etag(etag)
+        resp.last_modified = snap.last_modified
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
+    return resp
+
+# one Ingestor per station, appending to its CSV and pushing into its HistoryStore
+ingestors = {}
+_ingest_lock = threading.Lock()
+
+def ingestor_for(station):
+    from ingest import Ingestor
+    with _ingest_lock:
+        ingestor = ingestors.get(station)
+        if ingestor is None:
+            ingestor = ingestors[station] = Ingestor(station_registry.history_path(station),
+                                                     [station_registry.store(station)])
+        return ingestor
+
+def ingest_readings(readings, station_id=None):
+    """Append raw readings to a station's history. Returns (payload, status)."""
+    ensure_warm()
+    station = (int(station_registry.nearest([DEFAULT_LAT], [DEFAULT_LON])[0]) if station_id is None
+               else station_registry.index(station_id))
+    if station is None:
+        return {"error": f"Unknown station {station_id!r}"}, 404
+    result = ingestor_for(station).ingest(readings)
+    if result["accepted"] and station_registry.store(station) is history_store:
+        aqi_snapshot.tick()  # serve the new lags right away instead of at the next poll
+    result["station"] = station_registry.stations[station]["id"]
+    return result, 200
+
+def ingest_denied(token):
+    """Error message if a request with this X-Ingest-Token may not write, else None."""
+    if not INGEST_TOKEN:
+        return "Ingestion is disabled (INGEST_TOKEN is not set)"
+    if not hmac.compare_digest((token or "").encode(), INGEST_TOKEN.encode()):
+        return "Invalid ingest token"
+    return None
+
+@app.route('/api/ingest', methods=['POST'])
+def post_ingest():
+    denied = ingest_denied(request.headers.get("X-Ingest-Token"))
+    if denied:
+        return jsonify({"error": denied}), 403
+    body = request.get_json(silent=True) or {}
+    readings = body.get("readings")
+    if not isinstance(readings, list) or not readings or not all(isinstance(r, dict) for r in readings):
+        return jsonify({"error": "Expected a non-empty 'readings' list of objects"}), 400
+    if len(readings) > INGEST_MAX_READINGS:
+        return jsonify({"error": f"At most {INGEST_MAX_READINGS} readings per request"}), 400
+    payload, status = ingest_readings(readings, body.get("station"))
+    return jsonify(payload), status
+
+@app.route('/api/aqi/batch', methods=['POST'])
+def get_aqi_batch():
+    try:
+        view = request_view(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    body = request.get_json(silent=True) or {}
+    locations = body.get("locations")
+    if not isinstance(locations, list) or not locations:
+        return jsonify({"error": "Expected a non-empty 'locations' list"}), 400
+    if len(locations) > BATCH_MAX_LOCATIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_LOCATIONS} locations per request"}), 400
+    try:
+        payload, status = build_aqi_batch(locations)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    wire, applied = batch_body(payload, status, view, payload_schema.negotiate(request.headers.get("Accept-Encoding")))
+    return encoded_response(wire, status, applied)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -0,0 +1,91 @@
+# snapshot.py
+"""
+Precomputed /api/aqi response kept in memory.
+A background thread polls cheap change tokens (new history rows, new
+model version, refreshed live lookup, hour rollover) and rebuilds the
+response only when one of them changes. The serialized body, its ETag
+and Last-Modified time are swapped in as a single object, so a request
+is a plain attribute read. Other renderings of the same payload (schema,
+field projection, compression) are built on first request and kept on
+the snapshot they came from.
+"""
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+
+class ResponseSnapshot:
+    def __init__(self, body, status, token, payload=None):
+        self.body = body
+        self.status = status
+        self.token = token
+        self.payload = payload
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._variants = {}
+
+    def variant(self, key, build):
+        """(body, coding, etag) for key, from build() -> (body, coding) on first use."""
+        found = self._variants.get(key)
+        if found is None:
+            body, coding = build()
+            found = self._variants[key] = (body, coding, hashlib.sha1(body).hexdigest())
+        return found
+
+
+class SnapshotScheduler:
+    def __init__(self, compute, serialize, token, interval=5.0):
+        """
+        compute() -> (payload, status); serialize(payload) -> bytes;
+        token() -> hashable value that changes whenever the inputs do.
+        """
+        self._compute = compute
+        self._serialize = serialize
+        self._token = token
+        self.interval = interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def rebuild(self, token=None):
+        """Recompute the response and swap it in."""
+        with self._lock:
+            token = self._token() if token is None else token
+            payload, status = self._compute()
+            self._snapshot = ResponseSnapshot(self._serialize(payload), status, token, payload)
+            return self._snapshot
+
+    def tick(self):
+        """Rebuild if any input changed since the current snapshot."""
+        token = self._token()
+        snap = self._snapshot
+        if snap is None or snap.token != token:
+            return self.rebuild(token)
+        return snap
+
+    def current(self):
+        snap = self._snapshot
+        if snap is None:
+            snap = self.tick()
+        return snap
+
+    def peek(self):
+        """The published snapshot, or None before the first build (never blocks)."""
+        return self._snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Snapshot refresh failed: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="aqi-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,94 @@
+# stations.py
+"""
+Monitoring stations and their per-station history.
+Stations are listed in stations.json next to this file:
+
+    [{"id": "delhi", "name": "New Delhi", "lat": 28.6139, "lon": 77.2090,
+      "history": "cleaned_aqi_dataset.csv"}, ...]
+
+(history paths are relative to this directory, one cleaned CSV per
+station; a converted .parquet copy of it is preferred). Without
+stations.json a single default station backed by cleaned_aqi_dataset.csv
+is used. Requests are served by the nearest station to the requested
+(lat, lon), if one is within MAX_DISTANCE_KM of it.
+"""
+import json
+import os
+
+import numpy as np
+
+from columnar_history import open_history_index, open_history_store
+from live_aqi import DEFAULT_LAT, DEFAULT_LON
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIONS_PATH = os.path.join(BASE_DIR, "stations.json")
+DEFAULT_STATION = {"id": "delhi", "name": "New Delhi", "lat": DEFAULT_LAT, "lon": DEFAULT_LON,
+                   "history": "cleaned_aqi_dataset.csv"}
+EARTH_RADIUS_KM = 6371.0
+# farther than this from every station, a location has no forecast (rather than a distant station's)
+MAX_DISTANCE_KM = float(os.getenv("STATION_MAX_DISTANCE_KM", "100"))
+
+
+class StationRegistry:
+    def __init__(self, stations, check_interval=1.0):
+        self.stations = stations
+        self.check_interval = check_interval
+        self._lat = np.radians([s["lat"] for s in stations])
+        self._lon = np.radians([s["lon"] for s in stations])
+        self._stores = {}
+        self._indexes = {}
+
+    @classmethod
+    def from_file(cls, path=STATIONS_PATH, default_history=None, check_interval=1.0):
+        if os.path.exists(path):
+            with open(path) as f:
+                stations = json.load(f)
+        else:
+            stations = [dict(DEFAULT_STATION)]
+            if default_history:
+                stations[0]["history"] = default_history
+        return cls(stations, check_interval=check_interval)
+
+    def nearest(self, lats, lons, max_km=None):
+        """
+        Index of the nearest station for each (lat, lon), by haversine
+        distance; -1 where even that one is farther than max_km.
+        """
+        lat = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+        lon = np.radians(np.asarray(lons, dtype=np.float64))[:, None]
+        a = (np.sin((self._lat - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(self._lat) * np.sin((self._lon - lon) / 2) ** 2)
+        dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        idx = dist.argmin(axis=1)
+        if max_km is not None:
+            idx[dist[np.arange(len(idx)), idx] > max_km] = -1
+        return idx
+
+    def index(self, station_id):
+        """Index of the station with this id, or None."""
+        for i, s in enumerate(self.stations):
+            if s["id"] == station_id:
+                return i
+        return None
+
+    def history_path(self, i):
+        return os.path.join(BASE_DIR, self.stations[i]["history"])
+
+    def store(self, i):
+        """HistoryStore of station i, created on first use."""
+        store = self._stores.get(i)
+        if store is None:
+            store = self._stores.setdefault(i, open_history_store(self.history_path(i),
+                                                                  check_interval=self.check_interval))
+        return store
+
+    def history_index(self, i):
+        """Every row of station i's history (HistoryIndex), created on first use."""
+        index = self._indexes.get(i)
+        if index is None:
+            index = self._indexes.setdefault(i, open_history_index(self.history_path(i),
+                                                                   check_interval=self.check_interval))
+        return index
+
+    def add_store(self, i, store):
+        self._stores[i] = store
@@ -3,24 +3,31 @@
 Prediction-only version with Outdoor Activity Planning & Warnings
 - Keeps same filename
 - Loads cleaned_aqi_dataset.csv (or fallback /mnt/data/cleaned_aqi_dataset.csv)
-- Loads time-aware AQI model (aq_model_aqi_time.joblib preferred)
+- Loads time-aware AQI model (aq_model_aqi_time.forest / .joblib preferred)
 - Uses current IST time as prediction base
 - Shows next 3-hour AQI predictions only
 - Adds per-hour activity advice, mask recommendations and overall warnings
 - INTEGRATES GOOGLE AQI API FOR LIVE DATA
+- Streamlit reruns this script on every interaction: the model is a
+  process-wide cached resource (reloaded when the file changes), history,
+  live lookup and forecast are cached data with TTLs, and the charts are
+  Vega-Lite specs (dashboard_charts.py) memoized by their content and
+  drawn in the browser
+- Pollutant charts cover a selectable range of the whole history, sliced
+  from an in-memory index and downsampled to CHART_POINTS (history_query.py)
 """
 
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
 from pathlib import Path
-from datetime import timedelta
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import requests
 import os
 from dotenv import load_dotenv
+import dashboard_charts as charts
+from live_aqi import live_aqi_cache
+from forecast import engine_for
+from columnar_history import load_history_frame, open_history_index
+import history_query
 
 # Load environment variables
 load_dotenv()
@@ -30,13 +37,21 @@ BASE_DIR = Path(__file__).resolve().parent
 LOCAL_CLEANED = BASE_DIR / "cleaned_aqi_dataset.csv"
 FALLBACK_CLEANED = Path("/mnt/data/cleaned_aqi_dataset.csv")   # session fallback (use this path if you need direct download)
 MODEL_ORDER = [
+    BASE_DIR / "aq_model_aqi_time.forest",   # compact export of the joblib below, no sklearn needed
     BASE_DIR / "aq_model_aqi_time.joblib",
     BASE_DIR / "aq_model_time.joblib",
     BASE_DIR / "aq_model.joblib",
     BASE_DIR / "aq_model_rf.joblib"
 ]
 PRED_STEPS = 3
-GOOGLE_AQI_API_KEY = os.getenv("GOOGLE_AQI_API_KEY")
+HISTORY_ROWS = 96   # at least one day of raw 15-minute readings, for the 24-row charts; more when the
+                    # model's lags and rolling-feature warm-up need them (ForecastEngine.history_rows)
+HISTORY_TTL = float(os.getenv("DASHBOARD_HISTORY_TTL", "60"))   # seconds a history read is reused
+LIVE_TTL = float(os.getenv("DASHBOARD_LIVE_TTL", "60"))         # seconds a live reading is reused
+CHART_CACHE_ENTRIES = 256
+CHART_POINTS = 300  # per pollutant chart, whatever the range
+CHART_RANGES = {"Last 6 hours": pd.Timedelta(hours=6), "Last 7 days": pd.Timedelta(days=7),
+                "Last 30 days": pd.Timedelta(days=30), "All": None}
 # ----------------------------
 
 st.set_page_config(page_title="AQI Nowcast — Predictions only", layout="wide")
@@ -46,32 +61,89 @@ st.markdown(f"**Data source:** `{FALLBACK_CLEANED}`  — [Download cleaned AQI d
 st.markdown("---")
 
 # ---------- Helpers ----------
-def load_cleaned():
-    if LOCAL_CLEANED.exists():
-        p = LOCAL_CLEANED
-    elif FALLBACK_CLEANED.exists():
-        p = FALLBACK_CLEANED
-    else:
-        st.error("Cleaned AQI dataset not found. Place `cleaned_aqi_dataset.csv` in project folder or at `/mnt/data/cleaned_aqi_dataset.csv`.")
-        st.stop()
-    df = pd.read_csv(p, parse_dates=["datetimeLocal"])
+# Cached functions are keyed by the file's mtime as well, so an appended
+# history or a retrained model is picked up on the next rerun after it lands.
+
+@st.cache_data(ttl=HISTORY_TTL, max_entries=4, show_spinner=False)
+def read_history(path, mtime, rows=HISTORY_ROWS):
+    # only the newest rows are shown; Parquet history (if converted) is read tail-first
+    df = load_history_frame(path, tail=rows)
     df = df.rename(columns={"datetimeLocal":"datetime"}).sort_values("datetime").reset_index(drop=True)
     # ensure numeric
     for c in ["AQI","pm25","pm10","no2","so2","o3","co","nh3"]:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
-    st.caption(f"Data loaded from: `{p}`")
     return df
 
+def cleaned_path():
+    if LOCAL_CLEANED.exists():
+        return LOCAL_CLEANED
+    if FALLBACK_CLEANED.exists():
+        return FALLBACK_CLEANED
+    st.error("Cleaned AQI dataset not found. Place `cleaned_aqi_dataset.csv` in project folder or at `/mnt/data/cleaned_aqi_dataset.csv`.")
+    st.stop()
+
+def load_cleaned(rows=HISTORY_ROWS):
+    p = cleaned_path()
+    st.caption(f"Data loaded from: `{p}`")
+    return read_history(str(p), p.stat().st_mtime, rows)
+
+@st.cache_resource(max_entries=2, show_spinner="Indexing history...")
+def history_index(path):
+    """Every row of the history, shared by all sessions; appended rows are read incrementally."""
+    return open_history_index(path, check_interval=HISTORY_TTL)
+
+@st.cache_resource(show_spinner=False)
+def range_cache():
+    return history_query.RangeCache()
+
+def history_range(path, span, cols):
+    """(render() payload, tz) of the last `span` of the history (None: all of it)."""
+    snapshot = history_index(path).snapshot()
+    end = int(snapshot.times[-1])
+    query = (None if span is None else end - span.value, end, cols, CHART_POINTS, "lttb")
+    cache = range_cache()
+    return cache.get(cache.key(path, snapshot, *query), lambda: history_query.render(snapshot, *query)), snapshot.tz
+
+@st.cache_resource(max_entries=2, show_spinner="Loading model...")
+def load_model_artifact(path, mtime):
+    """One copy per process, shared by every session."""
+    if path.endswith(".forest"):
+        from compact_forest import load_compact
+        return load_compact(path)
+    import joblib
+    return joblib.load(path)
+
 def load_model():
+    """(model_dict, version key)."""
     for name in MODEL_ORDER:
         if Path(name).exists():
-            model_dict = joblib.load(name)
+            version = (str(name), Path(name).stat().st_mtime)
             st.caption(f"Loaded model: `{name}`")
-            return model_dict
+            return load_model_artifact(*version), version
     st.warning("No model file found. Place `aq_model_aqi_time.joblib` in the folder or train the model.")
     st.stop()
 
+@st.cache_data(ttl=LIVE_TTL, show_spinner=False)
+def live_reading():
+    # live_aqi_cache bounds the upstream calls per process; this skips even the lookup on reruns
+    return process_google_aqi(live_aqi_cache.get())
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def forecast_for(version, last_vals, rolling, origin, steps, _model_dict, _state):
+    """
+    [(time, AQI)] for steps ahead; the same inputs give the same forecast in
+    every session. rolling: the rolling features at the origin, which with
+    last_vals identify the history _state was built from.
+    """
+    return predict_timeaware(_model_dict, list(last_vals), origin, steps=steps, state=_state)
+
+# chart specs memoized by their inputs (the forecast / readings they show)
+gauge_chart = st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)(charts.gauge_spec)
+forecast_chart = st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)(charts.forecast_spec)
+bar_chart = st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)(charts.bar_spec)
+series_chart = st.cache_data(max_entries=CHART_CACHE_ENTRIES, show_spinner=False)(charts.series_spec)
+
 def aqi_category_color(aqi):
     aqi = float(aqi)
     if aqi <= 50: return "Good", "#16a34a"
@@ -81,46 +153,10 @@ def aqi_category_color(aqi):
     if aqi <= 400: return "Very Unhealthy", "#9f1239"
     return "Hazardous", "#7c2d12"
 
-def make_time_feats(ts):
-    hr = ts.hour
-    sin_h = np.sin(2*np.pi*hr/24.0)
-    cos_h = np.cos(2*np.pi*hr/24.0)
-    dow = ts.weekday()
-    dow_cols = {f"dow_{i}": 1 if i==dow else 0 for i in range(7)}
-    base = {"sin_hour":sin_h, "cos_hour":cos_h}
-    base.update(dow_cols)
-    return base
-
-def predict_timeaware(model_dict, last_vals, base_time, steps=3):
-    model = model_dict["model"]
-    features = model_dict["features"]
-    lags = model_dict.get("lags", len([f for f in features if f.startswith("aqi_lag_")]))
-    vals = list(last_vals)
-    results = []
-    for h in range(1, steps+1):
-        fut = pd.to_datetime(base_time) + timedelta(hours=h)
-        tf = make_time_feats(fut)
-        feat = {}
-        for i in range(1, lags+1):
-            feat[f"aqi_lag_{i}"] = vals[-lags + (i-1)]
-        feat.update(tf)
-        Xrow = np.array([feat.get(f, 0.0) for f in features]).reshape(1, -1)
-        p = float(model.predict(Xrow)[0])
-        results.append((fut, p))
-        vals.append(p)
-    return results
-
-def predict_simple(model_dict, last_vals, base_time, steps=3):
-    model = model_dict["model"]
-    lags = model_dict.get("lags", len(last_vals))
-    vals = list(last_vals)
-    results=[]
-    for h in range(1, steps+1):
-        arr = np.array(vals[-lags:]).reshape(1, -1)
-        p = float(model.predict(arr)[0])
-        results.append((pd.to_datetime(base_time) + timedelta(hours=h), p))
-        vals.append(p)
-    return results
+def predict_timeaware(model_dict, last_vals, base_time, steps=3, state=None):
+    engine = engine_for(model_dict)
+    future_times, preds = engine.forecast(last_vals, engine.origin(base_time), steps=steps, state=state)
+    return list(zip(future_times[0], preds[0].tolist()))
 
 def hour_label(ts):
     return pd.to_datetime(ts).strftime("%I %p").lstrip("0").replace(" ","").lower()
@@ -141,33 +177,6 @@ def activity_and_mask_for_category(cat):
     return ("Stay indoors, avoid all outdoor activity", "N95/FFP2 required if you must go out", "☠️")
 
 # --- Google AQI API Helpers ---
-def fetch_google_aqi(lat=28.6139, lon=77.2090):
-    """Fetch live AQI data from Google Air Quality API."""
-    if not GOOGLE_AQI_API_KEY:
-        return None
-
-    url = f"https://airquality.googleapis.com/v1/currentConditions:lookup?key={GOOGLE_AQI_API_KEY}"
-    data = {
-        "location": {
-            "latitude": lat,
-            "longitude": lon
-        },
-        "extraComputations": [
-            "POLLUTANT_ADDITIONAL_INFO",
-            "DOMINANT_POLLUTANT_CONCENTRATION",
-            "POLLUTANT_CONCENTRATION",
-            "LOCAL_AQI"
-        ]
-    }
-    
-    try:
-        response = requests.post(url, json=data)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching Google AQI data: {e}")
-        return None
-
 def process_google_aqi(api_data):
     """Process Google AQI API response."""
     if not api_data:
@@ -209,22 +218,30 @@ def process_google_aqi(api_data):
         return None
 
 # ---------- Load ----------
-df = load_cleaned()
-model_dict = load_model()
+model_dict, model_version = load_model()
+# enough rows that the rolling features match the server's for the same origin
+df = load_cleaned(max(HISTORY_ROWS, engine_for(model_dict).history_rows()))
 
 # determine lags expected
 lags = model_dict.get("lags", len([f for f in model_dict["features"] if f.startswith("aqi_lag_")]))
-st.write(f"Model expects {lags} lag features (using last {lags} AQI readings).")
+engine = engine_for(model_dict)
+st.write(f"Model expects {lags} lag features (using the last {lags} AQI values at a "
+         f"{engine.step / pd.Timedelta(minutes=1):g}-minute step).")
 
 # get last observed AQI values (oldest->newest) for numeric inputs
 if "AQI" not in df.columns:
     st.error("AQI column missing in dataset. Please include computed AQI.")
     st.stop()
 
-last_vals = df["AQI"].dropna().tail(lags).tolist()
-if len(last_vals) < lags:
-    st.error(f"Not enough AQI readings in file (need {lags}).")
+# a joint model's window holds every target it forecasts: (targets, lags)
+window = engine.frame_window(df)
+if not engine.window_ready(window):
+    st.error(f"Not enough readings of {', '.join(engine.targets)} in file (need {lags}).")
     st.stop()
+last_vals = tuple(map(tuple, window.tolist())) if engine.joint else tuple(window.tolist())
+# running rolling-feature state of the shown history (None for models without rolling features)
+state = engine.frame_state(df)
+rolling = tuple(state.features()[0].tolist()) if state is not None else None
 
 # prediction base = current time (IST)
 csv_last_time = pd.to_datetime(df["datetime"].dropna().tail(1).iloc[0])
@@ -235,8 +252,7 @@ if (now - csv_last_time).total_seconds() > 3*3600:
     st.warning("Latest CSV reading is older than 3 hours. Predictions from now may be less accurate.")
 
 # ---------- Live Data Fetch ----------
-live_data = fetch_google_aqi()
-processed_live = process_google_aqi(live_data)
+processed_live = live_reading()
 
 if processed_live:
     current_val = processed_live["val"]
@@ -245,18 +261,17 @@ if processed_live:
     source_label = "Live (Google API)"
 else:
     # Fallback to CSV
-    current_val = last_vals[-1]
+    current_val = df["AQI"].dropna().iloc[-1]
     current_cat, current_color = aqi_category_color(current_val)
     source_label = "Historical (CSV Fallback)"
 
 # ---------- Predictions only ----------
-if ("sin_hour" in model_dict["features"]) or any(f.startswith("dow_") for f in model_dict["features"]):
-    preds = predict_timeaware(model_dict, last_vals, now, steps=PRED_STEPS)
-else:
-    preds = predict_simple(model_dict, last_vals, now, steps=PRED_STEPS)
+# the forecast origin is the start of the current step, so reruns within it share one forecast
+preds = forecast_for(model_version, last_vals, rolling, engine.origin(now), PRED_STEPS, model_dict, state)
 
 future_times = [t for t,_ in preds]
 preds_only = [p for _,p in preds]
+chart_times = tuple(charts.wall_time(pd.Timestamp(t)) for t in future_times)
 
 # Top: Big AQI card + gauge
 col1, col2 = st.columns([2,1])
@@ -274,15 +289,7 @@ with col1:
     worst_cat, worst_color = aqi_category_color(worst_val)
     
     # simple color bar gauge
-    figg, axg = plt.subplots(figsize=(8,0.5))
-    cuts = [(0,50,"#16a34a"),(51,100,"#f59e0b"),(101,200,"#f97316"),(201,300,"#ef4444"),(301,400,"#9f1239"),(401,500,"#7c2d12")]
-    for lo,hi,col in cuts:
-        axg.barh(0, hi-lo, left=lo, height=0.5, color=col, edgecolor='none')
-    axg.plot([current_val],[0], marker='o', color='white', markeredgecolor='black', markersize=8, label='Current')
-    axg.plot([worst_val],[0], marker='v', color='black', markersize=10, label='Worst Predicted')
-    axg.set_xlim(0,500); axg.set_yticks([]); axg.set_xlabel("AQI scale")
-    for spine in axg.spines.values(): spine.set_visible(False)
-    st.pyplot(figg)
+    st.vega_lite_chart(gauge_chart(float(current_val), float(worst_val)), use_container_width=True)
 
 with col2:
     st.markdown("<div style='padding:10px;border-radius:8px;background:#fbfbfc;box-shadow: 0 6px 18px rgba(0,0,0,0.03)'>", unsafe_allow_html=True)
@@ -301,33 +308,12 @@ st.markdown("---")
 # ---------- Predictions plot (ONLY predicted points) ----------
 st.subheader("Predicted AQI (next 3 hours)")
 
-fig, ax = plt.subplots(figsize=(10,3))
-pred_times_pd = [pd.to_datetime(t) for t in future_times]
-ax.plot(pred_times_pd, preds_only, marker='o', linestyle='--', color='#f97316', linewidth=2)
-for x,y in zip(pred_times_pd, preds_only):
-    ax.annotate(f"{int(round(y))}", (x,y), textcoords="offset points", xytext=(0,8), ha='center')
-
-locator = mdates.AutoDateLocator(minticks=3, maxticks=6)
-formatter = mdates.DateFormatter("%I %p")
-ax.xaxis.set_major_locator(locator)
-ax.xaxis.set_major_formatter(formatter)
-
-ax.set_ylim(0, max(500, max(preds_only) + 50))
-ax.set_ylabel("AQI")
-ax.set_xlabel("Time")
-ax.set_title("Next 3-hour AQI predictions")
-ax.grid(alpha=0.25)
-fig.autofmt_xdate(rotation=15)
-st.pyplot(fig)
+st.vega_lite_chart(forecast_chart(chart_times, tuple(preds_only), "Next 3-hour AQI predictions"),
+                   use_container_width=True)
 
 # ---------- Bar chart for clarity ----------
-fig2, ax2 = plt.subplots(figsize=(6,3))
-labels = [hour_label(t) for t in future_times]
-ax2.bar(labels, preds_only, color='#3b82f6', width=0.5)
-ax2.set_ylabel("Predicted AQI")
-ax2.set_title("Predicted AQI for next 3 hours")
-ax2.grid(axis='y', alpha=0.2)
-st.pyplot(fig2)
+labels = tuple(hour_label(t) for t in future_times)
+st.vega_lite_chart(bar_chart(labels, tuple(preds_only), "Predicted AQI for next 3 hours", "Predicted AQI"))
 
 st.markdown("---")
 
@@ -382,33 +368,33 @@ else:
 st.markdown("---")
 
 # ---------- Optional: pollutant mini charts ----------
-st.subheader("Pollutant snapshots (recent)")
+st.subheader("Pollutant snapshots")
+span_label = st.selectbox("Range", list(CHART_RANGES), index=0)
+span = CHART_RANGES[span_label]
+shown = tuple(c for c in ("pm25", "pm10") if c in df.columns)
+ranged, tz = history_range(str(cleaned_path()), span, shown)
+# hours for ranges within a day, dates beyond
+time_format = "%I %p" if span is not None and span <= pd.Timedelta(days=1) else "%d %b"
+
+def pollutant_chart(col, color):
+    series = ranged["series"][col]
+    times = pd.to_datetime(series["t"], unit="ms", utc=True).tz_convert(tz)
+    return series_chart(tuple(charts.wall_time(t) for t in times), tuple(series["v"].tolist()), "µg/m³", color,
+                        time_format)
+
 pcols = st.columns(3)
-recent = df.tail(24)
 
 with pcols[0]:
-    st.markdown("**PM2.5 (recent)**")
-    if "pm25" in recent.columns:
-        figp, axp = plt.subplots(figsize=(3.5,1.8))
-        axp.plot(recent["datetime"], recent["pm25"], marker='o', linewidth=1)
-        axp.xaxis.set_major_formatter(mdates.DateFormatter("%I %p"))
-        axp.set_ylabel("µg/m³")
-        axp.grid(alpha=0.2)
-        figp.autofmt_xdate(rotation=20)
-        st.pyplot(figp)
+    st.markdown(f"**PM2.5 ({span_label.lower()})**")
+    if "pm25" in shown:
+        st.vega_lite_chart(pollutant_chart("pm25", "#3b82f6"), use_container_width=True)
     else:
         st.info("pm25 not in dataset")
 
 with pcols[1]:
-    st.markdown("**PM10 (recent)**")
-    if "pm10" in recent.columns:
-        figp2, axp2 = plt.subplots(figsize=(3.5,1.8))
-        axp2.plot(recent["datetime"], recent["pm10"], marker='o', linewidth=1, color='#f59e0b')
-        axp2.xaxis.set_major_formatter(mdates.DateFormatter("%I %p"))
-        axp2.set_ylabel("µg/m³")
-        axp2.grid(alpha=0.2)
-        figp2.autofmt_xdate(rotation=20)
-        st.pyplot(figp2)
+    st.markdown(f"**PM10 ({span_label.lower()})**")
+    if "pm10" in shown:
+        st.vega_lite_chart(pollutant_chart("pm10", "#f59e0b"), use_container_width=True)
     else:
         st.info("pm10 not in dataset")
 
@@ -419,10 +405,8 @@ with pcols[2]:
         latest = df.tail(1)
         subs = {c.replace("_sub",""): float(latest[c].values[0]) if not pd.isna(latest[c].values[0]) else 0.0 for c in sub_cols}
         items = dict(sorted(subs.items(), key=lambda x: x[1], reverse=True)[:5])
-        figp3, axp3 = plt.subplots(figsize=(3.5,1.8))
-        axp3.bar(items.keys(), items.values(), color=['#16a34a','#f59e0b','#f97316','#ef4444','#9f1239'][:len(items)])
-        axp3.grid(axis='y', alpha=0.2)
-        st.pyplot(figp3)
+        st.vega_lite_chart(bar_chart(tuple(items), tuple(items.values()), None, None, charts.CONTRIBUTOR_COLORS),
+                           use_container_width=True)
     else:
         st.info("No pollutant sub-index columns available")
 
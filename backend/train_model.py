@@ -2,64 +2,318 @@
 """
 Train an AQI model (time-aware).
 Input: cleaned_aqi_dataset.csv (must contain datetimeLocal and AQI).
-Output: aq_model_aqi_time.joblib (dict with model, features, lags)
+Output: aq_model_aqi_time.joblib (dict with model, features, lags, mode)
+        aq_model_aqi_time.forest (same model as flat arrays, used by server.py)
+
+Modes:
+  recursive (default)  one-step-ahead model, fed its own predictions as lags
+  direct               one multi-output model predicting steps 1..H at once
+
+Targets (--targets, recursive mode): by default one joint multi-output
+forest over AQI and every pollutant and weather column in TARGETS that
+the history records. Its inputs are the lags of all targets, so each
+forecast step is one predict call returning every metric, fed back as
+the next step's lags. Targets are fitted divided by their training
+standard deviation (target_scale in the artifact) so the split criterion
+weighs them equally. --targets AQI trains the AQI-only model.
+
+Retraining:
+  (default)       full refit on all training rows
+  --incremental   warm start: grow the saved forest by --grow trees fitted on
+                  rows newer than its trained_until (plus --warm-window recent
+                  rows), dropping the oldest trees beyond --max-trees
+  --window N      sliding-window refit on the newest N training rows
+Readings are first aggregated to the model's time step (--cadence-minutes,
+default AQI_CADENCE = 60; 0 keeps the raw rows), which the artifact
+records so the server forecasts in the same steps. The aggregated series
+and the feature frames are cached in .feature_cache/ keyed by the data
+they cover, so a run over appended history only aggregates and
+featurizes the new rows. The rolling AQI features (rolling.py) of those
+rows continue the cached RollingState instead of re-running pandas over
+the whole series.
 """
+import argparse
+import hashlib
 import pandas as pd
 import numpy as np
 import joblib
 import os
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error
+from compact_forest import save_compact
+from columnar_history import load_history_frame
+from features import (FEATURES_VERSION, LAGS, TIME_COLUMNS, FeatureBuilder, feature_names, lag_columns,
+                      lag_matrix, time_matrix, time_parts)
+from resample import CADENCE, RAW_CADENCE, aggregate, cadence_minutes, merge, to_grid
+from rolling import ROLLING_COLUMNS, RollingState, batch_features
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "cleaned_aqi_dataset.csv")
-LAGS = 6
-
-def add_time_features(time_series):
-    hour = time_series.dt.hour
-    dow = time_series.dt.weekday
-    sin_hour = np.sin(2 * np.pi * hour / 24.0)
-    cos_hour = np.cos(2 * np.pi * hour / 24.0)
-    return pd.DataFrame({
-        "sin_hour": sin_hour,
-        "cos_hour": cos_hour,
-        "dow": dow
-    })
-
-def prepare_df(path=DATA_PATH):
-    df = pd.read_csv(path, parse_dates=["datetimeLocal"])
-    df = df.rename(columns={"datetimeLocal":"datetime"})
-    df = df.sort_values("datetime").reset_index(drop=True)
-    # ensure AQI present
+MODEL_PATH = os.path.join(BASE_DIR, "aq_model_aqi_time.joblib")
+FOREST_PATH = os.path.join(BASE_DIR, "aq_model_aqi_time.forest")
+FEATURE_CACHE_DIR = os.path.join(BASE_DIR, ".feature_cache")
+HORIZONS = 6
+# joint model outputs: AQI plus the per-hour pollutant and weather readings /api/aqi shows
+TARGETS = ["AQI", "pm25", "pm10", "no2", "so2", "o3", "co", "temperature", "relativehumidity", "wind_speed"]
+N_TREES = 200
+GROW_TREES = 20
+WARM_WINDOW = 2000
+
+def load_series(path=DATA_PATH, targets=("AQI",)):
+    """datetime plus the targets the history records (AQI required), rows with an AQI reading."""
+    # only the needed columns are read; Parquet history is used when converted
+    try:
+        df = load_history_frame(path, columns=list(targets))
+    except ValueError:
+        df = load_history_frame(path)
     if "AQI" not in df.columns:
         raise ValueError("AQI column not found in cleaned file.")
-    df["AQI"] = pd.to_numeric(df["AQI"], errors="coerce")
-    df = df.dropna(subset=["AQI"]).reset_index(drop=True)
+    df = df.rename(columns={"datetimeLocal":"datetime"})
+    df = df[["datetime"] + [t for t in targets if t in df.columns]]
+    df = df.sort_values("datetime").reset_index(drop=True)
+    for c in df.columns[1:]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df.dropna(subset=["AQI"]).reset_index(drop=True)
 
-    # create lagged AQI
-    for i in range(1, LAGS+1):
-        df[f"aqi_lag_{i}"] = df["AQI"].shift(i)
+def load_aqi_series(path=DATA_PATH):
+    return load_series(path, ("AQI",))
 
-    # target = next hour AQI, and target_time for time features
+def series_targets(df):
+    """Target columns of a load_series() / resample_series() frame."""
+    return [c for c in df.columns if c != "datetime"]
+
+def build_features(df, horizons=1, state=None):
+    """
+    Lag, rolling, target and time features (features.py layout) for every
+    origin with full lags and targets. Every column besides datetime is a
+    target: it gets a lag block and, for a joint model, next_<column> (its
+    value one step on). state: RollingState of the AQI rows before df when
+    df is the tail of a longer series (not modified); the rolling features
+    are then continued from it instead of computed with pandas.
+    """
+    df = df.copy()
+    targets = series_targets(df)
+    # lag window ends at the origin: aqi_lag_1 is the newest reading, one step before the target
+    for t in targets:
+        lags = lag_matrix(df[t].to_numpy(), LAGS)
+        for j, c in enumerate(lag_columns(LAGS, t)):
+            df[c] = lags[:, j]
+    aqi = df["AQI"].to_numpy(dtype=np.float64)
+    rolling = batch_features(aqi) if state is None else state.copy().run(aqi)[:, 0]
+    for j, c in enumerate(ROLLING_COLUMNS):
+        df[c] = rolling[:, j]
+
+    # target = AQI one step (one cadence bucket) ahead, and target_time for time features
     df["target"] = df["AQI"].shift(-1)
     df["target_time"] = df["datetime"].shift(-1)
+    if len(targets) > 1:
+        for t in targets:
+            df[f"next_{t}"] = df[t].shift(-1)
+    # direct mode: target_h = AQI h steps ahead (target_1 == target)
+    if horizons > 1:
+        for h in range(1, horizons+1):
+            df[f"target_{h}"] = df["AQI"].shift(-h)
 
     df = df.dropna().reset_index(drop=True)
 
-    # time features for target time
-    tf = add_time_features(df["target_time"])
-    df = pd.concat([df, tf], axis=1)
+    # time features for target time: sin/cos hour and dow_0 ... dow_6
+    hours, dows = time_parts(df["target_time"])
+    tf = pd.DataFrame(time_matrix(hours, dows), columns=TIME_COLUMNS, index=df.index)
+    return pd.concat([df, tf], axis=1)
+
+def _cache_name(path, cadence, targets=("AQI",)):
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = f"{name}_c{cadence_minutes(cadence) or 'raw'}"
+    if list(targets) != ["AQI"]:
+        name += "_t" + hashlib.sha1(",".join(targets).encode()).hexdigest()[:8]
+    return name
+
+def _feature_cache_path(path, horizons, cadence=None, targets=("AQI",)):
+    return os.path.join(FEATURE_CACHE_DIR,
+                        f"{_cache_name(path, cadence, targets)}_l{LAGS}_h{horizons}_v{FEATURES_VERSION}.joblib")
+
+def _load_cache(cache_path):
+    if os.path.exists(cache_path):
+        try:
+            return joblib.load(cache_path)
+        except Exception as e:
+            print(f"Ignoring unreadable cache {cache_path}: {e}")
+    return None
+
+def _save_cache(entry, cache_path):
+    os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    joblib.dump(entry, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+def _target_values(raw):
+    """(n,) AQI values, or (n, targets) for a multi-target series."""
+    targets = series_targets(raw)
+    return raw["AQI"].to_numpy(dtype=np.float64) if targets == ["AQI"] else raw[targets].to_numpy(dtype=np.float64)
+
+def _series_digest(raw, rows):
+    times = pd.to_datetime(raw["datetime"].iloc[:rows], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    h = hashlib.sha1(times.tobytes())
+    h.update(np.ascontiguousarray(_target_values(raw)[:rows]).tobytes())
+    return h.hexdigest()
 
-    # one-hot day-of-week (dow_0 ... dow_6)
-    dow_dummies = pd.get_dummies(df["dow"], prefix="dow")
-    df = pd.concat([df, dow_dummies], axis=1)
+def cached_resample(raw, path=DATA_PATH, cadence=CADENCE):
+    """
+    Raw readings aggregated to `cadence` (complete buckets only), reusing the
+    cached per-bucket sums when raw extends the readings they came from.
+    """
+    targets = series_targets(raw)
+    cache_path = os.path.join(FEATURE_CACHE_DIR, f"{_cache_name(path, cadence, targets)}_resampled.joblib")
+    entry = _load_cache(cache_path)
+    n = len(raw)
+    rows = entry["rows"] if entry else 0
+    times = pd.DatetimeIndex(raw["datetime"])
+    values = _target_values(raw)
+    reused = bool(entry) and 0 < rows <= n and _series_digest(raw, rows) == entry["digest"]
+    if reused:
+        aggregated = merge(entry["aggregated"], aggregate(times[rows:], values[rows:], cadence))
+        print(f"Resample cache: reused {rows} readings, aggregated {n - rows} new")
+    else:
+        aggregated = aggregate(times, values, cadence)
+    if not reused or rows != n:
+        _save_cache({"rows": n, "digest": _series_digest(raw, n), "aggregated": aggregated}, cache_path)
+    return to_grid(aggregated, cadence, complete_only=True, columns=targets)
 
+def resample_series(raw, path=DATA_PATH, cadence=CADENCE, cache=False):
+    """The (datetime, *targets) series the model is trained on: raw readings at `cadence`."""
+    if cadence is None:
+        return raw
+    if cache and len(raw):
+        return cached_resample(raw, path, cadence)
+    return to_grid(aggregate(pd.DatetimeIndex(raw["datetime"]), _target_values(raw), cadence),
+                   cadence, complete_only=True, columns=series_targets(raw))
+
+def cached_features(raw, path=DATA_PATH, horizons=1, cadence=None):
+    """
+    build_features(raw) reusing the cached frame when raw extends the series it
+    was built from (same first row, same row at the cached end); only origins
+    whose lags or targets reach the new rows are featurized. The entry keeps
+    the RollingState at the first row the next run re-featurizes, so the
+    rolling features of new rows cost O(new rows) and equal a full rebuild's.
+    """
+    cache_path = _feature_cache_path(path, horizons, cadence, series_targets(raw))
+    entry = _load_cache(cache_path)
+
+    n = len(raw)
+    rows = entry["rows"] if entry else 0
+    aqi = raw["AQI"].to_numpy(dtype=np.float64)
+    if entry and 0 < rows <= n and _series_digest(raw, rows) == entry["digest"]:
+        cached = entry["frame"]
+        if rows == n:
+            return cached
+        # the first origin not in the cache needs LAGS rows of history before it
+        start = max(0, rows - horizons - LAGS)
+        state = entry["state"]
+        new = build_features(raw.iloc[start:], horizons, state)
+        if len(cached):
+            new = new[new["datetime"] > cached["datetime"].iloc[-1]]
+        df = pd.concat([cached, new], ignore_index=True)
+        print(f"Feature cache: reused {len(cached)} origins, featurized {len(new)} new")
+    else:
+        start, state = 0, RollingState()
+        df = build_features(raw, horizons)
+        print(f"Feature cache: built {len(df)} origins")
+
+    state = state.copy().advance(aqi[start:max(start, n - horizons - LAGS)])
+    _save_cache({"rows": n, "start": raw["datetime"].iloc[0], "end": raw["datetime"].iloc[-1],
+                 "digest": _series_digest(raw, n), "frame": df, "state": state}, cache_path)
     return df
 
-def main():
-    df = prepare_df()
+def prepare_df(path=DATA_PATH, horizons=1, cache=False, cadence=CADENCE, targets=("AQI",)):
+    series = resample_series(load_series(path, targets), path, cadence, cache)
+    if cache and len(series):
+        return cached_features(series, path, horizons, cadence)
+    return build_features(series, horizons)
+
+def save_artifact(out, path=MODEL_PATH):
+    # write to a temp file and rename so a running server never sees a partial artifact
+    tmp_path = f"{path}.tmp"
+    joblib.dump(out, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_artifact(path=MODEL_PATH):
+    return joblib.load(path) if os.path.exists(path) else None
+
+def recursive_rollout(model, X, horizons, times, step, states=None):
+    """
+    Feed one-step predictions back as lags, the way serving does. X rows are
+    forecast origins at `times` on a grid of `step`; states: RollingState of
+    the first len(X) - horizons + 1 of them, advanced with the predictions
+    for the rolling features.
+    """
+    X = X.reset_index(drop=True)
+    rolling = [c for c in ROLLING_COLUMNS if c in X.columns]
+    time_cols = [c for c in X.columns if not c.startswith("aqi_lag_") and c not in rolling]
+    time_builder = FeatureBuilder(time_cols)
+    n = len(X) - (horizons - 1)
+    origins = pd.DatetimeIndex(times)[:n]
+    cur = X.iloc[:n].copy()
+    out = np.empty((n, horizons))
+    for h in range(horizons):
+        out[:, h] = model.predict(cur)
+        if h + 1 < horizons:
+            for i in range(LAGS, 1, -1):
+                cur[f"aqi_lag_{i}"] = cur[f"aqi_lag_{i-1}"].to_numpy()
+            cur["aqi_lag_1"] = out[:, h]
+            if rolling and states is not None:
+                cur[rolling] = states.update(out[:, h]).features()[:, [ROLLING_COLUMNS.index(c) for c in rolling]]
+            # time features of the next target time, origin + (h + 2) steps, as serving computes them:
+            # the next row is a later time when the series has a gap there
+            cur[time_cols] = time_builder.build_at(np.empty((n, 0)), origins + (h + 2) * step)
+    return out
+
+def train_forest(X, y):
+    model = RandomForestRegressor(n_estimators=N_TREES, random_state=0, n_jobs=-1)
+    model.fit(X, y)
+    return model
+
+def grow_forest(model, X, y, grow=GROW_TREES, max_trees=N_TREES):
+    """Add `grow` trees fitted on (X, y) to a fitted forest, keeping the newest max_trees."""
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + grow)
+    model.fit(X, y)
+    if max_trees and len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+        model.set_params(n_estimators=max_trees)
+    model.set_params(warm_start=False)
+    return model
+
+def incremental_fit(previous, X_train, targets, datetimes, grow, max_trees, warm_window):
+    """Warm-start previous["model"] on rows newer than it. Returns (model or None, new rows)."""
+    trained_until = previous.get("trained_until")
+    if trained_until is None or not hasattr(previous["model"], "estimators_"):
+        return None, 0
+    new = np.flatnonzero(datetimes > pd.Timestamp(trained_until))
+    if len(new) == 0:
+        return previous["model"], 0
+    # new trees see the new rows plus some recent history, not just a handful of rows
+    start = max(0, min(new[0], len(X_train) - warm_window))
+    print(f"Growing forest by {grow} trees on {len(X_train) - start} rows ({len(new)} new)...")
+    return grow_forest(previous["model"], X_train.iloc[start:], targets.iloc[start:], grow, max_trees), len(new)
+
+def target_scale(Y):
+    """Per-target standard deviation of the training targets (1 where constant)."""
+    scale = Y.std(axis=0)
+    return np.where(scale > 0, scale, 1.0)
+
+def main(mode="recursive", horizons=HORIZONS, incremental=False, window=None, grow=GROW_TREES,
+         max_trees=N_TREES, warm_window=WARM_WINDOW, cache=True, cadence=CADENCE, targets=TARGETS):
+    # AQI is always the first target
+    targets = ["AQI"] + [t for t in targets if t != "AQI"]
+    if mode == "direct" and targets != ["AQI"]:
+        print("Direct mode forecasts AQI only; training on AQI.")
+        targets = ["AQI"]
+    df = prepare_df(DATA_PATH, horizons=horizons if mode == "direct" else 1, cache=cache, cadence=cadence,
+                    targets=targets)
+    # the requested targets this history records
+    targets = [t for t in targets if t in df.columns]
+    joint = len(targets) > 1
     # feature list order (important)
-    features = [f"aqi_lag_{i}" for i in range(1, LAGS+1)] + ["sin_hour", "cos_hour"] + [c for c in df.columns if c.startswith("dow_")]
+    features = feature_names(LAGS, targets)
     X = df[features]
     y = df["target"]
 
@@ -67,19 +321,131 @@ def main():
     split = int(len(X) * 0.8)
     X_train, X_test = X.iloc[:split], X.iloc[split:]
     y_train, y_test = y.iloc[:split], y.iloc[split:]
+    train_times = df["datetime"].iloc[:split]
+    target_cols = [f"target_{h}" for h in range(1, horizons+1)]
+    Y = df[[f"next_{t}" for t in targets]] if joint else None
+    y_fit = df[target_cols].iloc[:split] if mode == "direct" else Y.iloc[:split] if joint else y_train
+
+    previous = load_artifact(MODEL_PATH) if incremental else None
+    if previous is not None and (previous.get("features") != features or previous.get("mode", "recursive") != mode
+                                 or previous.get("cadence_minutes") != cadence_minutes(cadence)
+                                 or previous.get("targets", ["AQI"]) != (targets if joint else ["AQI"])
+                                 or (mode == "direct" and previous.get("horizons") != horizons)):
+        print("Saved model has different features, mode, cadence or targets; doing a full retrain.")
+        previous = None
+    elif incremental and previous is None:
+        print("No saved model to extend; doing a full retrain.")
 
-    model = RandomForestRegressor(n_estimators=200, random_state=0, n_jobs=-1)
-    print("Training RandomForestRegressor on AQI...")
-    model.fit(X_train, y_train)
+    # joint targets are fitted in units of their spread; grown trees keep the saved scale
+    scale = None
+    if joint:
+        scale = (np.asarray(previous["target_scale"]) if previous is not None
+                 else target_scale(y_fit.to_numpy(dtype=np.float64)))
+        y_fit = y_fit / scale
 
-    preds = model.predict(X_test)
-    mae = mean_absolute_error(y_test, preds)
-    print(f"Test MAE: {mae:.3f}")
+    fitted = None
+    if previous is not None:
+        method = "warm_start"
+        fitted, n_new = incremental_fit(previous, X_train, y_fit, train_times.to_numpy(),
+                                        grow, max_trees, warm_window)
+        if fitted is not None and n_new == 0:
+            print("No training rows newer than the saved model; nothing to do.")
+            return previous, None
+    if fitted is None:
+        method = "window" if window else "full"
+        start = max(0, split - window) if window else 0
+        X_train, y_train, y_fit = X_train.iloc[start:], y_train.iloc[start:], y_fit.iloc[start:]
+
+    if mode == "recursive" and joint:
+        if fitted is None:
+            print(f"Training joint multi-output RandomForestRegressor on {', '.join(targets)}...")
+            fitted = train_forest(X_train, y_fit)
+        preds = fitted.predict(X_test) * scale
+        Y_test = Y.iloc[split:].to_numpy()
+        print(f"{'target':>17} {'test MAE':>10}")
+        for j, t in enumerate(targets):
+            print(f"{t:>17} {mean_absolute_error(Y_test[:, j], preds[:, j]):>10.3f}")
+        mae = mean_absolute_error(y_test, preds[:, targets.index("AQI")])
+        print(f"Test MAE: {mae:.3f}")
+        out = {"model": fitted, "features": features, "lags": LAGS, "mode": "recursive",
+               "targets": targets, "target_scale": scale.tolist()}
+    elif mode == "recursive":
+        if fitted is None:
+            print("Training RandomForestRegressor on AQI...")
+            fitted = train_forest(X_train, y_train)
+        preds = fitted.predict(X_test)
+        mae = mean_absolute_error(y_test, preds)
+        print(f"Test MAE: {mae:.3f}")
+        out = {"model": fitted, "features": features, "lags": LAGS, "mode": "recursive"}
+    else:
+        # compare on origins that have all H future values
+        n_eval = max(0, len(X_test) - (horizons - 1))
+        Y_test = df[target_cols].iloc[split:split+n_eval].to_numpy()
+        rec_preds = None
+        if fitted is None and n_eval:
+            print("Training RandomForestRegressor on AQI...")
+            model = train_forest(X_train, y_train)
+            print(f"Test MAE: {mean_absolute_error(y_test, model.predict(X_test)):.3f}")
+            # the rollout's rolling features continue each origin's state with its predictions
+            series = resample_series(load_series(DATA_PATH, targets), DATA_PATH, cadence, cache)
+            rows = pd.Index(series["datetime"]).get_indexer(df["datetime"].iloc[split:split + n_eval])
+            rec_preds = recursive_rollout(model, X_test, horizons, df["datetime"].iloc[split:], cadence or RAW_CADENCE,
+                                          RollingState.at_rows(series["AQI"].to_numpy(), rows))
+        if fitted is None:
+            print(f"Training direct multi-output RandomForestRegressor for {horizons} horizons...")
+            fitted = train_forest(X_train, y_fit)
+        if n_eval:
+            direct_preds = fitted.predict(X_test.iloc[:n_eval])
+            print(f"{'horizon':>8} {'direct MAE':>12} {'recursive MAE':>14}")
+            for h in range(horizons):
+                rec = f"{mean_absolute_error(Y_test[:, h], rec_preds[:, h]):>14.3f}" if rec_preds is not None else f"{'-':>14}"
+                print(f"{h+1:>8} {mean_absolute_error(Y_test[:, h], direct_preds[:, h]):>12.3f} {rec}")
+            mae = mean_absolute_error(Y_test[:, 0], direct_preds[:, 0])
+        else:
+            print(f"Test split has {len(X_test)} origins, fewer than the {horizons} horizons; "
+                  "skipping the evaluation.")
+            mae = None
+        out = {"model": fitted, "features": features, "lags": LAGS, "mode": "direct", "horizons": horizons}
+
+    # artifact lineage: the server hot-swaps on file change, these record what it swapped to
+    out.update({"version": (previous.get("version", 0) if previous else load_version(MODEL_PATH)) + 1,
+                "method": method, "trained_rows": len(X_train), "cadence_minutes": cadence_minutes(cadence),
+                "trained_until": str(train_times.iloc[-1]) if split else None})
 
     # Save model and metadata
-    out = {"model": model, "features": features, "lags": LAGS}
-    joblib.dump(out, "aq_model_aqi_time.joblib")
-    print("Saved model to aq_model_aqi_time.joblib")
+    save_artifact(out, MODEL_PATH)
+    save_compact(out, FOREST_PATH)
+    print(f"Saved {out['mode']} model v{out['version']} ({method}, {len(fitted.estimators_)} trees) "
+          f"to {MODEL_PATH} and {FOREST_PATH}")
+    return out, mae
+
+def load_version(path=MODEL_PATH):
+    try:
+        return load_artifact(path).get("version", 0)
+    except Exception:
+        return 0
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the time-aware AQI model.")
+    parser.add_argument("--mode", choices=["recursive", "direct"], default="recursive",
+                        help="recursive one-step model or direct multi-horizon model")
+    parser.add_argument("--horizons", type=int, default=HORIZONS,
+                        help="forecast steps covered by the direct model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="warm-start the saved model on rows newer than it instead of refitting")
+    parser.add_argument("--window", type=int, default=None,
+                        help="refit on only the newest N training rows")
+    parser.add_argument("--grow", type=int, default=GROW_TREES, help="trees added per incremental run")
+    parser.add_argument("--max-trees", type=int, default=N_TREES, help="forest size cap for incremental runs")
+    parser.add_argument("--warm-window", type=int, default=WARM_WINDOW,
+                        help="recent rows the new trees are fitted on, besides the new ones")
+    parser.add_argument("--no-cache", action="store_true", help="featurize from scratch, skip .feature_cache/")
+    parser.add_argument("--cadence-minutes", type=int, default=cadence_minutes(CADENCE),
+                        help="model time step the readings are aggregated to (0 = raw rows)")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help="comma-separated columns the model forecasts (AQI first; 'AQI' = AQI-only model)")
+    args = parser.parse_args()
+    main(mode=args.mode, horizons=args.horizons, incremental=args.incremental, window=args.window,
+         grow=args.grow, max_trees=args.max_trees, warm_window=args.warm_window, cache=not args.no_cache,
+         cadence=pd.Timedelta(minutes=args.cadence_minutes) if args.cadence_minutes else None,
+         targets=[t.strip() for t in args.targets.split(",") if t.strip()])
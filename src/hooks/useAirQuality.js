@@ -1,20 +1,53 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
+
+// Compact schema with only the fields the components render (no forecast ranges)
+const FIELDS = [
+    'current', 'trend', 'confidence', 'advice', 'pollutants',
+    'forecast.time', 'forecast.val', 'forecast.label', 'forecast.color',
+    'forecast.current', 'forecast.pollutants', 'forecast.advice',
+].join(',');
+const AQI_URL = `http://localhost:5001/api/aqi?schema=2&fields=${FIELDS}`;
+
+// Schema 2 -> the payload shape the components expect: pollutant values are
+// matched with the shared legend and advice indexes with the advice table
+const expandCompact = (c) => {
+    const reading = ({ pollutants, advice, ...rest }) => ({
+        ...rest,
+        metrics: { pollutants: pollutants.map((val, i) => ({ ...c.pollutants[i], val })) },
+        advice: c.advice[advice],
+    });
+    const current = reading(c.current);
+    return {
+        current,
+        forecast: c.forecast.map(reading),
+        confidence: c.confidence,
+        metrics: { trend: c.trend, pollutants: current.metrics.pollutants },
+        advice: current.advice,
+    };
+};
 
 export const useAirQuality = () => {
     const [data, setData] = useState(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
+    // ETag of the last payload; the backend answers 304 while its snapshot is unchanged
+    const etagRef = useRef(null);
 
     const fetchData = async () => {
         setLoading(true);
         setError(null);
         try {
-            const response = await fetch('http://localhost:5001/api/aqi');
+            const headers = etagRef.current ? { 'If-None-Match': etagRef.current } : {};
+            const response = await fetch(AQI_URL, { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return;
+            }
             if (!response.ok) {
                 throw new Error('Failed to fetch data');
             }
             const result = await response.json();
-            setData(result);
+            etagRef.current = response.headers.get('ETag');
+            setData(expandCompact(result));
         } catch (err) {
             console.error("Error fetching AQI data:", err);
             setError(err.message);